@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Tuple, Union
+
+def create_temp_file(path: str) -> Tuple[int, str]:
+    """Exclusively create a hidden temp file beside path, with the mode a plain open() would give it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    while True:
+        temp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex[:12]}.tmp")
+        try:
+            # Unlike mkstemp's 0600, 0666 lets the process umask decide the final permissions
+            return os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def atomic_write(path: str, data: Union[str, bytes], encoding: str = "utf-8") -> str:
+    """Write a file via temp-file-plus-rename so readers never see a partial artifact"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    payload = data.encode(encoding) if isinstance(data, str) else data
+
+    # The temp file must live in the same directory so os.replace stays a same-filesystem rename
+    fd, temp_path = create_temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+async def write_artifact(path: str, data: Union[str, bytes], encoding: str = "utf-8") -> str:
+    """Atomically write an artifact on a worker thread so the event loop is not blocked"""
+    return await asyncio.to_thread(atomic_write, path, data, encoding)
+
+async def write_json_artifact(path: str, obj: Any, indent: int = 2) -> str:
+    """Serialize and atomically write a JSON artifact off the event loop"""
+    return await write_artifact(path, json.dumps(obj, indent=indent, default=str))
+
+async def read_artifact(path: str) -> bytes:
+    """Read a whole artifact into memory off the event loop"""
+    def _read() -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+    return await asyncio.to_thread(_read)
+
+async def remove_artifact(path: str) -> bool:
+    """Remove a file off the event loop, ignoring files that are already gone"""
+    def _remove() -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+    return await asyncio.to_thread(_remove)
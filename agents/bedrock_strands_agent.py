@@ -1,30 +1,118 @@
 #!/usr/bin/env python3
 import asyncio
 import json
+import re
 import os
+import time
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from typing import Dict, Any
 import sys
 sys.path.append('..')
 
 from config.aws_config import AWSConfig
 from agents.docker_mcp_sdk_client import DockerMCPSDKClient
+from agents.mcp_dispatcher import MCPDispatcher
+from agents.operation_router import OperationRouter
+from agents.result_store import ResultStore
+from agents.code_patch import apply_unified_diff, extract_patch, PatchError
+from agents.request_control import AdmissionQueue, Deadline, DeadlineExceeded, OverloadedError, SingleFlight
+from config.bedrock_throttling import BedrockThrottledError
+from agents.model_router import ModelRouter
+from agents.render_formats import has_diagram_call
+from agents.storage import get_storage
+from agents.diagram_cache import DiagramCache
+from agents.artifact_writer import write_artifact
+from agents.graph_ir import GRAPH_IR_SYSTEM_PROMPT, GraphIRError, graph_ir_to_code, graph_ir_to_parsed, parse_graph_ir
+from agents.search_index import DiagramIndex
+from agents import profiling
+from agents.profiling import Profiler
+from agents.thumbnails import ThumbnailCache
+from agents.layout_tuning import graph_attrs_for, layout_entry, layout_options_from_env, topology_key, validate_layout_options, with_layout
+
+# Python exceptions raised by the generated program itself; other render failures are infrastructure problems
+CODE_ERROR_PATTERN = re.compile(r'\b(NameError|ImportError|ModuleNotFoundError|AttributeError|TypeError|SyntaxError|IndentationError|ValueError|KeyError)\b')
 
 class BedrockStrandsAgent:
     """Bedrock Strands Agent with MCP server integration"""
     
-    def __init__(self, aws_profile: str = "default"):
+    def __init__(self, aws_profile: str = "default", request_timeout: float = 180.0,
+                 max_concurrent_requests: int = 4, max_pending_requests: int = 16, mcp_pool_size: int = 0,
+                 use_cache: bool = True, similar_examples: int = 3, similar_reuse_threshold: float = 0.9, layout: Dict[str, Any] = None):
+        # Bedrock and MCP clients are built on first use (see the properties below) so the UI can render first
         self.aws_config = AWSConfig(profile_name=aws_profile)
-        self.bedrock = self.aws_config.get_bedrock_client()
-        self.mcp_client = DockerMCPSDKClient()
+        self.operation_router = OperationRouter()
+        self.model_router = ModelRouter()
         self.output_dir = "outputs"
         os.makedirs(f"{self.output_dir}/diagrams", exist_ok=True)
         os.makedirs(f"{self.output_dir}/rekognition", exist_ok=True)
+        self.result_store = ResultStore(os.path.join(self.output_dir, "results.db"))
+        # Searchable prompts, labels and edges of past diagrams; filled as diagrams are generated
+        self.search_index = DiagramIndex(os.path.join(self.output_dir, "search.db"),
+                                         parse=lambda code: self.mcp_client.drawio_converter.parse_clusters_and_services(code))
+        # Small previews for the gallery, so full-size images are only read when opened
+        self.thumbnails = ThumbnailCache(os.path.join(self.output_dir, "thumbnails"))
+        # Every request gets an end-to-end deadline; excess load is queued up to a bound, then shed
+        self.request_timeout = request_timeout
+        self.admission = AdmissionQueue(max_concurrent_requests, max_pending_requests)
+        # Bedrock calls get their own bounded threads, so calls abandoned at a deadline cannot starve file writes and cache reads
+        self.bedrock_executor = ThreadPoolExecutor(max_workers=2 * max_concurrent_requests, thread_name_prefix="bedrock")
+        # Identical requests arriving together share one generation instead of each calling Bedrock
+        self.single_flight = SingleFlight()
+        # cProfile/tracemalloc for requests that ask for it, plus PROFILE_SAMPLE_PERCENT of the rest
+        self.profiler = Profiler(os.path.join(self.output_dir, "profiles"), result_store=self.result_store)
+        # Renders are spread over MCP_DIAGRAM_SERVERS; long-running services keep sessions open (0 = one per render)
+        self.mcp_dispatcher = MCPDispatcher.from_env(pool_size=mcp_pool_size)
+        self.use_cache = use_cache
+        # Past prompts close to a new one: a rewording is served directly, otherwise the top-k become few-shot examples (0 disables)
+        self.similar_examples = similar_examples
+        self.similar_reuse_threshold = similar_reuse_threshold
+        # Graphviz engine/splines/ranksep defaults (GRAPHVIZ_* env), overridable per request
+        self.layout_options = {**layout_options_from_env(), **validate_layout_options(layout)}
+        self._background_tasks = set()
+    
+    @cached_property
+    def bedrock(self):
+        """Throttling-aware Bedrock Runtime client, created on first request"""
+        return self.aws_config.get_bedrock_client()
+    
+    @cached_property
+    def mcp_client(self) -> DockerMCPSDKClient:
+        """MCP diagram client, created on first render; RENDER_BACKEND=sandbox renders in capped local processes instead"""
+        if os.environ.get("RENDER_BACKEND", "mcp") == "sandbox":
+            from agents.render_sandbox import SandboxedRenderClient
+            return SandboxedRenderClient()
+        return DockerMCPSDKClient(dispatcher=self.mcp_dispatcher)
+    
+    @cached_property
+    def cache(self):
+        """Code/render cache on the configured storage backend (STORAGE_BACKEND), shared across replicas on S3"""
+        return DiagramCache(get_storage()) if self.use_cache else None
+    
+    @cached_property
+    def prompt_index(self):
+        """Prompt similarity index, loaded (and caught up with the result store) on first use"""
+        from agents.prompt_index import PromptIndex
+        index = PromptIndex(os.path.join(self.output_dir, "similarity"))
+        try:
+            index.sync(self.result_store)
+        except Exception as e:
+            print(f"Prompt index sync failed: {e}")
+        return index
+    
+    def _in_background(self, func, *args):
+        """Run a blocking call (cache fill, upload) on a worker thread without holding up the response"""
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
         
-    async def analyze_image_with_rekognition(self, image_path: str, user_prompt: str) -> Dict[str, Any]:
-        """Analyze image using Rekognition MCP server with Bedrock enhancement"""
+    def select_rekognition_operation(self, user_prompt: str, expires_at: float = None) -> str:
+        """Pick a Rekognition operation locally, falling back to Bedrock only when unsure; expires_at bounds Bedrock waits and retries"""
+        route = self.operation_router.route(user_prompt)
+        if not route["needs_llm"]:
+            return route["operation"]
         
-        # Use Bedrock to determine best Rekognition operation
         system_prompt = """You are an AWS Rekognition expert. Based on the user's request, determine the best Rekognition operation.
         
 Available operations: detect_labels, detect_text, detect_moderation_labels, recognize_celebrities
@@ -38,39 +126,378 @@ Return only the operation name."""
             "inferenceConfig": {"temperature": 0.1, "maxTokens": 100}
         }
         
+        # A one-word classification never needs the large model
+        response = self.bedrock.converse(modelId=self.model_router.fastest()["model_id"], expires_at=expires_at, **request_body)
+        reply = response['output']['message']['content'][0]['text']
+        # Fall back to the local guess if the model answers with something unexpected
+        operation = self.operation_router.parse_llm_operation(reply) or route["operation"]
+        self.operation_router.remember(user_prompt, operation, 1.0, "llm")
+        return operation
+    
+    async def analyze_image_with_rekognition(self, image_path: str, user_prompt: str, timeout: float = None) -> Dict[str, Any]:
+        """Analyze image using Rekognition MCP server with Bedrock enhancement"""
+        return await self._admitted(lambda deadline: self._analyze_image_with_rekognition(image_path, user_prompt, deadline), timeout,
+                                    label="rekognition")
+    
+    async def _analyze_image_with_rekognition(self, image_path: str, user_prompt: str, deadline: Deadline) -> Dict[str, Any]:
+        started = time.perf_counter()
         try:
-            response = self.bedrock.converse(modelId="us.anthropic.claude-sonnet-4-20250514-v1:0", **request_body)
-            operation = response['output']['message']['content'][0]['text'].strip()
+            operation = await deadline.run_blocking(self.select_rekognition_operation, user_prompt, deadline.expires_at, stage="operation routing",
+                                                    executor=self.bedrock_executor)
             
             # Call Rekognition MCP server directly
-            mcp_result = await self.mcp_client.call_rekognition_server(image_path, operation)
+            mcp_result = await deadline.run(self.mcp_client.call_rekognition_server(image_path, operation), stage="rekognition")
             
-            # Save results
-            result_file = os.path.join(f"{self.output_dir}/rekognition", f"analysis_{operation}.json")
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump({
-                    "user_prompt": user_prompt,
-                    "operation": operation,
-                    "image_path": image_path,
-                    "mcp_result": mcp_result
-                }, f, indent=2)
+            # Record results without blocking on disk I/O
+            run_id = self.result_store.record(
+                "rekognition",
+                name=operation,
+                prompt=user_prompt,
+                success=bool(mcp_result.get("success")),
+                artifacts={"image_path": image_path},
+                timings={"total_ms": round((time.perf_counter() - started) * 1000, 1)},
+                payload={"operation": operation, "mcp_result": mcp_result}
+            )
             
             return {
                 "success": True,
                 "operation": operation,
                 "result": mcp_result,
-                "output_file": result_file
+                "run_id": run_id
             }
             
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e),
+                "timed_out": isinstance(e, DeadlineExceeded),
                 "message": f"Rekognition analysis failed: {e}"
             }
     
-    async def generate_architecture_diagram(self, user_prompt: str, diagram_name: str) -> Dict[str, Any]:
-        """Generate architecture diagram using MCP server with Bedrock"""
+    def clean_diagram_code(self, diagram_code: str) -> str:
+        """Strip markdown fences and formatting noise from a model reply"""
+        # Extract code from markdown
+        if "```python" in diagram_code:
+            diagram_code = diagram_code.split("```python")[1].split("```")[0].strip()
+        elif "```" in diagram_code:
+            diagram_code = diagram_code.split("```")[1].split("```")[0].strip()
+        
+        # Clean up any remaining markdown or formatting issues
+        diagram_code = diagram_code.replace('\r\n', '\n').replace('\r', '\n')
+        # Fix escaped quotes that might cause issues
+        diagram_code = diagram_code.replace('\\"', '"')
+        # Remove any trailing backslashes that might escape quotes
+        lines = diagram_code.split('\n')
+        cleaned_lines = []
+        for line in lines:
+            line = line.rstrip('\\')  # Remove trailing backslashes
+            if line.strip():
+                cleaned_lines.append(line)
+        diagram_code = '\n'.join(cleaned_lines)
+        return diagram_code
+    
+    def repair_diagram_code(self, diagram_code: str) -> tuple:
+        """Validate generated code, patching common syntax slips; returns (code, error or None)"""
+        # Validate and fix syntax
+        try:
+            compile(diagram_code, '<string>', 'exec')
+        except SyntaxError as e:
+            print(f"Syntax error detected: {e}")
+            print(f"Generated code: {diagram_code}")
+            # Try to fix common issues
+            diagram_code = diagram_code.replace('"', '"').replace('"', '"')  # Fix smart quotes
+            diagram_code = diagram_code.replace(''', "'").replace(''', "'")  # Fix smart apostrophes
+            # Fix string literal and parenthesis issues
+            lines = diagram_code.split('\n')
+            fixed_lines = []
+            open_parens = 0
+            
+            for i, line in enumerate(lines):
+                # Check for unterminated strings
+                if '"' in line:
+                    quote_count = line.count('"')
+                    if quote_count % 2 != 0:  # Odd number of quotes
+                        line = line.rstrip() + '"'  # Add closing quote
+                
+                # Track parentheses
+                open_parens += line.count('(') - line.count(')')
+                fixed_lines.append(line)
+            
+            # Close any unclosed parentheses
+            if open_parens > 0:
+                fixed_lines.append(')' * open_parens)
+            
+            # Ensure code ends properly
+            last_line = fixed_lines[-1].strip() if fixed_lines else ''
+            if not last_line or (not last_line.endswith((')', '"', "'")) and '>>' not in last_line):
+                # Add a simple connection if code seems incomplete
+                if 'api_gateway' in diagram_code and 'ingestion_lambda' in diagram_code:
+                    fixed_lines.append('    api_gateway >> ingestion_lambda')
+            
+            diagram_code = '\n'.join(fixed_lines)
+            try:
+                compile(diagram_code, '<string>', 'exec')
+                print("Fixed syntax error")
+            except SyntaxError as e2:
+                return diagram_code, f"Syntax error in generated code: {e2}\n\nGenerated code:\n{diagram_code}"
+        return diagram_code, None
+    
+    async def render_and_record(self, user_prompt: str, diagram_name: str, diagram_code: str, started: float,
+                                timings: Dict[str, float], token_usage: Dict[str, int], persist: bool = True,
+                                output_format: str = "png", previous_positions: Dict[str, Any] = None,
+                                extra_payload: Dict[str, Any] = None, deadline: Deadline = None, graph: Dict[str, Any] = None,
+                                layout: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Render validated code through the MCP server and record the run in the result store; layout overrides the Graphviz options"""
+        deadline = deadline or Deadline(self.request_timeout)
+        deadline.check("render")
+        
+        render_started = time.perf_counter()
+        code_hash = self.result_store.code_hash(diagram_code)
+        # A structured graph needs no code parsing, so its Draw.io XML is built while the image renders
+        converter = self.mcp_client.drawio_converter
+        drawio_build = asyncio.ensure_future(
+            profiling.to_thread(converter.build_graph_drawio_xml, diagram_name, graph, previous_positions)
+        ) if graph else None
+        graph_attrs = graph_attrs_for(diagram_code, {**self.layout_options, **(layout or {})})
+        # The same code with the same Graphviz options renders to the same bytes, so any replica's earlier render can be reused
+        render_hash = self.result_store.code_hash(diagram_code + json.dumps(graph_attrs, sort_keys=True)) if graph_attrs else code_hash
+        mcp_result = await self.cached_render(diagram_code, diagram_name, render_hash, persist, output_format, previous_positions,
+                                              with_drawio=graph is None)
+        if mcp_result is None:
+            # A diagram whose topology rendered before (only labels differ) reuses those positions, so Graphviz skips layout
+            topology = topology_key(diagram_code, graph_attrs) if self.cache else None
+            cached_layout = await self.cache.get_layout_async(topology) if topology else None
+            # Call MCP server with generated code; the client enforces the remaining budget itself
+            render = lambda pinned: self.mcp_client.call_diagram_server(
+                diagram_code, 
+                diagram_name, 
+                os.path.abspath(self.output_dir + "/diagrams/generated-diagrams"),
+                persist=persist,
+                output_format=output_format,
+                previous_positions=previous_positions,
+                timeout=deadline.remaining(),
+                with_drawio=graph is None,
+                render_code=with_layout(diagram_code, graph_attrs, pinned)
+            )
+            mcp_result = await render(cached_layout)
+            if cached_layout and not mcp_result.get("success") and not mcp_result.get("timed_out") and not self._is_code_failure(mcp_result):
+                print(f"Render with cached layout failed, laying out afresh: {mcp_result.get('error')}")
+                cached_layout = None
+                mcp_result = await render(None)
+            mcp_result["layout_reused"] = cached_layout is not None
+            if topology and cached_layout is None and mcp_result.get("success"):
+                entry = layout_entry(diagram_code, mcp_result.get("layout"))
+                if entry:
+                    self._in_background(self.cache.put_layout, topology, entry)
+            if self.cache and mcp_result.get("success") and mcp_result.get("image_bytes"):
+                self._in_background(self.cache.put_render, render_hash, mcp_result["image_format"], mcp_result["image_bytes"],
+                                    mcp_result.get("image_mime"), mcp_result.get("layout"))
+        if drawio_build is not None:
+            drawio_xml, detected_services, positions = await drawio_build
+            if mcp_result.get("success"):
+                mcp_result["drawio_result"] = await profiling.to_thread(converter.drawio_result, mcp_result.get("image_path"), drawio_xml,
+                                                                      detected_services, "graph_ir", positions, persist)
+        timings["render_ms"] = round((time.perf_counter() - render_started) * 1000, 1)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        
+        artifacts = {
+            "image_path": mcp_result.get("image_path"),
+            "drawio_path": (mcp_result.get("drawio_result") or {}).get("drawio_path")
+        }
+        if persist and self.cache and self.cache.storage.shared:
+            artifacts.update(self.mirror_artifacts(diagram_name, code_hash, mcp_result))
+        
+        # Record results without blocking on disk I/O
+        run_id = self.result_store.record(
+            "diagram",
+            name=diagram_name,
+            prompt=user_prompt,
+            code=diagram_code,
+            success=bool(mcp_result.get("success")),
+            artifacts=artifacts,
+            timings=timings,
+            token_usage=token_usage,
+            payload={"diagram_code": diagram_code, "render_hash": render_hash, "mcp_result": self._without_bytes(mcp_result),
+                     **(extra_payload or {})}
+        )
+        if persist and mcp_result.get("image_path") and mcp_result.get("image_bytes"):
+            # The bytes are already in memory, so the gallery preview costs no extra read
+            self._in_background(self.thumbnails.get_or_create, ThumbnailCache.key_for(mcp_result["image_path"], render_hash),
+                                mcp_result["image_bytes"])
+        if mcp_result.get("success"):
+            self._in_background(self.search_index.add, code_hash, diagram_code, diagram_name, user_prompt, run_id, graph,
+                                (extra_payload or {}).get("graph_ir"), artifacts)
+        
+        return {
+            "success": True,
+            "diagram_code": diagram_code,
+            "result": mcp_result,
+            "run_id": run_id
+        }
+    
+    async def cached_render(self, diagram_code: str, diagram_name: str, code_hash: str, persist: bool, output_format: str,
+                            previous_positions: Dict[str, Any] = None, with_drawio: bool = True) -> Dict[str, Any]:
+        """Serve a render from the cache, rebuilding only the (cheap, name-dependent) Draw.io file locally"""
+        if not self.cache:
+            return None
+        cached = await self.cache.get_render_async(code_hash, output_format)
+        if not cached:
+            return None
+        
+        image_bytes = cached["image_bytes"]
+        image_path = os.path.join(os.path.abspath(self.output_dir + "/diagrams/generated-diagrams"), f"{diagram_name}.{output_format}")
+        if persist:
+            await write_artifact(image_path, image_bytes)
+        drawio_result = await self.mcp_client.drawio_converter.convert_to_drawio_async(
+            image_path, diagram_name, diagram_code, persist=persist, layout=cached.get("layout"), previous_positions=previous_positions
+        ) if with_drawio else None
+        return {
+            "success": True,
+            "result": "Served from render cache",
+            "image_path": image_path if persist else None,
+            "image_bytes": image_bytes,
+            "image_format": output_format,
+            "image_mime": cached.get("image_mime"),
+            "svg_bytes": image_bytes if output_format == "svg" else None,
+            "layout": cached.get("layout"),
+            "persisted": persist,
+            "drawio_result": drawio_result,
+            "cache_hit": True
+        }
+    
+    def mirror_artifacts(self, diagram_name: str, code_hash: str, mcp_result: Dict[str, Any]) -> Dict[str, str]:
+        """Copy persisted files to shared storage in the background; returns where they will be"""
+        locations = {}
+        prefix = f"{diagram_name}/{code_hash[:12]}"
+        if mcp_result.get("image_bytes"):
+            key = f"{prefix}.{mcp_result.get('image_format', 'png')}"
+            locations["shared_image"] = self.cache.storage.location(f"artifacts/{key}")
+            self._in_background(self.cache.put_artifact, key, mcp_result["image_bytes"], mcp_result.get("image_mime"))
+        drawio_path = (mcp_result.get("drawio_result") or {}).get("drawio_path")
+        if drawio_path:
+            key = f"{prefix}.drawio"
+            locations["shared_drawio"] = self.cache.storage.location(f"artifacts/{key}")
+            self._in_background(self._mirror_file, key, drawio_path, "application/xml")
+        return locations
+    
+    def _mirror_file(self, key: str, path: str, content_type: str):
+        """Upload a file written by the converter to shared storage"""
+        with open(path, 'rb') as f:
+            self.cache.put_artifact(key, f.read(), content_type)
+    
+    async def _admitted(self, work, timeout: float = None, profile: bool = None, label: str = "request") -> Dict[str, Any]:
+        """Run work(deadline) inside an admission slot under an end-to-end deadline, profiled when asked or sampled"""
+        deadline = Deadline(timeout or self.request_timeout)
+        try:
+            async with self.admission.slot(timeout=deadline.remaining()):
+                if self.profiler.should_profile(profile):
+                    return await self._profiled(work, deadline, label)
+                return await work(deadline)
+        except OverloadedError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "overloaded": True,
+                "message": "Server busy: too many diagram requests are in progress. Please retry in a few seconds."
+            }
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": f"Timed out after {deadline.timeout:g}s waiting for a free request slot",
+                "timed_out": True,
+                "message": "Server busy: the request deadline passed while waiting in the queue."
+            }
+    
+    async def _profiled(self, work, deadline: Deadline, label: str) -> Dict[str, Any]:
+        """Run work under cProfile and tracemalloc and attach the saved hotspot report to the result"""
+        with self.profiler.session(label) as session:
+            result = await work(deadline)
+        if session is None:
+            return {**result, "profile_skipped": "another request is being profiled"}
+        report = await asyncio.to_thread(self.profiler.save, session, result.get("run_id"))
+        return {**result, "profile": report}
+    
+    def recent_profiles(self, limit: int = 20) -> list:
+        """Saved profile records, newest first"""
+        return self.result_store.recent(kind="profile", limit=limit)
+    
+    @staticmethod
+    def _add_usage(total: Dict[str, int], usage: Dict[str, int]) -> Dict[str, int]:
+        """Sum Bedrock token usage across escalation attempts"""
+        return {key: total.get(key, 0) + usage.get(key, 0) for key in set(total) | set(usage)}
+    
+    @staticmethod
+    def _is_code_failure(mcp_result: Dict[str, Any]) -> bool:
+        """True when the render failed because of the generated code rather than Docker or the MCP server"""
+        if mcp_result.get("success") or mcp_result.get("timed_out"):
+            return False
+        return bool(CODE_ERROR_PATTERN.search(str(mcp_result.get("error", ""))))
+    
+    @staticmethod
+    def _failure_result(action: str, error: Exception) -> Dict[str, Any]:
+        """Failure response whose message says whether to retry, wait or check the local setup"""
+        if isinstance(error, BedrockThrottledError):
+            message = f"{action} failed: Bedrock is rate limiting requests right now. Please retry in a minute."
+        elif isinstance(error, DeadlineExceeded):
+            message = f"{action} failed: {error}"
+        else:
+            message = f"{action} failed: {error}. Make sure Docker is running and MCP server is available."
+        return {
+            "success": False,
+            "error": str(error),
+            "timed_out": isinstance(error, DeadlineExceeded),
+            "throttled": isinstance(error, BedrockThrottledError),
+            "message": message
+        }
+    
+    async def aclose(self):
+        """Close pooled MCP sessions and flush pending result-store writes"""
+        await self.mcp_dispatcher.close()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await asyncio.to_thread(self.result_store.flush)
+        self.bedrock_executor.shutdown(wait=False)
+    
+    def service_metrics(self) -> Dict[str, Any]:
+        """Admission queue and Bedrock throttling counters for dashboards"""
+        metrics = {"admission": self.admission.stats(), "single_flight": self.single_flight.stats(), "profiler": self.profiler.metrics()}
+        # Do not build the client just to report that nothing has happened yet
+        if 'bedrock' in self.__dict__ and hasattr(self.bedrock, 'metrics'):
+            metrics["bedrock"] = self.bedrock.metrics()
+        metrics["mcp_backends"] = self.mcp_dispatcher.metrics()
+        if 'cache' in self.__dict__ and self.cache is not None:
+            metrics["cache"] = self.cache.metrics()
+        metrics["thumbnails"] = self.thumbnails.metrics()
+        if 'mcp_client' in self.__dict__ and hasattr(self.mcp_client, 'metrics'):
+            metrics["render_sandbox"] = self.mcp_client.metrics()
+        return metrics
+    
+    @staticmethod
+    def _without_bytes(value: Any) -> Any:
+        """Drop in-memory image buffers before a result is recorded"""
+        if isinstance(value, dict):
+            return {k: BedrockStrandsAgent._without_bytes(v) for k, v in value.items() if not isinstance(v, bytes)}
+        return value
+    
+    async def generate_architecture_diagram(self, user_prompt: str, diagram_name: str, persist: bool = True, output_format: str = "png",
+                                            timeout: float = None, fresh: bool = False, graph_ir: bool = False, profile: bool = None,
+                                            layout: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Generate architecture diagram using MCP server with Bedrock; persist=False keeps artifacts in memory only, fresh=True skips cached code, graph_ir=True builds it from a JSON graph, profile=True attaches a CPU/memory profile, layout sets Graphviz engine/splines/ranksep/nodesep"""
+        try:
+            layout = validate_layout_options(layout)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        # Coalesce before admission so followers do not take queue slots; the leader's deadline applies to all
+        key = (' '.join(user_prompt.split()), diagram_name, output_format, persist, fresh, graph_ir, tuple(sorted(layout.items())))
+        result, shared = await self.single_flight.run(key, lambda: self._admitted(
+            lambda deadline: self._generate_architecture_diagram(user_prompt, diagram_name, persist, output_format, deadline, fresh, graph_ir, layout),
+            timeout, profile, f"generate:{diagram_name}"
+        ))
+        return {**result, "coalesced": True} if shared else result
+    
+    async def _generate_architecture_diagram(self, user_prompt: str, diagram_name: str, persist: bool, output_format: str,
+                                             deadline: Deadline, fresh: bool = False, graph_ir: bool = False,
+                                             layout: Dict[str, Any] = None) -> Dict[str, Any]:
         
         system_prompt = """Generate ONLY Python diagrams code. Use ONLY these verified AWS services with proper icons:
 from diagrams.saas.observability import *
@@ -210,107 +637,318 @@ FOR UNSUPPORTED SERVICES (outside of the list above):
 - Or use IAM() for security-related services
 
 Return ONLY the Python code, no explanations."""
+        if graph_ir:
+            # A compact JSON graph instead of a program: fewer output tokens and nothing to repair or parse heuristically
+            system_prompt = GRAPH_IR_SYSTEM_PROMPT
         
         request_body = {
             "messages": [
                 {"role": "user", "content": [{"text": f"{system_prompt}\n\nUser request: {user_prompt}"}]}
             ],
-            "inferenceConfig": {"temperature": 0.1, "maxTokens": 8192}
         }
         
+        started = time.perf_counter()
+        timings = {}
+        token_usage = {}
+        # Start on the cheapest tier that fits the prompt; move up only when its output does not validate
+        tier = self.model_router.select(user_prompt)
+        tried = []
         try:
-            response = self.bedrock.converse(modelId="us.anthropic.claude-sonnet-4-20250514-v1:0", **request_body)
-            diagram_code = response['output']['message']['content'][0]['text']
+            # Code that already rendered for this prompt (on any replica) skips Bedrock entirely
+            code_key = self.cache.code_key(user_prompt, self.result_store.code_hash(system_prompt)) if self.cache else None
+            cached = await self.cache.get_code_async(code_key) if self.cache and not fresh else None
+            if cached:
+                graph = cached.get("graph_ir")
+                result = await self.render_and_record(user_prompt, diagram_name, cached["diagram_code"], started, timings, token_usage,
+                                                      persist=persist, output_format=output_format, deadline=deadline,
+                                                      extra_payload={"model": cached.get("model"), "code_cache_hit": True, "graph_ir": graph},
+                                                      graph=graph_ir_to_parsed(graph) if graph else None, layout=layout)
+                if result["result"].get("success"):
+                    result["model"] = cached.get("model")
+                    result["code_cache_hit"] = True
+                    if graph:
+                        result["graph_ir"] = graph
+                    return result
             
-            # Extract code from markdown
-            if "```python" in diagram_code:
-                diagram_code = diagram_code.split("```python")[1].split("```")[0].strip()
-            elif "```" in diagram_code:
-                diagram_code = diagram_code.split("```")[1].split("```")[0].strip()
+            similar = await self._similar_prompts(user_prompt, graph_ir)
+            if similar and not fresh:
+                reused = await self._render_similar(similar[0], user_prompt, diagram_name, persist, output_format, deadline,
+                                                    started, timings, token_usage, layout)
+                if reused:
+                    return reused
+            examples = [match for match in similar if match["score"] >= 0.3]
+            if examples:
+                # Validated examples replace the long import list, so the request is shorter and the output closer to what renders
+                from agents.prompt_index import few_shot_graph_prompt, few_shot_prompt
+                system_prompt = few_shot_graph_prompt(GRAPH_IR_SYSTEM_PROMPT, examples) if graph_ir else few_shot_prompt(examples)
+                request_body["messages"][0]["content"][0]["text"] = f"{system_prompt}\n\nUser request: {user_prompt}"
             
-            # Clean up any remaining markdown or formatting issues
-            diagram_code = diagram_code.replace('\r\n', '\n').replace('\r', '\n')
-            # Fix escaped quotes that might cause issues
-            diagram_code = diagram_code.replace('\\"', '"')
-            # Remove any trailing backslashes that might escape quotes
-            lines = diagram_code.split('\n')
-            cleaned_lines = []
-            for line in lines:
-                line = line.rstrip('\\')  # Remove trailing backslashes
-                if line.strip():
-                    cleaned_lines.append(line)
-            diagram_code = '\n'.join(cleaned_lines)
-            
-            # Validate and fix syntax
-            try:
-                compile(diagram_code, '<string>', 'exec')
-            except SyntaxError as e:
-                print(f"Syntax error detected: {e}")
-                print(f"Generated code: {diagram_code}")
-                # Try to fix common issues
-                diagram_code = diagram_code.replace('"', '"').replace('"', '"')  # Fix smart quotes
-                diagram_code = diagram_code.replace(''', "'").replace(''', "'")  # Fix smart apostrophes
-                # Fix string literal and parenthesis issues
-                lines = diagram_code.split('\n')
-                fixed_lines = []
-                open_parens = 0
+            while True:
+                tried.append(tier["name"])
+                bedrock_started = time.perf_counter()
+                response = await deadline.run_blocking(self.bedrock.converse, stage="bedrock", executor=self.bedrock_executor,
+                                                       expires_at=deadline.expires_at, modelId=tier["model_id"],
+                                                       inferenceConfig={"temperature": 0.1, "maxTokens": tier["max_tokens"]},
+                                                       **request_body)
+                timings["bedrock_ms"] = round(timings.get("bedrock_ms", 0) + (time.perf_counter() - bedrock_started) * 1000, 1)
+                token_usage = self._add_usage(token_usage, response.get('usage', {}))
+                diagram_code = response['output']['message']['content'][0]['text']
                 
-                for i, line in enumerate(lines):
-                    # Check for unterminated strings
-                    if '"' in line:
-                        quote_count = line.count('"')
-                        if quote_count % 2 != 0:  # Odd number of quotes
-                            line = line.rstrip() + '"'  # Add closing quote
+                graph = None
+                if graph_ir:
+                    # Code generated from a validated graph always compiles, so there is nothing to repair
+                    try:
+                        graph = parse_graph_ir(diagram_code)
+                        diagram_code, error = graph_ir_to_code(graph), None
+                    except GraphIRError as e:
+                        error = f"Invalid graph IR: {e}"
+                else:
+                    diagram_code = self.clean_diagram_code(diagram_code)
                     
-                    # Track parentheses
-                    open_parens += line.count('(') - line.count(')')
-                    fixed_lines.append(line)
-                
-                # Close any unclosed parentheses
-                if open_parens > 0:
-                    fixed_lines.append(')' * open_parens)
+                    diagram_code, error = self.repair_diagram_code(diagram_code)
+                    if not error and not has_diagram_call(diagram_code):
+                        error = "Generated code does not create a Diagram"
+                next_tier = self.model_router.escalate(tier)
+                if error:
+                    if next_tier:
+                        print(f"{tier['name']} model output failed validation, escalating to {next_tier['name']}: {error.splitlines()[0]}")
+                        tier = next_tier
+                        continue
+                    return {"success": False, "error": error, "models": tried}
                 
-                # Ensure code ends properly
-                last_line = fixed_lines[-1].strip() if fixed_lines else ''
-                if not last_line or (not last_line.endswith((')', '"', "'")) and '>>' not in last_line):
-                    # Add a simple connection if code seems incomplete
-                    if 'api_gateway' in diagram_code and 'ingestion_lambda' in diagram_code:
-                        fixed_lines.append('    api_gateway >> ingestion_lambda')
-                
-                diagram_code = '\n'.join(fixed_lines)
-                try:
-                    compile(diagram_code, '<string>', 'exec')
-                    print("Fixed syntax error")
-                except SyntaxError as e2:
-                    return {"success": False, "error": f"Syntax error in generated code: {e2}\n\nGenerated code:\n{diagram_code}"}
+                result = await self.render_and_record(user_prompt, diagram_name, diagram_code, started, timings, token_usage,
+                                                      persist=persist, output_format=output_format, deadline=deadline,
+                                                      extra_payload={"model": tier["model_id"], "models_tried": tried, "graph_ir": graph,
+                                                                     "few_shot_run_ids": [example["run_id"] for example in examples]},
+                                                      graph=graph_ir_to_parsed(graph) if graph else None, layout=layout)
+                if next_tier and not graph and self._is_code_failure(result.get("result", {})):
+                    print(f"{tier['name']} model code failed to render, escalating to {next_tier['name']}")
+                    tier = next_tier
+                    continue
+                result["model"] = tier["model_id"]
+                if graph:
+                    result["graph_ir"] = graph
+                if examples:
+                    result["similar_examples"] = [{"prompt": example["prompt"], "score": example["score"]} for example in examples]
+                if self.cache and result["result"].get("success"):
+                    self._in_background(self.cache.put_code, code_key, diagram_code, tier["model_id"], graph)
+                if self.similar_examples and result["result"].get("success"):
+                    self._in_background(self.prompt_index.add, user_prompt, diagram_code, graph, result["run_id"])
+                return result
             
-            # Call MCP server with generated code
-            mcp_result = await self.mcp_client.call_diagram_server(
-                diagram_code, 
-                diagram_name, 
-                os.path.abspath(self.output_dir + "/diagrams/generated-diagrams")
+        except Exception as e:
+            print(f"Full error: {str(e)}")
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.result_store.record(
+                "diagram",
+                name=diagram_name,
+                prompt=user_prompt,
+                success=False,
+                timings=timings,
+                token_usage=token_usage,
+                payload={"error": str(e)}
             )
+            return self._failure_result("Diagram generation", e)
+    
+    async def _similar_prompts(self, user_prompt: str, graph_ir: bool) -> list:
+        """Closest past prompts; like the cache, a broken index must never fail a request"""
+        if not self.similar_examples:
+            return []
+        try:
+            return await profiling.to_thread(self.prompt_index.query, user_prompt, self.similar_examples, graph_ir)
+        except Exception as e:
+            print(f"Prompt similarity lookup failed: {e}")
+            return []
+    
+    async def _render_similar(self, match: Dict[str, Any], user_prompt: str, diagram_name: str, persist: bool, output_format: str,
+                              deadline: Deadline, started: float, timings: Dict[str, float], token_usage: Dict[str, int],
+                              layout: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Serve a past diagram when the new prompt only rewords its prompt; None when it differs or does not render"""
+        from agents.prompt_index import content_sequence
+        # A high score alone would let "Kinesis with ECS" stand in for "Kinesis with EKS", or "S3 to SQS" for "SQS to S3",
+        # so the words must also match in order; looser matches are only used as few-shot examples
+        if match["score"] < self.similar_reuse_threshold or content_sequence(match["prompt"]) != content_sequence(user_prompt):
+            return None
+        graph = match.get("graph_ir")
+        result = await self.render_and_record(user_prompt, diagram_name, match["diagram_code"], started, timings, token_usage,
+                                              persist=persist, output_format=output_format, deadline=deadline,
+                                              extra_payload={"similar_to_run_id": match["run_id"], "similarity": match["score"], "graph_ir": graph},
+                                              graph=graph_ir_to_parsed(graph) if graph else None, layout=layout)
+        if not result["result"].get("success"):
+            return None
+        result["similar_reuse"] = {"prompt": match["prompt"], "score": match["score"], "run_id": match["run_id"]}
+        if graph:
+            result["graph_ir"] = graph
+        return result
+    
+    async def import_drawio_diagram(self, source, diagram_name: str, persist: bool = True, output_format: str = "png",
+                                    timeout: float = None, profile: bool = None) -> Dict[str, Any]:
+        """Re-render a hand-edited .drawio file (path or file object) without Bedrock, keeping its layout"""
+        imported = await profiling.to_thread(self.mcp_client.drawio_converter.import_drawio, source)
+        if not imported["success"]:
+            return imported
+        return await self._admitted(
+            lambda deadline: self._render_imported_drawio(imported, diagram_name, persist, output_format, deadline), timeout,
+            profile, f"import:{diagram_name}"
+        )
+    
+    async def _render_imported_drawio(self, imported: Dict[str, Any], diagram_name: str, persist: bool, output_format: str,
+                                      deadline: Deadline) -> Dict[str, Any]:
+        started = time.perf_counter()
+        graph = imported["graph_ir"]
+        try:
+            result = await self.render_and_record(f"Imported Draw.io file: {graph['title']}", diagram_name, imported["diagram_code"],
+                                                  started, {}, {}, persist=persist, output_format=output_format,
+                                                  previous_positions=imported["positions"], deadline=deadline,
+                                                  extra_payload={"graph_ir": graph, "imported_drawio": True},
+                                                  graph=graph_ir_to_parsed(graph))
+        except Exception as e:
+            return self._failure_result("Draw.io import", e)
+        result.update({"graph_ir": graph, "unmapped_shapes": imported["unmapped_shapes"], "message": imported["message"]})
+        return result
+    
+    def recent_diagrams(self, limit: int = 12) -> list:
+        """Newest persisted diagrams whose image is still on disk, one per file"""
+        diagrams, seen = [], set()
+        for run in self.result_store.recent(kind="diagram", limit=limit * 4):
+            image_path = (run["artifacts"] or {}).get("image_path")
+            if not run["success"] or not image_path or image_path in seen or not os.path.exists(image_path):
+                continue
+            seen.add(image_path)
+            # The same code renders differently under other Graphviz options, so older runs without a render hash fall back to the file's bytes
+            render_hash = (run["payload"] or {}).get("render_hash")
+            diagrams.append({"name": run["name"], "prompt": run["prompt"], "image_path": image_path, "created_at": run["created_at"],
+                             "thumbnail_key": ThumbnailCache.key_for(image_path, render_hash)})
+            if len(diagrams) == limit:
+                break
+        return diagrams
+    
+    def diagram_thumbnail(self, diagram: Dict[str, Any]) -> Dict[str, Any]:
+        """Cached preview of a recent_diagrams() entry, generated from the file on first request"""
+        return self.thumbnails.get_or_create(diagram["thumbnail_key"], diagram["image_path"])
+    
+    def search_diagrams(self, query: str, limit: int = 20) -> Dict[str, Any]:
+        """Search past diagrams by prompt text, labels, services and edges ("Kinesis -> ECS")"""
+        try:
+            # Picks up runs recorded by other processes sharing the result store (the API server, bulk jobs)
+            self.search_index.sync(self.result_store)
+        except Exception as e:
+            print(f"Search index sync failed: {e}")
+        return self.search_index.search(query, limit)
+    
+    async def reuse_indexed_diagram(self, code_hash: str, diagram_name: str = None, persist: bool = True, output_format: str = "png",
+                                    timeout: float = None, profile: bool = None) -> Dict[str, Any]:
+        """Re-render a diagram found by search from its stored code instead of asking Bedrock again"""
+        entry = await profiling.to_thread(self.search_index.get, code_hash)
+        if not entry:
+            return {"success": False, "error": f"No indexed diagram with code hash {code_hash}", "message": "Diagram not found in the search index"}
+        return await self._admitted(
+            lambda deadline: self._reuse_indexed_diagram(entry, diagram_name or entry["name"], persist, output_format, deadline), timeout,
+            profile, f"reuse:{diagram_name or entry['name']}"
+        )
+    
+    async def _reuse_indexed_diagram(self, entry: Dict[str, Any], diagram_name: str, persist: bool, output_format: str,
+                                     deadline: Deadline) -> Dict[str, Any]:
+        started = time.perf_counter()
+        graph = entry["graph_ir"]
+        try:
+            # The code is unchanged, so the render cache usually serves the image too
+            result = await self.render_and_record(entry["prompt"], diagram_name, entry["diagram_code"], started, {}, {},
+                                                  persist=persist, output_format=output_format, deadline=deadline,
+                                                  extra_payload={"reused_run_id": entry["run_id"], "graph_ir": graph},
+                                                  graph=graph_ir_to_parsed(graph) if graph else None)
+        except Exception as e:
+            return self._failure_result("Diagram reuse", e)
+        result["reused_run_id"] = entry["run_id"]
+        if graph:
+            result["graph_ir"] = graph
+        return result
+    
+    async def edit_architecture_diagram(self, previous_code: str, change_request: str, diagram_name: str,
+                                        previous_positions: Dict[str, Any] = None, persist: bool = True,
+                                        output_format: str = "png", timeout: float = None, profile: bool = None,
+                                        layout: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Apply a small change to an existing diagram by asking Bedrock for a diff instead of new code"""
+        try:
+            layout = validate_layout_options(layout)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return await self._admitted(
+            lambda deadline: self._edit_architecture_diagram(previous_code, change_request, diagram_name, previous_positions,
+                                                             persist, output_format, deadline, layout), timeout, profile, f"edit:{diagram_name}"
+        )
+    
+    async def _edit_architecture_diagram(self, previous_code: str, change_request: str, diagram_name: str,
+                                         previous_positions: Dict[str, Any], persist: bool, output_format: str,
+                                         deadline: Deadline, layout: Dict[str, Any] = None) -> Dict[str, Any]:
+        
+        system_prompt = """You are editing an existing Python diagrams program. Apply the requested change with minimal edits.
+Return ONLY a unified diff against the code below (--- a/diagram.py, +++ b/diagram.py, @@ hunks with 2 lines of context).
+Add any new imports the change needs. Keep existing variable names so unchanged services stay where they are.
+Return no explanations."""
+        
+        request_body = {
+            "messages": [
+                {"role": "user", "content": [{"text": f"{system_prompt}\n\nCurrent code:\n```python\n{previous_code}\n```\n\nRequested change: {change_request}"}]}
+            ]
+        }
+        
+        started = time.perf_counter()
+        timings = {}
+        token_usage = {}
+        # Small edits go to the fast tier; a patch that does not apply or validate is retried one tier up
+        tier = self.model_router.select(change_request)
+        tried = []
+        try:
+            while True:
+                tried.append(tier["name"])
+                bedrock_started = time.perf_counter()
+                # A diff is a fraction of the full program, so the output budget can be much smaller
+                response = await deadline.run_blocking(self.bedrock.converse, stage="bedrock", executor=self.bedrock_executor,
+                                                       expires_at=deadline.expires_at, modelId=tier["model_id"],
+                                                       inferenceConfig={"temperature": 0.1, "maxTokens": min(2048, tier["max_tokens"])},
+                                                       **request_body)
+                timings["bedrock_ms"] = round(timings.get("bedrock_ms", 0) + (time.perf_counter() - bedrock_started) * 1000, 1)
+                token_usage = self._add_usage(token_usage, response.get('usage', {}))
+                reply = response['output']['message']['content'][0]['text']
+                
+                next_tier = self.model_router.escalate(tier)
+                try:
+                    patch = extract_patch(reply)
+                    if '@@' in patch:
+                        diagram_code = apply_unified_diff(previous_code, patch)
+                    else:
+                        # The model ignored the diff instruction and sent the whole program
+                        diagram_code = self.clean_diagram_code(reply)
+                except PatchError:
+                    if next_tier:
+                        tier = next_tier
+                        continue
+                    raise
+                
+                diagram_code, error = self.repair_diagram_code(diagram_code)
+                if not error and not has_diagram_call(diagram_code):
+                    error = "Edited code does not create a Diagram"
+                if error:
+                    if next_tier:
+                        tier = next_tier
+                        continue
+                    return {"success": False, "error": error, "models": tried}
+                
+                result = await self.render_and_record(change_request, diagram_name, diagram_code, started, timings, token_usage,
+                                                      persist=persist, output_format=output_format,
+                                                      previous_positions=previous_positions,
+                                                      extra_payload={"edit_of_code_hash": self.result_store.code_hash(previous_code), "patch": patch,
+                                                                     "model": tier["model_id"], "models_tried": tried},
+                                                      deadline=deadline, layout=layout)
+                if next_tier and self._is_code_failure(result.get("result", {})):
+                    tier = next_tier
+                    continue
+                result["model"] = tier["model_id"]
+                return result
             
-            # Save results
-            result_file = os.path.join(f"{self.output_dir}/diagrams", "architecture_result.json")
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump({
-                    "user_prompt": user_prompt,
-                    "diagram_code": diagram_code,
-                    "mcp_result": mcp_result
-                }, f, indent=2)
-            
-            return {
-                "success": True,
-                "diagram_code": diagram_code,
-                "result": mcp_result,
-                "output_file": result_file
-            }
-            
+        except PatchError as e:
+            return {"success": False, "error": str(e), "message": f"Could not apply the requested edit: {e}"}
         except Exception as e:
             print(f"Full error: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "message": f"Diagram generation failed: {e}. Make sure Docker is running and MCP server is available."
-            }
\ No newline at end of file
+            return self._failure_result("Diagram edit", e)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
+from agents.artifact_writer import atomic_write
+from agents.result_store import ResultStore
+
+MANIFEST_NAME = ".drawio-manifest.json"
+DEFAULT_DB_PATH = "outputs/results.db"
+DEFAULT_IMAGES_DIR = "outputs/diagrams/generated-diagrams"
+
+# Sources whose changes alter the .drawio output; their hash is part of every input hash
+CONVERTER_SOURCES = ("drawio_converter.py", "drawio_format.py", "graphviz_layout.py", "graph_ir.py")
+
+def converter_version() -> str:
+    """Hash of the converter sources, so improving the converter invalidates every output"""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in CONVERTER_SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def drawio_path_for(image_path: str) -> str:
+    """The converter always writes the .drawio file next to the image"""
+    return os.path.splitext(image_path)[0] + '.drawio'
+
+def input_hash(job: Dict[str, Any], version: str, compressed: bool) -> str:
+    """Content hash of everything a conversion reads"""
+    inputs = [version, compressed, job["name"], job["diagram_code"], job["layout"], job["graph_ir"]]
+    if job.get("source"):
+        # Files found on disk: the image itself, since a re-imported .drawio changes with every conversion
+        inputs.append(job["source"])
+    material = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def discover_jobs(store: ResultStore) -> Iterator[Dict[str, Any]]:
+    """Latest successful run for every persisted image that still exists on disk"""
+    seen = set()
+    for run in store.iter_runs(kind="diagram", success_only=True):
+        image_path = (run["artifacts"] or {}).get("image_path")
+        if not image_path or os.path.abspath(image_path) in seen:
+            continue
+        image_path = os.path.abspath(image_path)
+        seen.add(image_path)  # runs come newest first, so older runs of the same file are ignored
+        if not os.path.exists(image_path):
+            continue
+        payload = run["payload"] or {}
+        yield {
+            "image_path": image_path,
+            "name": run["name"] or os.path.splitext(os.path.basename(image_path))[0],
+            "diagram_code": payload.get("diagram_code"),
+            "layout": (payload.get("mcp_result") or {}).get("layout"),
+            "graph_ir": payload.get("graph_ir")
+        }
+
+def code_beside(image_path: str) -> Optional[str]:
+    """Diagram code kept next to an image, by hand or as a leftover render script"""
+    base = os.path.splitext(image_path)[0]
+    for path in (f"{base}.py", f"{base}_temp.py"):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            continue
+    return None
+
+def discover_files(images_dir: str, known: set) -> Iterator[Dict[str, Any]]:
+    """PNGs on disk that no stored run describes, e.g. renders from before the result store existed"""
+    if not images_dir or not os.path.isdir(images_dir):
+        return
+    for entry in sorted(os.scandir(images_dir), key=lambda entry: entry.name):
+        image_path = os.path.abspath(entry.path)
+        if not entry.name.endswith('.png') or not entry.is_file() or image_path in known:
+            continue
+        stat = entry.stat()
+        diagram_code = code_beside(image_path)
+        yield {
+            "image_path": image_path,
+            "name": os.path.splitext(entry.name)[0],
+            "diagram_code": diagram_code,
+            "layout": None,
+            "graph_ir": None,
+            # Without code, an existing .drawio is imported back into graph IR in the worker; failing that, services come from the file name
+            "import_drawio": diagram_code is None and os.path.exists(drawio_path_for(image_path)),
+            "source": f"{stat.st_size}:{stat.st_mtime_ns}"
+        }
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """drawio path -> input hash of the conversion that produced it"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def is_up_to_date(job: Dict[str, Any], manifest: Dict[str, Any]) -> bool:
+    """Cheap mtime check first, then the content hash recorded for the existing output"""
+    drawio_path = drawio_path_for(job["image_path"])
+    try:
+        if os.path.getmtime(drawio_path) < os.path.getmtime(job["image_path"]):
+            return False
+    except FileNotFoundError:
+        return False
+    return manifest.get(drawio_path) == job["input_hash"]
+
+_converter = None
+
+def _init_worker(compressed: bool):
+    """One converter per worker process"""
+    global _converter
+    from agents.drawio_converter import DrawIOConverter
+    _converter = DrawIOConverter(compressed=compressed)
+
+def convert_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert one image (runs in a worker process)"""
+    try:
+        if job.get("import_drawio"):
+            imported = _converter.import_drawio(drawio_path_for(job["image_path"]))
+            if imported["success"]:
+                job = {**job, "graph_ir": imported["graph_ir"]}
+        if job["graph_ir"]:
+            from agents.graph_ir import graph_ir_to_parsed
+            drawio_xml, detected_services, positions = _converter.build_graph_drawio_xml(job["name"], graph_ir_to_parsed(job["graph_ir"]))
+            result = _converter.drawio_result(job["image_path"], drawio_xml, detected_services, "graph_ir", positions)
+        else:
+            result = _converter.convert_to_drawio(job["image_path"], job["name"], job["diagram_code"], layout=job["layout"])
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    return {"image_path": job["image_path"], "input_hash": job["input_hash"], "success": result.get("success", False),
+            "drawio_path": result.get("drawio_path"), "error": result.get("error")}
+
+def bulk_convert(db_path: str = None, workers: Optional[int] = None, force: bool = False, compressed: bool = None,
+                 limit: int = None, manifest_path: str = None, dry_run: bool = False, images_dir: str = DEFAULT_IMAGES_DIR) -> Dict[str, Any]:
+    """Re-convert every stored diagram, and every image under images_dir, whose .drawio output is missing or stale, across a process pool"""
+    from agents.drawio_format import compressed_by_default
+    compressed = compressed_by_default(compressed)
+    # An explicit db_path must exist; the default one may not yet, when only pre-store renders are on disk
+    if db_path is None and not os.path.exists(DEFAULT_DB_PATH):
+        store = None
+    else:
+        store = ResultStore(db_path or DEFAULT_DB_PATH, readonly=True)
+    manifest_path = manifest_path or os.path.join(os.path.dirname(os.path.abspath(db_path or DEFAULT_DB_PATH)), "diagrams", MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    version = converter_version()
+
+    def discover() -> Iterator[Dict[str, Any]]:
+        known = set()
+        for job in discover_jobs(store) if store else ():
+            known.add(job["image_path"])
+            yield job
+        yield from discover_files(images_dir, known)
+
+    started = time.perf_counter()
+    jobs: List[Dict[str, Any]] = []
+    discovered = skipped = from_files = 0
+    for job in discover():
+        discovered += 1
+        from_files += bool(job.get("source"))
+        job["input_hash"] = input_hash(job, version, compressed)
+        if force or not is_up_to_date(job, manifest):
+            jobs.append(job)
+        else:
+            skipped += 1
+        if limit and len(jobs) >= limit:
+            break
+    scan_s = time.perf_counter() - started
+
+    failures = []
+    converted = 0
+    if jobs and not dry_run:
+        workers = workers or os.cpu_count() or 1
+        # Small chunks keep workers busy on mixed-size diagrams without per-file IPC overhead dominating
+        chunksize = max(1, min(32, len(jobs) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(compressed,)) as pool:
+            for outcome in pool.map(convert_job, jobs, chunksize=chunksize):
+                if outcome["success"]:
+                    converted += 1
+                    manifest[outcome["drawio_path"]] = outcome["input_hash"]
+                else:
+                    failures.append({"image_path": outcome["image_path"], "error": outcome["error"]})
+        atomic_write(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+
+    elapsed = time.perf_counter() - started
+    return {
+        "discovered": discovered,
+        "from_files": from_files,
+        "skipped": skipped,
+        "queued": len(jobs),
+        "converted": converted,
+        "failed": len(failures),
+        "failures": failures[:20],
+        "workers": workers,
+        "scan_s": round(scan_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "files_per_s": round(converted / elapsed, 1) if converted and elapsed else 0.0,
+        "converter_version": version,
+        "dry_run": dry_run
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate .drawio files for stored diagram runs in parallel")
+    parser.add_argument("--db", default=None, help=f"result store to discover code/image pairs from (default: {DEFAULT_DB_PATH}, if it exists)")
+    parser.add_argument("--images", default=DEFAULT_IMAGES_DIR, help="also convert PNGs here that have no stored run ('' to skip)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="convert even when the output is up to date")
+    parser.add_argument("--compressed", action="store_true", default=None, help="write compressed pages (default: DRAWIO_COMPRESSED)")
+    parser.add_argument("--limit", type=int, default=None, help="convert at most this many files")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be converted")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        report = bulk_convert(args.db, workers=args.workers, force=args.force, compressed=args.compressed,
+                              limit=args.limit, dry_run=args.dry_run, images_dir=args.images)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Discovered {report['discovered']} diagrams ({report['from_files']} without a stored run); {report['skipped']} up to date, {report['queued']} stale, {report['converted']} converted, "
+          f"{report['failed']} failed in {report['elapsed_s']}s ({report['files_per_s']} files/s, {report['workers']} workers)")
+    for failure in report["failures"]:
+        print(f"  {failure['image_path']}: {failure['error']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import re
+from typing import List, Tuple
+
+class PatchError(ValueError):
+    """Raised when an LLM-produced patch cannot be applied to the current code"""
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+def extract_patch(reply: str) -> str:
+    """Pull a diff out of an LLM reply, tolerating markdown fences"""
+    if "```" in reply:
+        for block in reply.split("```")[1::2]:
+            body = block.split('\n', 1)[1] if block.startswith(('diff', 'patch', 'python')) else block
+            if '@@' in body:
+                return body.strip('\n')
+        return reply.split("```")[1].split('\n', 1)[-1].strip('\n')
+    return reply.strip('\n')
+
+def parse_hunks(patch: str) -> List[Tuple[int, List[Tuple[str, str]]]]:
+    """Parse unified diff hunks into (expected_start_line, [(tag, text), ...]) with tags ' ', '-' and '+'"""
+    hunks = []
+    current = None
+    for line in patch.split('\n'):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            current = (int(header.group(1)), [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(('---', '+++', '\\')):
+            continue  # file headers and "\ No newline at end of file"
+        if line.startswith(('+', '-', ' ')):
+            current[1].append((line[0], line[1:]))
+        elif line == '':
+            current[1].append((' ', ''))
+    return hunks
+
+def _find_block(lines: List[str], block: List[str], expected: int) -> int:
+    """Find where block occurs in lines, preferring the match closest to the expected index"""
+    if not block:
+        return min(max(expected, 0), len(lines))
+
+    def matches(strip: bool) -> List[int]:
+        norm = (lambda text: text.strip()) if strip else (lambda text: text.rstrip())
+        target = [norm(text) for text in block]
+        return [i for i in range(len(lines) - len(block) + 1)
+                if [norm(text) for text in lines[i:i + len(block)]] == target]
+
+    # Exact match first, then tolerate indentation drift in the model's context lines
+    candidates = matches(strip=False) or matches(strip=True)
+    if not candidates:
+        raise PatchError("Patch context not found in the current code:\n" + '\n'.join(block))
+    return min(candidates, key=lambda i: abs(i - expected))
+
+def apply_unified_diff(original: str, patch: str) -> str:
+    """Apply a unified diff, locating hunks by content so stale line numbers do not matter"""
+    hunks = parse_hunks(patch)
+    if not hunks:
+        raise PatchError("No diff hunks found in the model response")
+
+    lines = original.split('\n')
+    offset = 0
+    for expected_start, ops in hunks:
+        # Trailing blank context lines are often dropped or added by models; ignore them for matching
+        while ops and ops[-1] == (' ', ''):
+            ops = ops[:-1]
+        old_lines = [text for tag, text in ops if tag != '+']
+        position = _find_block(lines, old_lines, expected_start - 1 + offset)
+
+        # Context lines keep the original text, so indentation drift in the reply is not copied in
+        new_lines = []
+        cursor = position
+        for tag, text in ops:
+            if tag == ' ':
+                new_lines.append(lines[cursor])
+                cursor += 1
+            elif tag == '-':
+                cursor += 1
+            else:
+                new_lines.append(text)
+        lines[position:position + len(old_lines)] = new_lines
+        offset += len(new_lines) - len(old_lines)
+    return '\n'.join(lines)
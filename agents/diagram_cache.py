@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import time
+from typing import Dict, Any, Optional
+from agents import profiling
+
+class DiagramCache:
+    """Content-addressed code and render caches on a storage backend, so replicas share each other's work"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.stats = {"code_hits": 0, "code_misses": 0, "render_hits": 0, "render_misses": 0, "layout_hits": 0, "layout_misses": 0, "errors": 0}
+
+    @staticmethod
+    def code_key(user_prompt: str, prompt_version: str) -> str:
+        """Cache key for generated code: the prompt (whitespace-normalized) plus the system prompt it was sent with"""
+        normalized = ' '.join(user_prompt.split())
+        return hashlib.sha256(f"{prompt_version}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def _get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        """Read a JSON entry, treating any storage error as a miss"""
+        try:
+            data = self.storage.get(key)
+            return json.loads(data) if data else None
+        except Exception as e:
+            # A broken cache must never fail a request
+            print(f"Cache read failed for {key}: {e}")
+            self.stats["errors"] += 1
+            return None
+
+    def _put(self, key: str, data: bytes, content_type: str = None):
+        """Write an entry, logging rather than raising on storage errors"""
+        try:
+            self.storage.put(key, data, content_type)
+        except Exception as e:
+            print(f"Cache write failed for {key}: {e}")
+            self.stats["errors"] += 1
+
+    def get_code(self, key: str) -> Optional[Dict[str, Any]]:
+        """Previously generated (and successfully rendered) code for a prompt"""
+        entry = self._get_json(f"code/{key}.json")
+        self.stats["code_hits" if entry else "code_misses"] += 1
+        return entry
+
+    def put_code(self, key: str, diagram_code: str, model: str = None, graph_ir: Dict[str, Any] = None):
+        """Remember code that rendered successfully, plus the graph it was built from in graph IR mode"""
+        entry = {"diagram_code": diagram_code, "model": model, "created_at": time.time()}
+        if graph_ir:
+            entry["graph_ir"] = graph_ir
+        self._put(f"code/{key}.json", json.dumps(entry).encode('utf-8'), "application/json")
+
+    def get_render(self, code_hash: str, output_format: str) -> Optional[Dict[str, Any]]:
+        """Rendered bytes plus Graphviz layout for code already rendered in this format"""
+        manifest = self._get_json(f"renders/{code_hash}/{output_format}.json")
+        image_bytes = None
+        if manifest:
+            try:
+                image_bytes = self.storage.get(f"renders/{code_hash}/image.{output_format}")
+            except Exception as e:
+                print(f"Cache read failed for render {code_hash}: {e}")
+                self.stats["errors"] += 1
+        if not image_bytes:
+            self.stats["render_misses"] += 1
+            return None
+        self.stats["render_hits"] += 1
+        return {**manifest, "image_bytes": image_bytes}
+
+    def put_render(self, code_hash: str, output_format: str, image_bytes: bytes, image_mime: str, layout: Dict[str, Any] = None):
+        """Store a render; the image goes first so a visible manifest always has its bytes"""
+        self._put(f"renders/{code_hash}/image.{output_format}", image_bytes, image_mime)
+        manifest = {"image_format": output_format, "image_mime": image_mime, "layout": layout, "created_at": time.time()}
+        self._put(f"renders/{code_hash}/{output_format}.json", json.dumps(manifest).encode('utf-8'), "application/json")
+
+    def get_layout(self, topology_key: str) -> Optional[Dict[str, Any]]:
+        """Graphviz positions computed for a diagram with the same topology (labels may differ)"""
+        entry = self._get_json(f"layouts/{topology_key}.json")
+        self.stats["layout_hits" if entry else "layout_misses"] += 1
+        return entry
+
+    def put_layout(self, topology_key: str, layout: Dict[str, Any]):
+        """Remember node and cluster positions by call site for later label-only edits"""
+        self._put(f"layouts/{topology_key}.json", json.dumps(layout).encode('utf-8'), "application/json")
+
+    def put_artifact(self, key: str, data: bytes, content_type: str = None) -> Optional[str]:
+        """Copy a persisted artifact into shared storage; returns its location"""
+        self._put(f"artifacts/{key}", data, content_type)
+        return self.storage.location(f"artifacts/{key}")
+
+    # Async wrappers: storage calls are blocking (disk or S3), so keep them off the event loop
+    async def get_code_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """get_code on a worker thread"""
+        return await profiling.to_thread(self.get_code, key)
+
+    async def get_render_async(self, code_hash: str, output_format: str) -> Optional[Dict[str, Any]]:
+        """get_render on a worker thread"""
+        return await profiling.to_thread(self.get_render, code_hash, output_format)
+
+    async def get_layout_async(self, topology_key: str) -> Optional[Dict[str, Any]]:
+        """get_layout on a worker thread"""
+        return await profiling.to_thread(self.get_layout, topology_key)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters and the backend in use"""
+        return {**self.stats, "backend": type(self.storage).__name__, "shared": self.storage.shared}
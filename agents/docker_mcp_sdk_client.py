@@ -1,101 +1,157 @@
 #!/usr/bin/env python3
 import asyncio
+import base64
+import json
 import os
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from typing import Dict, Any
+import posixpath
+import uuid
+from typing import Dict, Any, Optional
 from agents.drawio_converter import DrawIOConverter
+from agents.artifact_writer import write_artifact, read_artifact, remove_artifact
+from agents.render_formats import render_formats_for, with_output_formats
+from agents.graphviz_layout import parse_dot_layout
+from agents.mcp_dispatcher import MCPBackend, MCPDispatcher
+
+IMAGE_MIME_TYPES = {".png": "image/png", ".svg": "image/svg+xml", ".jpg": "image/jpeg"}
 
 class DockerMCPSDKClient:
     """MCP Client that calls Docker container as MCP server using official SDK"""
-    
-    def __init__(self):
+
+    def __init__(self, container_name: str = "mcp-diagram-server", host_workspace: str = "outputs/diagrams", container_workspace: str = "/workspace",
+                 dispatcher: MCPDispatcher = None):
         self.drawio_converter = DrawIOConverter()
-    
-    async def call_diagram_server(self, diagram_code: str, filename: str = "architecture_diagram", workspace_dir: str = None) -> Dict[str, Any]:
-        """Call Docker MCP server using official MCP SDK"""
-        
+        # docker-compose mounts host_workspace at container_workspace inside the MCP server
+        self.dispatcher = dispatcher or MCPDispatcher([MCPBackend.from_spec(container_name, host_workspace, container_workspace)])
+
+    async def fetch_artifact(self, server_path: str, backend: MCPBackend) -> Optional[bytes]:
+        """Read a rendered artifact once into memory, via the shared volume or the container itself"""
+        host_path = backend.to_host_path(server_path)
+        if host_path and os.path.exists(host_path):
+            return await read_artifact(host_path)
+        returncode, data = await backend.docker_exec("cat", server_path)
+        return data if returncode == 0 and data else None
+
+    async def discard_artifact(self, server_path: str, backend: MCPBackend):
+        """Delete a privately named render artifact once its bytes are in memory"""
+        host_path = backend.to_host_path(server_path)
+        if host_path and await remove_artifact(host_path):
+            return
+        await backend.docker_exec("rm", "-f", server_path)
+
+    def parse_tool_result(self, result: Any) -> Dict[str, Any]:
+        """Extract text, inline image bytes and the reported container path from an MCP tool result"""
+        parsed = {"text": None, "container_path": None, "images": {}}
+        for content in getattr(result, 'content', None) or []:
+            content_type = getattr(content, 'type', None)
+            if content_type == 'image' and getattr(content, 'data', None):
+                # Servers that return ImageContent hand us the bytes directly
+                mime_type = getattr(content, 'mimeType', 'image/png')
+                fmt = 'svg' if 'svg' in mime_type else mime_type.split('/')[-1]
+                parsed["images"][fmt] = base64.b64decode(content.data)
+            elif hasattr(content, 'text'):
+                parsed["text"] = content.text
+                try:
+                    mcp_response = json.loads(content.text)
+                    if isinstance(mcp_response, dict) and mcp_response.get('path'):
+                        parsed["container_path"] = mcp_response['path']
+                except (ValueError, TypeError):
+                    pass
+        if parsed["text"] is None:
+            parsed["text"] = str(result)
+        return parsed
+
+    async def call_diagram_server(self, diagram_code: str, filename: str = "architecture_diagram", workspace_dir: str = None, persist: bool = True, output_format: str = "png",
+                                  previous_positions: Dict[str, Any] = None, timeout: float = None, with_drawio: bool = True,
+                                  render_code: str = None) -> Dict[str, Any]:
+        """Call Docker MCP server using official MCP SDK; with persist=False only in-memory bytes are kept, with_drawio=False leaves Draw.io to the caller, render_code overrides the code executed"""
+        try:
+            # Cancelling the render cancels the tool call; a per-call stdio session is torn down with it
+            return await asyncio.wait_for(
+                self._render(diagram_code, filename, workspace_dir, persist, output_format, previous_positions, with_drawio, render_code), timeout
+            )
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"MCP diagram server did not respond within {timeout:g}s", "timed_out": True}
+
+    async def call_tool(self, name: str, arguments):
+        """Call an MCP tool on the least-loaded healthy server; returns (result, backend)"""
+        return await self.dispatcher.call_tool(name, arguments)
+
+    async def _render(self, diagram_code: str, filename: str, workspace_dir: Optional[str], persist: bool, output_format: str,
+                      previous_positions: Optional[Dict[str, Any]], with_drawio: bool = True, render_code: str = None) -> Dict[str, Any]:
+        """Render through an MCP session and collect the artifacts"""
+
         if not workspace_dir:
             # Docker maps ./outputs/diagrams to /workspace, MCP saves to /workspace/generated-diagrams
             workspace_dir = os.path.abspath("outputs/diagrams/generated-diagrams")
         os.makedirs(workspace_dir, exist_ok=True)
-        
-        # Use persistent Docker container as MCP server
-        server_params = StdioServerParameters(
-            command="docker",
-            args=[
-                "exec", "-i",
-                "mcp-diagram-server",
-                "awslabs.aws-diagram-mcp-server"
-            ]
-        )
+
+        # Render the requested format plus the laid-out dot so DrawIO can reuse Graphviz coordinates
+        formats = render_formats_for(output_format)
+        render_code = with_output_formats(render_code or diagram_code, formats)
+        # Every render gets a private file name, so concurrent requests with the same name never read or delete each other's files
+        render_name = f"{filename}-{uuid.uuid4().hex[:12]}"
         
         try:
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    # Initialize MCP session
-                    await session.initialize()
-                    
-                    # Call generate_diagram tool
-                    result = await session.call_tool(
-                        "generate_diagram",
-                        {
-                            "code": diagram_code,
-                            "filename": filename,
-                            "workspace_dir": "/workspace"
-                        }
-                    )
-                    
-                    # Extract content from MCP result
-                    if hasattr(result, 'content') and result.content:
-                        content = result.content[0] if isinstance(result.content, list) else result.content
-                        result_text = content.text if hasattr(content, 'text') else str(content)
-                        
-                        # Parse the actual file path from MCP response
-                        import json
-                        try:
-                            mcp_response = json.loads(result_text)
-                            if 'path' in mcp_response:
-                                # MCP server saves to /workspace/generated-diagrams/filename.png
-                                # This maps to outputs/diagrams/generated-diagrams/filename.png
-                                container_path = mcp_response['path']
-                                if '/workspace/generated-diagrams/' in container_path:
-                                    filename_from_path = container_path.split('/')[-1]
-                                    actual_path = os.path.join("outputs", "diagrams", "generated-diagrams", filename_from_path)
-                                else:
-                                    actual_path = os.path.join(workspace_dir, f"{filename}.png")
-                            else:
-                                actual_path = os.path.join(workspace_dir, f"{filename}.png")
-                        except:
-                            actual_path = os.path.join(workspace_dir, f"{filename}.png")
-                        
-                        # Normalize path separators
-                        actual_path = os.path.normpath(actual_path)
-                        
-                        # Also create Draw.io version with diagram code
-                        drawio_result = self.drawio_converter.convert_to_drawio(actual_path, filename, diagram_code)
-                        
-                        return {
-                            "success": True, 
-                            "result": result_text, 
-                            "image_path": actual_path,
-                            "drawio_result": drawio_result
-                        }
-                    else:
-                        actual_path = os.path.join(workspace_dir, f"{filename}.png")
-                        
-                        # Also create Draw.io version with diagram code
-                        drawio_result = self.drawio_converter.convert_to_drawio(actual_path, filename, diagram_code)
-                        
-                        return {
-                            "success": True, 
-                            "result": str(result), 
-                            "image_path": actual_path,
-                            "drawio_result": drawio_result
-                        }
-                    
+            # Call generate_diagram tool; artifacts are then read from whichever server rendered them
+            result, backend = await self.call_tool(
+                "generate_diagram",
+                lambda backend: {
+                    "code": render_code,
+                    "filename": render_name,
+                    "workspace_dir": backend.workspace
+                }
+            )
+
+            parsed = self.parse_tool_result(result)
+            reported_path = parsed["container_path"] or posixpath.join(backend.workspace, "generated-diagrams", f"{render_name}.png")
+            # The server reports one path; sibling formats share its base name
+            container_base = posixpath.splitext(reported_path)[0]
+
+            images = parsed["images"]
+            for fmt in formats:
+                if fmt not in images:
+                    data = await self.fetch_artifact(f"{container_base}.{fmt}", backend)
+                    if data:
+                        images[fmt] = data
+
+            # The dot file is only an intermediate carrying layout coordinates
+            layout = parse_dot_layout(images.pop('dot').decode('utf-8', errors='replace')) if 'dot' in images else None
+            if 'dot' in formats:
+                await self.discard_artifact(f"{container_base}.dot", backend)
+
+            if not images:
+                # The tool answered but wrote nothing, e.g. Graphviz failed; its message says why
+                return {"success": False, "error": f"Diagram server produced no image: {parsed['text']}"}
+            image_format = output_format if output_format in images else next(iter(images))
+            container_path = f"{container_base}.{image_format}"
+            image_path = backend.to_host_path(container_path) or os.path.join(workspace_dir, f"{render_name}.{image_format}")
+            if persist:
+                # Persisted renders are published under the shared name in one atomic write, like the render sandbox does
+                image_path = os.path.join(os.path.dirname(image_path), f"{filename}.{image_format}")
+                await write_artifact(image_path, images[image_format])
+
+            # Also create Draw.io version with diagram code
+            drawio_result = await self.drawio_converter.convert_to_drawio_async(image_path, filename, diagram_code, persist=persist, layout=layout,
+                                                                              previous_positions=previous_positions) if with_drawio else None
+            await self.discard_artifact(container_path, backend)
+            if not persist:
+                image_path = None
+
+            return {
+                "success": True,
+                "result": parsed["text"],
+                "image_path": image_path,
+                "image_bytes": images.get(image_format),
+                "image_format": image_format,
+                "image_mime": IMAGE_MIME_TYPES.get(f".{image_format}"),
+                "svg_bytes": images.get('svg'),
+                "layout": layout,
+                "persisted": persist,
+                "drawio_result": drawio_result
+            }
+
         except Exception as e:
             return {"success": False, "error": str(e)}
-    
+
     async def call_rekognition_server(self, image_path: str, operation: str) -> Dict[str, Any]:
-        return {"success": False, "error": "Rekognition not implemented"}
\ No newline at end of file
+        return {"success": False, "error": "Rekognition not implemented"}
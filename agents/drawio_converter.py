@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
 import os
 import base64
+import html
+import io
 import json
-from typing import Dict, Any, List
+import keyword
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from functools import cached_property
+from typing import Dict, Any, List, Optional
 import sys
 sys.path.append('..')
 from config.aws_config import AWSConfig
+from agents import profiling
+from agents.artifact_writer import atomic_write
+from agents.graphviz_layout import layout_positions_by_label
+from agents.drawio_format import compress_mxfile, compressed_by_default, decompress_diagram
+from agents.graph_ir import NODE_TYPES, GraphIRError, graph_ir_to_code, validate_graph_ir
 
 class DrawIOConverter:
     """Convert PNG diagrams to Draw.io format with enhanced AWS service detection"""
     
-    def __init__(self):
+    def __init__(self, compressed: bool = None):
         self.aws_config = AWSConfig()
-        self.bedrock = self.aws_config.get_bedrock_client()
+        # Compressed pages (deflate+base64, as draw.io saves them) are a fraction of the size; DRAWIO_COMPRESSED=1 turns them on
+        self.compressed = compressed_by_default(compressed)
         
         # Comprehensive service templates for DrawIO (AWS + other packages)
         self.aws_services = {
@@ -92,6 +105,11 @@ class DrawIOConverter:
             'react': {'shape': 'mxgraph.programming.react', 'fillColor': '#61DAFB', 'label': 'React'}
         }
     
+    @cached_property
+    def bedrock(self):
+        """Bedrock client, only built if a conversion path actually needs it"""
+        return self.aws_config.get_bedrock_client()
+    
     def detect_services_from_code(self, diagram_code: str) -> List[str]:
         """Detect AWS services from Python diagram code"""
         detected_services = []
@@ -153,18 +171,26 @@ class DrawIOConverter:
         """Parse clusters, services, and connections from diagram code"""
         lines = diagram_code.split('\n')
         clusters = {}  # cluster_name -> {services: [], label: str}
-        services = {}  # service_var -> {type: str, cluster: str}
+        services = {}  # service_var -> {type: str, cluster: str, label: str}
         connections = []
         current_cluster = None
+        cluster_stack = []  # (indent, cluster_name) for the enclosing with Cluster blocks
         
         # Parse clusters and services
         for line in lines:
+            indent = len(line) - len(line.lstrip())
             line = line.strip()
             
+            # Leaving a with Cluster block once indentation drops back to its level
+            while line and cluster_stack and indent <= cluster_stack[-1][0]:
+                cluster_stack.pop()
+                current_cluster = cluster_stack[-1][1] if cluster_stack else None
+            
             # Detect cluster start: with Cluster("name"):
             if 'with Cluster(' in line and ':' in line:
                 cluster_match = line.split('Cluster(')[1].split(')')[0].strip('"\'')
                 current_cluster = cluster_match
+                cluster_stack.append((indent, cluster_match))
                 clusters[current_cluster] = {'services': [], 'label': cluster_match}
             
             # Detect service assignments
@@ -176,9 +202,11 @@ class DrawIOConverter:
                     'Athena(': 'athena', 'RDS(': 'rds', 'SQS(': 'sqs', 'SNS(': 'sns',
                     'EMR(': 'emr', 'Redshift(': 'redshift', 'ELB(': 'elb', 'CloudFront(': 'cloudfront'
                 }
+                label_match = re.search(r'\(\s*(?:label\s*=\s*)?["\']([^"\']*)["\']', line)
                 for pattern, service_type in service_patterns.items():
                     if pattern in line:
-                        services[var_name] = {'type': service_type, 'cluster': current_cluster}
+                        services[var_name] = {'type': service_type, 'cluster': current_cluster,
+                                              'label': label_match.group(1) if label_match else ''}
                         if current_cluster and current_cluster in clusters:
                             clusters[current_cluster]['services'].append(var_name)
                         break
@@ -289,7 +317,7 @@ class DrawIOConverter:
     
     def create_cluster_xml(self, cluster_name: str, cell_id: int, x: int, y: int, width: int, height: int) -> str:
         """Create XML for a cluster/group container"""
-        return f'''        <mxCell id="{cell_id}" value="{cluster_name}" style="swimlane;whiteSpace=wrap;html=1;fillColor=#e1d5e7;strokeColor=#9673a6;fontStyle=1;startSize=30;" vertex="1" parent="1">
+        return f'''        <mxCell id="{cell_id}" value="{escape(cluster_name, {'"': '&quot;'})}" style="swimlane;whiteSpace=wrap;html=1;fillColor=#e1d5e7;strokeColor=#9673a6;fontStyle=1;startSize=30;" vertex="1" parent="1">
           <mxGeometry x="{x}" y="{y}" width="{width}" height="{height}" as="geometry"/>
         </mxCell>'''
     
@@ -379,9 +407,149 @@ class DrawIOConverter:
           </mxGeometry>
         </mxCell>'''
     
-    def create_layered_drawio_xml(self, diagram_name: str, diagram_code: str) -> str:
-        """Create DrawIO XML with optimized layout and connector positioning"""
+    def wrap_mxfile(self, diagram_name: str, content: str, dx: int = 1800, dy: int = 1000, page_width: int = 1600, page_height: int = 1200) -> str:
+        """Wrap mxCell content in a complete single-page mxfile document"""
+        return f'''<mxfile host="app.diagrams.net" modified="2024-01-01T00:00:00.000Z" agent="5.0 (Windows)" version="22.1.11" etag="generated" type="device">
+  <diagram name="{diagram_name}" id="generated">
+    <mxGraphModel dx="{dx}" dy="{dy}" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="{page_width}" pageHeight="{page_height}" math="0" shadow="0">
+      <root>
+        <mxCell id="0"/>
+        <mxCell id="1" parent="0"/>
+{content}
+      </root>
+    </mxGraphModel>
+  </diagram>
+</mxfile>'''
+    
+    def create_positioned_drawio_xml(self, diagram_name: str, parsed: Dict[str, Any], absolute: Dict[str, tuple]) -> str:
+        """Create DrawIO XML from absolute service positions, sizing cluster boxes around their members"""
+        clusters = parsed['clusters']
+        services = parsed['services']
+        
+        all_xml = []
+        service_positions = {}  # service_var -> (cell_id, x, y)
+        cell_id = 2
+        padding = 30
+        header = 30
+        
+        for cluster_name, cluster_data in clusters.items():
+            members = [svc for svc in cluster_data['services'] if svc in absolute]
+            if not members:
+                continue
+            min_x = min(absolute[svc][0] for svc in members) - padding
+            min_y = min(absolute[svc][1] for svc in members) - padding - header
+            max_x = max(absolute[svc][0] for svc in members) + 78 + padding
+            max_y = max(absolute[svc][1] for svc in members) + 78 + padding
+            
+            cluster_id = cell_id
+            cell_id += 1
+            all_xml.append(self.create_cluster_xml(cluster_name, cluster_id, min_x, min_y, max_x - min_x, max_y - min_y))
+            
+            for service_var in members:
+                x, y = absolute[service_var]
+                all_xml.append(self.create_service_xml_in_cluster(services[service_var]['type'], cell_id, x - min_x, y - min_y, cluster_id))
+                service_positions[service_var] = (cell_id, x, y)
+                cell_id += 1
+        
+        for service_var, (x, y) in absolute.items():
+            if service_var not in service_positions:
+                all_xml.append(self.create_service_xml(services[service_var]['type'], cell_id, x, y))
+                service_positions[service_var] = (cell_id, x, y)
+                cell_id += 1
+        
+        for source_var, target_var in parsed['connections']:
+            if source_var in service_positions and target_var in service_positions:
+                source_id, sx, sy = service_positions[source_var]
+                target_id, tx, ty = service_positions[target_var]
+                all_xml.append(self.create_optimized_connection_xml(cell_id, source_id, target_id, (sx, sy), (tx, ty)))
+                cell_id += 1
+        
+        width = max((x for _, x, _ in service_positions.values()), default=0) + 200
+        height = max((y for _, _, y in service_positions.values()), default=0) + 200
+        return self.wrap_mxfile(diagram_name, '\n'.join(all_xml), page_width=max(1600, width), page_height=max(1200, height))
+    
+    def create_graphviz_layout_drawio_xml(self, diagram_name: str, diagram_code: str, positions: Dict[str, tuple], positions_out: Dict[str, tuple] = None) -> Optional[str]:
+        """Create DrawIO XML placing services at the coordinates Graphviz computed for the rendered diagram"""
+        parsed = self.parse_clusters_and_services(diagram_code)
+        services = parsed['services']
+        
+        absolute = {}  # service_var -> (x, y)
+        for service_var, service_data in services.items():
+            label = ' '.join(service_data['label'].split())
+            if label in positions:
+                absolute[service_var] = positions[label]
+        if not absolute:
+            return None
+        
+        # Services Graphviz did not report (e.g. unlabeled) go on a row below the laid-out graph
+        spill_y = max(y for _, y in absolute.values()) + 200
+        spill_x = 50
+        for service_var in services:
+            if service_var not in absolute:
+                absolute[service_var] = (spill_x, spill_y)
+                spill_x += 180
+        
+        if positions_out is not None:
+            positions_out.update(absolute)
+        return self.create_positioned_drawio_xml(diagram_name, parsed, absolute)
+    
+    def place_new_services(self, parsed: Dict[str, Any], kept: Dict[str, tuple]) -> Dict[str, tuple]:
+        """Position only services missing from kept, next to the neighbours they connect to"""
+        absolute = dict(kept)
+        occupied = set(absolute.values())
+        new_services = [svc for svc in parsed['services'] if svc not in absolute]
+        
+        def free_spot(x: int, y: int) -> tuple:
+            # Nudge downwards until the 78px icon no longer overlaps an existing one
+            while any(abs(x - ox) < 100 and abs(y - oy) < 100 for ox, oy in occupied):
+                y += 120
+            return x, y
+        
+        # Resolve services whose neighbours are already placed first, so chains grow outward
+        pending = list(new_services)
+        while pending:
+            progress = False
+            for service_var in list(pending):
+                sources = [absolute[s] for s, t in parsed['connections'] if t == service_var and s in absolute]
+                targets = [absolute[t] for s, t in parsed['connections'] if s == service_var and t in absolute]
+                if sources and targets:
+                    # Inserted between two existing services: midway, offset below the line
+                    x = (sources[0][0] + targets[0][0]) // 2
+                    y = (sources[0][1] + targets[0][1]) // 2 + 120
+                elif sources:
+                    x, y = sources[0][0] + 180, sources[0][1]
+                elif targets:
+                    x, y = targets[0][0] - 180, targets[0][1]
+                else:
+                    continue
+                absolute[service_var] = free_spot(max(x, 50), max(y, 80))
+                occupied.add(absolute[service_var])
+                pending.remove(service_var)
+                progress = True
+            if not progress:
+                # Disconnected newcomers go on a row below everything else
+                base_y = max((y for _, y in absolute.values()), default=0) + 200
+                for index, service_var in enumerate(pending):
+                    absolute[service_var] = free_spot(50 + index * 180, base_y)
+                    occupied.add(absolute[service_var])
+                pending = []
+        return absolute
+    
+    def create_incremental_drawio_xml(self, diagram_name: str, diagram_code: str, previous_positions: Dict[str, tuple], positions_out: Dict[str, tuple] = None) -> Optional[str]:
+        """Re-layout only the affected subgraph: unchanged services keep their previous coordinates"""
         parsed = self.parse_clusters_and_services(diagram_code)
+        kept = {var: tuple(pos) for var, pos in previous_positions.items() if var in parsed['services']}
+        if not kept:
+            return None
+        absolute = self.place_new_services(parsed, kept)
+        if positions_out is not None:
+            positions_out.update(absolute)
+        return self.create_positioned_drawio_xml(diagram_name, parsed, absolute)
+    
+    def create_layered_drawio_xml(self, diagram_name: str, diagram_code: str, positions_out: Dict[str, tuple] = None,
+                                  parsed: Dict[str, Any] = None) -> str:
+        """Create DrawIO XML with optimized layout and connector positioning; parsed skips re-parsing the code"""
+        parsed = parsed or self.parse_clusters_and_services(diagram_code)
         clusters = parsed['clusters']
         services = parsed['services']
         connections = parsed['connections']
@@ -490,17 +658,9 @@ class DrawIOConverter:
         
         content = '\n'.join(all_xml)
         
-        return f'''<mxfile host="app.diagrams.net" modified="2024-01-01T00:00:00.000Z" agent="5.0 (Windows)" version="22.1.11" etag="generated" type="device">
-  <diagram name="{diagram_name}" id="generated">
-    <mxGraphModel dx="1800" dy="1000" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="1600" pageHeight="1200" math="0" shadow="0">
-      <root>
-        <mxCell id="0"/>
-        <mxCell id="1" parent="0"/>
-{content}
-      </root>
-    </mxGraphModel>
-  </diagram>
-</mxfile>'''
+        if positions_out is not None:
+            positions_out.update({var: (x, y) for var, (_, x, y) in service_positions.items()})
+        return self.wrap_mxfile(diagram_name, content)
     
     def create_enhanced_drawio_xml(self, diagram_name: str, services: List[str], connections: List[tuple] = None) -> str:
         """Create enhanced DrawIO XML with optimized flat layout"""
@@ -561,62 +721,258 @@ class DrawIOConverter:
         services_content = '\n'.join(services_xml)
         connections_content = '\n'.join(connections_xml)
         
-        return f'''<mxfile host="app.diagrams.net" modified="2024-01-01T00:00:00.000Z" agent="5.0 (Windows)" version="22.1.11" etag="generated" type="device">
-  <diagram name="{diagram_name}" id="generated">
-    <mxGraphModel dx="1600" dy="900" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="1400" pageHeight="1000" math="0" shadow="0">
-      <root>
-        <mxCell id="0"/>
-        <mxCell id="1" parent="0"/>
-{services_content}
-{connections_content}
-      </root>
-    </mxGraphModel>
-  </diagram>
-</mxfile>'''
+        return self.wrap_mxfile(diagram_name, f"{services_content}\n{connections_content}", dx=1600, dy=900, page_width=1400, page_height=1000)
     
     def create_working_drawio_xml(self, diagram_name: str) -> str:
         """Create basic DrawIO XML template (legacy method)"""
         return self.create_enhanced_drawio_xml(diagram_name, ['lambda', 's3'], None)
     
-    def convert_to_drawio(self, png_path: str, diagram_name: str, diagram_code: str = None) -> Dict[str, Any]:
-        """Convert PNG to Draw.io format using diagram code metadata with cluster support"""
+    def build_drawio_xml(self, png_path: str, diagram_name: str, diagram_code: str = None, layout: Dict[str, Any] = None,
+                         previous_positions: Dict[str, tuple] = None, positions_out: Dict[str, tuple] = None) -> tuple:
+        """Build Draw.io XML in memory; returns (drawio_xml, detected_services, detection_method)"""
+        if diagram_code and previous_positions:
+            # Edits keep the existing layout and only place what changed
+            drawio_xml = self.create_incremental_drawio_xml(diagram_name, diagram_code, previous_positions, positions_out)
+            if drawio_xml:
+                parsed = self.parse_clusters_and_services(diagram_code)
+                return drawio_xml, [s['type'] for s in parsed['services'].values()], "incremental"
+        
+        if diagram_code and layout:
+            # Reuse the coordinates Graphviz already computed when rendering the image
+            drawio_xml = self.create_graphviz_layout_drawio_xml(diagram_name, diagram_code, layout_positions_by_label(layout), positions_out)
+            if drawio_xml:
+                parsed = self.parse_clusters_and_services(diagram_code)
+                return drawio_xml, [s['type'] for s in parsed['services'].values()], "graphviz_layout"
+        
+        if diagram_code:
+            # Check if diagram has clusters
+            if 'with Cluster(' in diagram_code:
+                # Use layered approach for cluster-based diagrams
+                drawio_xml = self.create_layered_drawio_xml(diagram_name, diagram_code, positions_out)
+                parsed = self.parse_clusters_and_services(diagram_code)
+                detected_services = [s['type'] for s in parsed['services'].values()]
+                detection_method = "layered_diagram_code"
+            else:
+                # Use flat approach for simple diagrams
+                detected_services = self.detect_services_from_code(diagram_code)
+                service_connections = self.parse_service_flow(diagram_code)
+                drawio_xml = self.create_enhanced_drawio_xml(diagram_name, detected_services, service_connections)
+                detection_method = "flat_diagram_code"
+        else:
+            # Fallback to filename detection
+            detected_services = self.detect_services_from_filename(png_path)
+            drawio_xml = self.create_enhanced_drawio_xml(diagram_name, detected_services, None)
+            detection_method = "filename"
+        return drawio_xml, detected_services, detection_method
+    
+    def convert_to_drawio(self, png_path: str, diagram_name: str, diagram_code: str = None, persist: bool = True, layout: Dict[str, Any] = None,
+                          previous_positions: Dict[str, tuple] = None) -> Dict[str, Any]:
+        """Convert a rendered diagram (PNG or SVG) to Draw.io format using diagram code metadata with cluster support"""
         
-        if not os.path.exists(png_path):
-            return {"success": False, "error": "PNG file not found"}
+        # In-memory conversion works from the code alone; writing a file needs the rendered image
+        if persist and not os.path.exists(png_path):
+            return {"success": False, "error": "Rendered image file not found"}
         
         try:
-            if diagram_code:
-                # Check if diagram has clusters
-                if 'with Cluster(' in diagram_code:
-                    # Use layered approach for cluster-based diagrams
-                    drawio_xml = self.create_layered_drawio_xml(diagram_name, diagram_code)
-                    parsed = self.parse_clusters_and_services(diagram_code)
-                    detected_services = [s['type'] for s in parsed['services'].values()]
-                    detection_method = "layered_diagram_code"
-                else:
-                    # Use flat approach for simple diagrams
-                    detected_services = self.detect_services_from_code(diagram_code)
-                    service_connections = self.parse_service_flow(diagram_code)
-                    drawio_xml = self.create_enhanced_drawio_xml(diagram_name, detected_services, service_connections)
-                    detection_method = "flat_diagram_code"
-            else:
-                # Fallback to filename detection
-                detected_services = self.detect_services_from_filename(png_path)
-                drawio_xml = self.create_enhanced_drawio_xml(diagram_name, detected_services, None)
-                detection_method = "filename"
-            
-            # Save as .drawio file
-            drawio_path = png_path.replace('.png', '.drawio')
-            with open(drawio_path, 'w', encoding='utf-8') as f:
-                f.write(drawio_xml)
-            
-            return {
-                "success": True,
-                "drawio_path": drawio_path,
-                "detected_services": detected_services,
-                "detection_method": detection_method,
-                "message": f"Draw.io file created using {detection_method} with services: {', '.join(detected_services)}"
-            }
+            positions = {}
+            drawio_xml, detected_services, detection_method = self.build_drawio_xml(png_path, diagram_name, diagram_code, layout, previous_positions, positions)
+            return self.drawio_result(png_path, drawio_xml, detected_services, detection_method, positions, persist)
             
         except Exception as e:
-            return {"success": False, "error": str(e)}
\ No newline at end of file
+            return {"success": False, "error": str(e)}
+    
+    def build_graph_drawio_xml(self, diagram_name: str, parsed: Dict[str, Any], previous_positions: Dict[str, tuple] = None) -> tuple:
+        """Build Draw.io XML straight from a structured graph (no code parsing); returns (drawio_xml, detected_services, positions)"""
+        positions = {}
+        kept = {var: tuple(pos) for var, pos in (previous_positions or {}).items() if var in parsed['services']}
+        if kept:
+            # Imported or edited graphs keep their existing coordinates; only new services are placed
+            positions = self.place_new_services(parsed, kept)
+            return self.create_positioned_drawio_xml(diagram_name, parsed, positions), [s['type'] for s in parsed['services'].values()], positions
+        drawio_xml = self.create_layered_drawio_xml(diagram_name, None, positions, parsed=parsed)
+        return drawio_xml, [s['type'] for s in parsed['services'].values()], positions
+    
+    def drawio_result(self, png_path: Optional[str], drawio_xml: str, detected_services: List[str], detection_method: str,
+                      positions: Dict[str, tuple], persist: bool = True) -> Dict[str, Any]:
+        """Package built XML as a conversion result, saving it next to the rendered image when persisting"""
+        if self.compressed:
+            drawio_xml = compress_mxfile(drawio_xml)
+        result = {
+            "success": True,
+            "detected_services": detected_services,
+            "detection_method": detection_method,
+            # service_var -> [x, y], fed back in as previous_positions when the diagram is edited
+            "positions": {var: list(pos) for var, pos in positions.items()},
+            "compressed": self.compressed,
+            "message": f"Draw.io file created using {detection_method} with services: {', '.join(detected_services)}"
+        }
+        if persist and png_path:
+            # Save as .drawio file next to the rendered image
+            drawio_path = os.path.splitext(png_path)[0] + '.drawio'
+            atomic_write(drawio_path, drawio_xml)
+            result["drawio_path"] = drawio_path
+        else:
+            result["drawio_xml"] = drawio_xml
+        return result
+    
+    async def convert_to_drawio_async(self, png_path: str, diagram_name: str, diagram_code: str = None, persist: bool = True, layout: Dict[str, Any] = None,
+                                      previous_positions: Dict[str, tuple] = None) -> Dict[str, Any]:
+        """Run convert_to_drawio on a worker thread so XML building and file writes stay off the event loop"""
+        return await profiling.to_thread(self.convert_to_drawio, png_path, diagram_name, diagram_code, persist, layout, previous_positions)
+    
+    @cached_property
+    def reverse_shape_index(self) -> Dict[str, str]:
+        """mxgraph shape name -> service key, the inverse of aws_services"""
+        return {service['shape']: key for key, service in self.aws_services.items()}
+    
+    def service_for_style(self, style: str) -> Optional[str]:
+        """Service key for a vertex style; draw.io's own AWS library wraps icons as resourceIcon;resIcon=<shape>"""
+        attributes = dict(part.split('=', 1) for part in style.split(';') if '=' in part)
+        for shape in (attributes.get('resIcon'), attributes.get('shape')):
+            if shape in self.reverse_shape_index:
+                return self.reverse_shape_index[shape]
+        return None
+    
+    @staticmethod
+    def _plain_label(value: Optional[str]) -> str:
+        """Cell labels may be HTML (html=1); keep the text only"""
+        text = re.sub(r'<br\s*/?>', ' ', value or '', flags=re.IGNORECASE)
+        return ' '.join(html.unescape(re.sub(r'<[^>]+>', ' ', text)).split())
+    
+    def _iter_cells(self, source, page: int):
+        """Stream (attributes, geometry) for every cell on one page, keeping only the current element in memory"""
+        page_index = -1
+        in_page = True  # a bare <mxGraphModel> file has no <diagram> wrapper
+        stack = []
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == 'diagram':
+                    page_index += 1
+                    in_page = page_index == page
+                stack.append(elem)
+                continue
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if elem.tag == 'diagram':
+                if in_page and len(elem) == 0 and (elem.text or '').strip():
+                    # Compressed page: inflate just this page and stream it the same way
+                    yield from self._iter_cells(io.StringIO(decompress_diagram(elem.text)), 0)
+                elem.clear()
+            elif not in_page:
+                if elem.tag in ('mxCell', 'object', 'UserObject'):
+                    elem.clear()
+                    if parent is not None:
+                        parent.remove(elem)
+            elif elem.tag == 'mxCell' and (parent is None or parent.tag not in ('object', 'UserObject')):
+                yield dict(elem.attrib), self._geometry(elem)
+                elem.clear()
+                if parent is not None:
+                    parent.remove(elem)
+            elif elem.tag in ('object', 'UserObject'):
+                # Cells with custom properties: id and label live on the wrapper, style and geometry on the inner mxCell
+                cell = elem.find('mxCell')
+                if cell is not None:
+                    attributes = {**cell.attrib, 'id': elem.get('id'), 'value': elem.get('label', elem.get('value', ''))}
+                    yield attributes, self._geometry(cell)
+                elem.clear()
+                if parent is not None:
+                    parent.remove(elem)
+    
+    @staticmethod
+    def _geometry(cell) -> tuple:
+        """(x, y, width, height) of a cell, relative to its parent"""
+        geometry = cell.find('mxGeometry')
+        if geometry is None:
+            return (0.0, 0.0, 0.0, 0.0)
+        return tuple(float(geometry.get(key, 0) or 0) for key in ('x', 'y', 'width', 'height'))
+    
+    def drawio_to_graph_ir(self, source, page: int = 0) -> Dict[str, Any]:
+        """Parse a (possibly compressed) .drawio file or file object into graph IR plus the hand-placed positions"""
+        vertices = {}  # cell id -> (label, style, parent, x, y); only what the graph needs, not the XML attributes
+        edges = []
+        edge_labels = {}
+        for attributes, (x, y, _, _) in self._iter_cells(source, page):
+            style = attributes.get('style', '')
+            label = self._plain_label(attributes.get('value'))
+            if attributes.get('edge') == '1':
+                edges.append((attributes.get('id'), attributes.get('source'), attributes.get('target'), label))
+            elif attributes.get('vertex') == '1':
+                if style.startswith('edgeLabel'):
+                    # A label dragged along an edge is a child cell of that edge
+                    edge_labels[attributes.get('parent')] = label
+                elif not style.startswith('text;'):
+                    # Free text boxes are annotations, not services
+                    vertices[attributes.get('id')] = (label, style, attributes.get('parent'), x, y)
+        
+        cluster_cells = {cell_id for cell_id, (_, style, _, _, _) in vertices.items() if 'swimlane' in style or style.startswith('group')}
+        used_ids = set()
+        
+        def python_id(label: str, fallback: str) -> str:
+            base = re.sub(r'[^a-z0-9]+', '_', label.lower()).strip('_')[:40] or fallback
+            if base[0].isdigit() or keyword.iskeyword(base):
+                base = f"{fallback}_{base}"
+            candidate, suffix = base, 2
+            while candidate in used_ids:
+                candidate, suffix = f"{base}_{suffix}", suffix + 1
+            used_ids.add(candidate)
+            return candidate
+        
+        ids = {}
+        clusters = []
+        for cell_id in cluster_cells:
+            label, _, parent, _, _ = vertices[cell_id]
+            ids[cell_id] = python_id(label or 'Group', 'cluster')
+            clusters.append({'id': ids[cell_id], 'label': label or 'Group', 'parent': parent})
+        for cluster in clusters:
+            cluster['parent'] = ids.get(cluster['parent']) if cluster['parent'] in cluster_cells else None
+        
+        nodes = []
+        unmapped = {}
+        for cell_id, (label, style, parent, _, _) in vertices.items():
+            if cell_id in cluster_cells:
+                continue
+            service_key = self.service_for_style(style)
+            if service_key not in NODE_TYPES:
+                # Shapes without a diagrams class become generic servers, keeping their label
+                shape = re.search(r'(?:resIcon|shape)=([^;]+)', style)
+                shape_name = shape.group(1) if shape else 'plain'
+                unmapped[shape_name] = unmapped.get(shape_name, 0) + 1
+                service_key = 'server'
+            label = label or self.aws_services.get(service_key, {}).get('label', service_key)
+            ids[cell_id] = python_id(label, service_key)
+            nodes.append({'id': ids[cell_id], 'type': service_key, 'label': label,
+                          'cluster': ids.get(parent) if parent in cluster_cells else None})
+        
+        # Child geometry is relative to the containing group, so add up the offsets of enclosing clusters
+        def absolute(cell_id: str) -> tuple:
+            _, _, parent, x, y = vertices[cell_id]
+            if parent in cluster_cells:
+                px, py = absolute(parent)
+                return px + x, py + y
+            return x, y
+        positions = {ids[cell_id]: tuple(int(round(v)) for v in absolute(cell_id))
+                     for cell_id in vertices if cell_id not in cluster_cells}
+        
+        graph_edges = [{'source': ids[start], 'target': ids[end], 'label': label or edge_labels.get(edge_id, '')}
+                       for edge_id, start, end, label in edges
+                       if start in ids and end in ids and start not in cluster_cells and end not in cluster_cells]
+        source_name = source if isinstance(source, str) else getattr(source, 'name', None)
+        title = os.path.splitext(os.path.basename(source_name))[0] if source_name else 'Imported diagram'
+        graph = validate_graph_ir({'title': title, 'clusters': clusters, 'nodes': nodes, 'edges': graph_edges}, max_nodes=None)
+        return {'graph': graph, 'positions': positions, 'unmapped_shapes': unmapped}
+    
+    def import_drawio(self, source, page: int = 0) -> Dict[str, Any]:
+        """Turn a hand-edited .drawio file back into diagrams code, graph IR and positions for re-rendering"""
+        try:
+            imported = self.drawio_to_graph_ir(source, page)
+        except (ET.ParseError, GraphIRError, ValueError, OSError) as e:
+            return {"success": False, "error": f"Could not import Draw.io file: {e}"}
+        graph = imported['graph']
+        return {
+            "success": True,
+            "diagram_code": graph_ir_to_code(graph),
+            "graph_ir": graph,
+            "positions": {var: list(pos) for var, pos in imported['positions'].items()},
+            "unmapped_shapes": imported['unmapped_shapes'],
+            "message": f"Imported {len(graph['nodes'])} services, {len(graph['clusters'])} clusters and {len(graph['edges'])} connections"
+        }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import os
+import re
+import zlib
+from typing import Dict, Any, Iterable, Optional
+from urllib.parse import quote, unquote
+from xml.sax.saxutils import quoteattr, unescape
+from agents.artifact_writer import create_temp_file
+
+MXFILE_HEADER = '<mxfile host="app.diagrams.net" agent="mcp-diagram-generation" type="device">\n'
+
+# One <diagram> page: its attributes and body (an mxGraphModel element or compressed text)
+_DIAGRAM = re.compile(r'<diagram\b([^>]*)>(.*?)</diagram>', re.DOTALL)
+_NAME = re.compile(r'\bname=(?:"([^"]*)"|\'([^\']*)\')')
+_GRAPH_MODEL = re.compile(r'<mxGraphModel\b.*</mxGraphModel>', re.DOTALL)
+
+def compressed_by_default(value: Optional[bool] = None) -> bool:
+    """Explicit choice, else DRAWIO_COMPRESSED=1 in the environment"""
+    if value is not None:
+        return value
+    return os.environ.get("DRAWIO_COMPRESSED", "0").lower() in ("1", "true", "yes")
+
+def compress_diagram(model_xml: str) -> str:
+    """Encode an mxGraphModel the way draw.io stores compressed pages: URI-encode, raw deflate, base64"""
+    # encodeURIComponent leaves these unescaped; draw.io decodes with decodeURIComponent
+    encoded = quote(model_xml, safe="~()*!.'").encode('ascii')
+    deflater = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return base64.b64encode(deflater.compress(encoded) + deflater.flush()).decode('ascii')
+
+def decompress_diagram(data: str) -> str:
+    """Decode a compressed draw.io page back to its mxGraphModel XML"""
+    return unquote(zlib.decompress(base64.b64decode(data.strip()), -15).decode('ascii'))
+
+def is_compressed_page(body: str) -> bool:
+    """True when a <diagram> body holds compressed text rather than an mxGraphModel element"""
+    return not body.lstrip().startswith('<')
+
+def compress_mxfile(mxfile_xml: str) -> str:
+    """Rewrite every page of an mxfile document in compressed form"""
+    def replace(match):
+        body = match.group(2)
+        if is_compressed_page(body):
+            return match.group(0)
+        model = _GRAPH_MODEL.search(body)
+        if not model:
+            return match.group(0)
+        return f'<diagram{match.group(1)}>{compress_diagram(_compact(model.group(0)))}</diagram>'
+    return _DIAGRAM.sub(replace, mxfile_xml)
+
+def _compact(model_xml: str) -> str:
+    """Drop the pretty-printing indentation between elements"""
+    return re.sub(r'>\s+<', '><', model_xml.strip())
+
+def iter_pages(mxfile_xml: str):
+    """Yield (name, mxGraphModel XML) for each page, decompressing as needed"""
+    for match in _DIAGRAM.finditer(mxfile_xml):
+        name = _NAME.search(match.group(1))
+        body = match.group(2)
+        if is_compressed_page(body):
+            model_xml = decompress_diagram(body)
+        else:
+            model = _GRAPH_MODEL.search(body)
+            model_xml = model.group(0) if model else ''
+        yield (unescape(name.group(1) or name.group(2) or '', {'&quot;': '"', '&apos;': "'"}) if name else None), model_xml
+
+class DrawioBundleWriter:
+    """Stream diagrams into one multi-page .drawio file, one page in memory at a time"""
+
+    def __init__(self, path: str, compressed: bool = True):
+        self.path = path
+        self.compressed = compressed
+        self.pages = 0
+        self._file = None
+        self._temp_path = None
+
+    def __enter__(self) -> "DrawioBundleWriter":
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Written beside the target and renamed on close, like atomic_write, so readers never see half a bundle
+        fd, self._temp_path = create_temp_file(self.path)
+        self._file = os.fdopen(fd, 'w', encoding='utf-8')
+        self._file.write(MXFILE_HEADER)
+        return self
+
+    def add_page(self, mxfile_xml: str, name: str = None):
+        """Append the page(s) of a single .drawio document; name overrides the page title of a one-page file"""
+        single_page = sum(1 for _ in _DIAGRAM.finditer(mxfile_xml)) == 1
+        for index, (page_name, model_xml) in enumerate(iter_pages(mxfile_xml), 1):
+            self.pages += 1
+            # Pages of a multi-page file keep their own titles; name only fills in untitled ones
+            if single_page and name:
+                title = name
+            else:
+                title = page_name or (f"{name} {index}" if name else f"Page {self.pages}")
+            body = compress_diagram(_compact(model_xml)) if self.compressed else model_xml
+            self._file.write(f'  <diagram name={quoteattr(title)} id="page-{self.pages}">{body}</diagram>\n')
+
+    def add_file(self, drawio_path: str, name: str = None):
+        """Append the page(s) of a .drawio file on disk, named after the file unless given a name"""
+        with open(drawio_path, 'r', encoding='utf-8') as f:
+            mxfile_xml = f.read()
+        self.add_page(mxfile_xml, name or os.path.splitext(os.path.basename(drawio_path))[0])
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._file.write('</mxfile>\n')
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is None:
+                os.replace(self._temp_path, self.path)
+        finally:
+            if os.path.exists(self._temp_path):
+                os.remove(self._temp_path)
+        return False
+
+def bundle_drawio_files(paths: Iterable[str], output_path: str, compressed: bool = True) -> Dict[str, Any]:
+    """Combine .drawio files into one multi-page document; returns page count and file sizes"""
+    input_bytes = 0
+    with DrawioBundleWriter(output_path, compressed=compressed) as writer:
+        for path in paths:
+            input_bytes += os.path.getsize(path)
+            writer.add_file(path)
+    return {"bundle_path": output_path, "pages": writer.pages, "input_bytes": input_bytes,
+            "bundle_bytes": os.path.getsize(output_path)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress .drawio files or bundle them into one multi-page file")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    bundle = subcommands.add_parser("bundle", help="combine diagrams into one multi-page .drawio file")
+    bundle.add_argument("output")
+    bundle.add_argument("inputs", nargs="+")
+    bundle.add_argument("--uncompressed", action="store_true", help="keep pages as plain XML")
+    compress = subcommands.add_parser("compress", help="rewrite .drawio files in place with compressed pages")
+    compress.add_argument("inputs", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "bundle":
+        stats = bundle_drawio_files(args.inputs, args.output, compressed=not args.uncompressed)
+        print(f"Wrote {stats['pages']} pages to {args.output}: {stats['input_bytes']:,} -> {stats['bundle_bytes']:,} bytes")
+    else:
+        from agents.artifact_writer import atomic_write
+        for path in args.inputs:
+            with open(path, 'r', encoding='utf-8') as f:
+                original = f.read()
+            atomic_write(path, compress_mxfile(original))
+            print(f"{path}: {len(original.encode('utf-8')):,} -> {os.path.getsize(path):,} bytes")
+
+if __name__ == "__main__":
+    main()
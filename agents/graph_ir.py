@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+import json
+import keyword
+import re
+from typing import Dict, Any, Optional, Tuple
+
+class GraphIRError(ValueError):
+    """Raised when an LLM-produced graph does not match the graph IR schema"""
+
+# IR node type -> (diagrams module, class); the type names double as DrawIOConverter service keys
+NODE_TYPES: Dict[str, Tuple[str, str]] = {
+    'lambda': ('diagrams.aws.compute', 'Lambda'),
+    'ecs': ('diagrams.aws.compute', 'ECS'),
+    'ec2': ('diagrams.aws.compute', 'EC2'),
+    'fargate': ('diagrams.aws.compute', 'Fargate'),
+    'batch': ('diagrams.aws.compute', 'Batch'),
+    's3': ('diagrams.aws.storage', 'S3'),
+    'efs': ('diagrams.aws.storage', 'EFS'),
+    'fsx': ('diagrams.aws.storage', 'FSx'),
+    'rds': ('diagrams.aws.database', 'RDS'),
+    'dynamodb': ('diagrams.aws.database', 'Dynamodb'),
+    'redshift': ('diagrams.aws.database', 'Redshift'),
+    'elasticache': ('diagrams.aws.database', 'ElastiCache'),
+    'documentdb': ('diagrams.aws.database', 'DocumentDB'),
+    'kinesis': ('diagrams.aws.analytics', 'Kinesis'),
+    'glue': ('diagrams.aws.analytics', 'Glue'),
+    'athena': ('diagrams.aws.analytics', 'Athena'),
+    'emr': ('diagrams.aws.analytics', 'EMR'),
+    'quicksight': ('diagrams.aws.analytics', 'Quicksight'),
+    'api_gateway': ('diagrams.aws.network', 'APIGateway'),
+    'vpc': ('diagrams.aws.network', 'VPC'),
+    'elb': ('diagrams.aws.network', 'ELB'),
+    'cloudfront': ('diagrams.aws.network', 'CloudFront'),
+    'route53': ('diagrams.aws.network', 'Route53'),
+    'sqs': ('diagrams.aws.integration', 'SQS'),
+    'sns': ('diagrams.aws.integration', 'SNS'),
+    'eventbridge': ('diagrams.aws.integration', 'Eventbridge'),
+    'stepfunctions': ('diagrams.aws.integration', 'StepFunctions'),
+    'iam': ('diagrams.aws.security', 'IAM'),
+    'kms': ('diagrams.aws.security', 'KMS'),
+    'cognito': ('diagrams.aws.security', 'Cognito'),
+    'waf': ('diagrams.aws.security', 'WAF'),
+    'guardduty': ('diagrams.aws.security', 'Guardduty'),
+    'sagemaker': ('diagrams.aws.ml', 'Sagemaker'),
+    'bedrock': ('diagrams.aws.ml', 'Bedrock'),
+    'comprehend': ('diagrams.aws.ml', 'Comprehend'),
+    'rekognition': ('diagrams.aws.ml', 'Rekognition'),
+    'pod': ('diagrams.k8s.compute', 'Pod'),
+    'deployment': ('diagrams.k8s.compute', 'Deployment'),
+    'service': ('diagrams.k8s.network', 'Service'),
+    'configmap': ('diagrams.k8s.podconfig', 'ConfigMap'),
+    'database': ('diagrams.generic.database', 'SQL'),
+    'storage': ('diagrams.generic.storage', 'Storage'),
+    'server': ('diagrams.onprem.compute', 'Server'),
+    'client': ('diagrams.onprem.client', 'Client'),
+    'docker': ('diagrams.onprem.container', 'Docker'),
+    'python': ('diagrams.programming.language', 'Python'),
+    'java': ('diagrams.programming.language', 'Java'),
+    'nodejs': ('diagrams.programming.language', 'Nodejs'),
+    'react': ('diagrams.programming.framework', 'React')
+}
+
+DIRECTIONS = ('LR', 'TB', 'RL', 'BT')
+MAX_NODES = 200
+
+# Documents the IR for callers and the prompt; validate_graph_ir enforces it without a jsonschema dependency
+GRAPH_IR_SCHEMA = {
+    "type": "object",
+    "required": ["nodes"],
+    "properties": {
+        "title": {"type": "string"},
+        "direction": {"enum": list(DIRECTIONS)},
+        "clusters": {"type": "array", "items": {
+            "type": "object", "required": ["id", "label"],
+            "properties": {"id": {"type": "string"}, "label": {"type": "string"}, "parent": {"type": "string"}}
+        }},
+        "nodes": {"type": "array", "minItems": 1, "maxItems": MAX_NODES, "items": {
+            "type": "object", "required": ["id", "type"],
+            "properties": {"id": {"type": "string"}, "type": {"enum": sorted(NODE_TYPES)},
+                           "label": {"type": "string"}, "cluster": {"type": "string"}}
+        }},
+        "edges": {"type": "array", "items": {
+            "type": "object", "required": ["source", "target"],
+            "properties": {"source": {"type": "string"}, "target": {"type": "string"}, "label": {"type": "string"}}
+        }}
+    }
+}
+
+GRAPH_IR_SYSTEM_PROMPT = f"""Describe the requested architecture as a JSON graph. Return ONLY the JSON object, no code and no explanations.
+
+Format:
+{{"title": "...", "direction": "LR",
+ "clusters": [{{"id": "ingest", "label": "Ingestion"}}, {{"id": "private", "label": "Private subnet", "parent": "ingest"}}],
+ "nodes": [{{"id": "api", "type": "api_gateway", "label": "Public API", "cluster": "ingest"}}],
+ "edges": [{{"source": "api", "target": "fn", "label": "optional"}}]}}
+
+Rules:
+- ids are lowercase snake_case and unique across nodes and clusters
+- direction is one of {', '.join(DIRECTIONS)}; clusters may nest through "parent"
+- node "type" must be one of: {', '.join(sorted(NODE_TYPES))}
+- for anything else pick the closest type and say what it is in the label (e.g. type "lambda", label "Fraud scoring service")"""
+
+_IDENTIFIER = re.compile(r'^[a-z_][a-z0-9_]{0,63}$')
+
+def parse_graph_ir(reply: str) -> Dict[str, Any]:
+    """Decode and validate a graph IR reply, tolerating markdown fences and surrounding prose"""
+    start, end = reply.find('{'), reply.rfind('}')
+    if start < 0 or end < start:
+        raise GraphIRError("No JSON object found in the model response")
+    try:
+        data = json.loads(reply[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise GraphIRError(f"Invalid JSON: {e}")
+    return validate_graph_ir(data)
+
+def _text(value: Any, default: str = '') -> str:
+    """A label as a single-line string"""
+    return ' '.join(str(value).split()) if value is not None else default
+
+def validate_graph_ir(data: Any, max_nodes: Optional[int] = MAX_NODES) -> Dict[str, Any]:
+    """Check a decoded graph against the schema and return it normalized, reporting every problem at once; max_nodes=None lifts the size cap"""
+    if not isinstance(data, dict):
+        raise GraphIRError("Graph IR must be a JSON object")
+    problems = []
+    ids = set()
+
+    def check_id(kind: str, item: Dict[str, Any]) -> str:
+        item_id = item.get('id')
+        if not isinstance(item_id, str) or not _IDENTIFIER.match(item_id) or keyword.iskeyword(item_id):
+            problems.append(f"{kind} id {item_id!r} must be a lowercase snake_case name")
+        elif item_id in ids:
+            problems.append(f"Duplicate id {item_id!r}")
+        else:
+            ids.add(item_id)
+        return item_id
+
+    def known(value: Any, choices: set) -> bool:
+        return isinstance(value, str) and value in choices
+
+    clusters = []
+    for item in data.get('clusters') or []:
+        if not isinstance(item, dict):
+            problems.append(f"Cluster {item!r} must be an object")
+            continue
+        clusters.append({'id': check_id("Cluster", item), 'label': _text(item.get('label'), item.get('id')),
+                         'parent': item.get('parent')})
+    clusters = [cluster for cluster in clusters if isinstance(cluster['id'], str)]
+    cluster_ids = {cluster['id'] for cluster in clusters}
+    parents = {cluster['id']: cluster['parent'] for cluster in clusters}
+    for cluster in clusters:
+        if cluster['parent'] is not None and not known(cluster['parent'], cluster_ids):
+            problems.append(f"Cluster {cluster['id']!r} has unknown parent {cluster['parent']!r}")
+            continue
+        seen, current = set(), cluster['id']
+        while current is not None and current not in seen:
+            seen.add(current)
+            current = parents.get(current)
+        if current is not None:
+            problems.append(f"Cluster {cluster['id']!r} is nested inside itself")
+
+    nodes = []
+    raw_nodes = data.get('nodes')
+    if not isinstance(raw_nodes, list) or not raw_nodes:
+        problems.append("'nodes' must be a non-empty list")
+        raw_nodes = []
+    elif max_nodes is not None and len(raw_nodes) > max_nodes:
+        problems.append(f"At most {max_nodes} nodes are supported")
+    for item in raw_nodes:
+        if not isinstance(item, dict):
+            problems.append(f"Node {item!r} must be an object")
+            continue
+        node_id = check_id("Node", item)
+        node_type = item.get('type')
+        if not known(node_type, set(NODE_TYPES)):
+            problems.append(f"Node {node_id!r} has unsupported type {node_type!r}")
+        cluster = item.get('cluster')
+        if cluster is not None and not known(cluster, cluster_ids):
+            problems.append(f"Node {node_id!r} is in unknown cluster {cluster!r}")
+        nodes.append({'id': node_id, 'type': node_type, 'label': _text(item.get('label'), node_id), 'cluster': cluster})
+    node_ids = {node['id'] for node in nodes if isinstance(node['id'], str)}
+
+    edges = []
+    for item in data.get('edges') or []:
+        if not isinstance(item, dict):
+            problems.append(f"Edge {item!r} must be an object")
+            continue
+        for end in ('source', 'target'):
+            if not known(item.get(end), node_ids):
+                problems.append(f"Edge {end} {item.get(end)!r} is not a node id")
+        edges.append({'source': item.get('source'), 'target': item.get('target'), 'label': _text(item.get('label'))})
+
+    direction = data.get('direction') or 'LR'
+    if direction not in DIRECTIONS:
+        problems.append(f"'direction' must be one of {', '.join(DIRECTIONS)}")
+    if problems:
+        raise GraphIRError('; '.join(problems))
+    return {'title': _text(data.get('title'), 'Architecture'), 'direction': direction,
+            'clusters': clusters, 'nodes': nodes, 'edges': edges}
+
+def graph_ir_to_code(graph: Dict[str, Any]) -> str:
+    """Emit diagrams Python for a validated graph; the same graph always yields the same code"""
+    modules = {}
+    for node in graph['nodes']:
+        module, class_name = NODE_TYPES[node['type']]
+        modules.setdefault(module, set()).add(class_name)
+    lines = ["from diagrams import Diagram, Cluster, Edge"]
+    lines += [f"from {module} import {', '.join(sorted(names))}" for module, names in sorted(modules.items())]
+    lines += ["", f"with Diagram({graph['title']!r}, direction={graph['direction']!r}):"]
+
+    children = {}
+    for cluster in graph['clusters']:
+        children.setdefault(cluster['parent'], []).append(cluster)
+    members = {}
+    for node in graph['nodes']:
+        members.setdefault(node['cluster'], []).append(node)
+
+    def emit(cluster_id: str, depth: int):
+        indent = '    ' * depth
+        for node in members.get(cluster_id, []):
+            lines.append(f"{indent}{node['id']} = {NODE_TYPES[node['type']][1]}({node['label']!r})")
+        for cluster in children.get(cluster_id, []):
+            lines.append(f"{indent}with Cluster({cluster['label']!r}):")
+            before = len(lines)
+            emit(cluster['id'], depth + 1)
+            if len(lines) == before:
+                lines.append(f"{indent}    pass")
+
+    emit(None, 1)
+    if graph['edges']:
+        lines.append("")
+    for edge in graph['edges']:
+        arrow = f" >> Edge(label={edge['label']!r}) >> " if edge['label'] else " >> "
+        lines.append(f"    {edge['source']}{arrow}{edge['target']}")
+    return '\n'.join(lines) + '\n'
+
+def graph_ir_to_parsed(graph: Dict[str, Any]) -> Dict[str, Any]:
+    """The clusters/services/connections structure DrawIOConverter.parse_clusters_and_services would return for the code"""
+    cluster_names = {}
+    for cluster in graph['clusters']:
+        name = cluster['label']
+        # Draw.io shows the cluster name, so only disambiguate labels that repeat
+        cluster_names[cluster['id']] = name if name not in cluster_names.values() else f"{name} ({cluster['id']})"
+    clusters = {name: {'services': [], 'label': name} for name in cluster_names.values()}
+    services = {}
+    for node in graph['nodes']:
+        cluster = cluster_names.get(node['cluster'])
+        services[node['id']] = {'type': node['type'], 'cluster': cluster, 'label': node['label']}
+        if cluster:
+            clusters[cluster]['services'].append(node['id'])
+    return {
+        'clusters': clusters,
+        'services': services,
+        'connections': [(edge['source'], edge['target']) for edge in graph['edges']]
+    }
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import re
+import shlex
+from typing import Dict, Any, Tuple
+
+POINTS_PER_INCH = 72
+
+_NODE_STATEMENT = re.compile(r'^("(?:[^"\\]|\\.)*"|[\w.]+)\s*\[(.*)\]$', re.DOTALL)
+_ATTRIBUTE = re.compile(r'(\w+)\s*=\s*("(?:[^"\\]|\\.)*"|[^\s,\]]+)')
+_GRAPH_HEADER = re.compile(r'^(?:(?:strict\s+)?(?:di)?graph|subgraph)(?:\s+("(?:[^"\\]|\\.)*"|[\w.]+))?$')
+
+def _unquote(value: str) -> str:
+    """Strip DOT quoting and line continuations from an attribute value"""
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return value.replace('\\\n', '').replace('\\"', '"').replace('\\n', '\n').strip()
+
+def _statements(dot_text: str, braces: bool = False):
+    """Split DOT text into statements, respecting quotes and attribute brackets; braces=True also yields '{' and '}'"""
+    current = []
+    in_quotes = escaped = False
+    depth = 0
+    for char in dot_text:
+        if in_quotes:
+            current.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_quotes = False
+            continue
+        if char == '"':
+            in_quotes = True
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif depth == 0 and char in ';{}\n':
+            statement = ''.join(current).strip()
+            if statement:
+                yield statement
+            if braces and char in '{}':
+                yield char
+            current = []
+            continue
+        current.append(char)
+    statement = ''.join(current).strip()
+    if statement:
+        yield statement
+
+def parse_dot_layout(dot_text: str) -> Dict[str, Any]:
+    """Parse laid-out DOT (graphviz -Tdot, as written by diagrams' 'dot' outformat) into node boxes in points plus graph and cluster bounding boxes"""
+    nodes = {}
+    clusters = {}
+    bb = None
+    # Name of each open graph/subgraph; the header statement comes just before its '{'
+    scopes, header = [], None
+    for statement in _statements(dot_text, braces=True):
+        if statement == '{':
+            scopes.append(header)
+            header = None
+            continue
+        if statement == '}':
+            if scopes:
+                scopes.pop()
+            continue
+        graph_header = _GRAPH_HEADER.match(statement)
+        if graph_header:
+            header = _unquote(graph_header.group(1) or '')
+            continue
+        match = _NODE_STATEMENT.match(statement)
+        if not match:
+            continue
+        node_id = _unquote(match.group(1))
+        attrs = {key: _unquote(value) for key, value in _ATTRIBUTE.findall(match.group(2))}
+        if node_id == 'graph' and 'bb' in attrs:
+            if len(scopes) > 1 and scopes[-1]:
+                clusters[scopes[-1]] = attrs['bb']
+            elif len(scopes) <= 1:
+                bb = attrs['bb']
+            continue
+        if node_id in ('graph', 'node', 'edge'):
+            continue
+        if 'pos' not in attrs:
+            continue
+        x, y = (float(v) for v in attrs['pos'].split(',')[:2])
+        nodes[node_id] = {
+            'label': attrs.get('label', node_id),
+            'x': x,
+            'y': y,
+            'width': float(attrs.get('width', 0)) * POINTS_PER_INCH,
+            'height': float(attrs.get('height', 0)) * POINTS_PER_INCH
+        }
+    return {'nodes': nodes, 'clusters': clusters, 'bb': bb}
+
+def parse_plain_layout(plain_text: str) -> Dict[str, Any]:
+    """Parse graphviz -Tplain output (inches) into node boxes in points"""
+    nodes = {}
+    for line in plain_text.splitlines():
+        if not line.startswith('node '):
+            continue
+        fields = shlex.split(line)
+        node_id, x, y, width, height, label = fields[1], *map(float, fields[2:6]), fields[6]
+        nodes[node_id] = {
+            'label': label.replace('\\n', '\n'),
+            'x': x * POINTS_PER_INCH,
+            'y': y * POINTS_PER_INCH,
+            'width': width * POINTS_PER_INCH,
+            'height': height * POINTS_PER_INCH
+        }
+    return {'nodes': nodes}
+
+def layout_positions_by_label(layout: Dict[str, Any], margin: int = 100) -> Dict[str, Tuple[int, int]]:
+    """Convert Graphviz node centres (origin bottom-left) to Draw.io top-left icon positions keyed by label"""
+    nodes = layout.get('nodes', {})
+    if not nodes:
+        return {}
+    min_x = min(node['x'] for node in nodes.values())
+    max_y = max(node['y'] for node in nodes.values())
+    positions = {}
+    for node in nodes.values():
+        label = ' '.join(node['label'].split())
+        # Graphviz y grows upwards; Draw.io y grows downwards
+        positions[label] = (int(round(node['x'] - min_x)) + margin, int(round(max_y - node['y'])) + margin)
+    return positions
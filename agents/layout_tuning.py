@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+import ast
+import hashlib
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
+from agents.render_formats import set_diagram_kwarg
+
+LAYOUT_ENGINES = ("dot", "sfdp", "fdp", "neato")
+SPLINE_MODES = ("ortho", "spline", "polyline", "line", "curved")
+# Past this many nodes dot's ranking and ortho edge routing dominate render time
+DEFAULT_SFDP_THRESHOLD = 60
+# Classes the diagrams package itself exports; everything else imported from diagrams.* draws a node
+NON_NODE_CLASSES = {"Diagram", "Cluster", "Edge"}
+# Keywords that change the output, not the layout
+OUTPUT_ONLY_KEYWORDS = {"filename", "show", "outformat"}
+
+def layout_options_from_env() -> Dict[str, Any]:
+    """Service-wide defaults: GRAPHVIZ_ENGINE, GRAPHVIZ_SPLINES, GRAPHVIZ_RANKSEP, GRAPHVIZ_NODESEP, GRAPHVIZ_SFDP_THRESHOLD"""
+    options = {
+        "engine": os.environ.get("GRAPHVIZ_ENGINE") or None,
+        "splines": os.environ.get("GRAPHVIZ_SPLINES") or None,
+        "ranksep": os.environ.get("GRAPHVIZ_RANKSEP") or None,
+        "nodesep": os.environ.get("GRAPHVIZ_NODESEP") or None,
+        "sfdp_threshold": os.environ.get("GRAPHVIZ_SFDP_THRESHOLD") or DEFAULT_SFDP_THRESHOLD
+    }
+    return validate_layout_options(options)
+
+def validate_layout_options(options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Normalise layout options, raising ValueError on anything Graphviz would reject"""
+    options = {key: value for key, value in (options or {}).items() if value is not None}
+    unknown = set(options) - {"engine", "splines", "ranksep", "nodesep", "sfdp_threshold"}
+    if unknown:
+        raise ValueError(f"Unknown layout options: {', '.join(sorted(unknown))}")
+    if "engine" in options and options["engine"] not in LAYOUT_ENGINES:
+        raise ValueError(f"'engine' must be one of {', '.join(LAYOUT_ENGINES)}")
+    if "splines" in options and options["splines"] not in SPLINE_MODES:
+        raise ValueError(f"'splines' must be one of {', '.join(SPLINE_MODES)}")
+    for key in ("ranksep", "nodesep"):
+        if key in options:
+            try:
+                value = float(options[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"'{key}' must be a number of inches")
+            if not 0 < value <= 10:
+                raise ValueError(f"'{key}' must be between 0 and 10 inches")
+            options[key] = f"{value:g}"
+    if "sfdp_threshold" in options:
+        try:
+            options["sfdp_threshold"] = int(options["sfdp_threshold"])
+        except (TypeError, ValueError):
+            raise ValueError("'sfdp_threshold' must be an integer (0 disables the automatic switch)")
+    return options
+
+def _node_classes(tree: ast.AST) -> set:
+    """Names bound by 'from diagrams.<provider>... import X' (node classes such as EC2 or Custom)"""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and (node.module or '').startswith('diagrams.'):
+            names.update(alias.asname or alias.name for alias in node.names if alias.name not in NON_NODE_CLASSES)
+    return names
+
+def _call_name(call: ast.Call) -> Optional[str]:
+    func = call.func
+    return func.id if isinstance(func, ast.Name) else getattr(func, 'attr', None)
+
+class _CallSites(ast.NodeVisitor):
+    """Node and Cluster constructor calls in source order, noting any that may run more than once"""
+
+    REPEATING = (ast.For, ast.AsyncFor, ast.While, ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda,
+                 ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+    def __init__(self, node_classes: set):
+        self.node_classes = node_classes
+        self.nodes: List[ast.Call] = []
+        self.clusters: List[ast.Call] = []
+        self.repeated = False
+        self._depth = 0
+
+    def generic_visit(self, node: ast.AST):
+        repeating = isinstance(node, self.REPEATING)
+        self._depth += repeating
+        if isinstance(node, ast.Call):
+            name = _call_name(node)
+            if name in self.node_classes or name == "Cluster":
+                (self.clusters if name == "Cluster" else self.nodes).append(node)
+                self.repeated = self.repeated or self._depth > 0
+        super().generic_visit(node)
+        self._depth -= repeating
+
+def _call_sites(tree: ast.AST) -> _CallSites:
+    sites = _CallSites(_node_classes(tree))
+    sites.visit(tree)
+    # Visiting order is not source order for nested and chained calls; positions are
+    sites.nodes.sort(key=lambda call: (call.lineno, call.col_offset))
+    sites.clusters.sort(key=lambda call: (call.lineno, call.col_offset))
+    return sites
+
+def graph_attrs_for(diagram_code: str, options: Dict[str, Any]) -> Dict[str, str]:
+    """Graphviz graph attributes for this diagram: explicit options, else sfdp/splines for graphs past the threshold"""
+    attrs = {}
+    engine, splines = options.get("engine"), options.get("splines")
+    threshold = options.get("sfdp_threshold", DEFAULT_SFDP_THRESHOLD)
+    if threshold and (engine is None or splines is None):
+        try:
+            sites = _call_sites(ast.parse(diagram_code))
+        except SyntaxError:
+            sites = None
+        if sites is not None and len(sites.nodes) >= threshold:
+            # Ortho routing is the first thing to blow up on big graphs; sfdp ignores clusters, so only flat graphs switch engine
+            splines = splines or "spline"
+            if engine is None and not sites.clusters:
+                engine = "sfdp"
+    if engine and engine != "dot":
+        attrs["layout"] = engine
+        # Force-directed engines overlap nodes unless told otherwise
+        attrs["overlap"] = "prism"
+    if splines:
+        attrs["splines"] = splines
+    for key in ("ranksep", "nodesep"):
+        if options.get(key):
+            attrs[key] = options[key]
+    return attrs
+
+def _label_placeholder(value: ast.AST) -> ast.AST:
+    """A label reduced to what affects layout: its line count (node height grows with each line)"""
+    if isinstance(value, ast.Constant) and isinstance(value.value, str):
+        return ast.Constant('\n' * value.value.count('\n'))
+    if isinstance(value, ast.JoinedStr):
+        return ast.Constant('')
+    return value
+
+class _TopologyNormalizer(ast.NodeTransformer):
+    """Blank out labels and output-only keywords so label edits map to the same key"""
+
+    def __init__(self, node_classes: set):
+        self.node_classes = node_classes
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        name = _call_name(node)
+        if name in self.node_classes or name in NON_NODE_CLASSES:
+            if node.args and name != "Edge":
+                node.args[0] = _label_placeholder(node.args[0])
+            node.keywords = [keyword for keyword in node.keywords if keyword.arg not in OUTPUT_ONLY_KEYWORDS]
+            for keyword in node.keywords:
+                if keyword.arg in ("label", "name"):
+                    keyword.value = _label_placeholder(keyword.value)
+        return node
+
+def topology_key(diagram_code: str, graph_attrs: Dict[str, str]) -> Optional[str]:
+    """Hash of the code with labels blanked plus the layout options; None when the layout cannot be reused safely"""
+    try:
+        tree = ast.parse(diagram_code)
+    except SyntaxError:
+        return None
+    sites = _call_sites(tree)
+    # A node created in a loop has no single call site to pin, so such diagrams are always laid out afresh
+    if not sites.nodes or sites.repeated:
+        return None
+    tree = _TopologyNormalizer(_node_classes(tree)).visit(tree)
+    canonical = ast.dump(tree, annotate_fields=False) + json.dumps(graph_attrs, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _set_call_kwargs(diagram_code: str, edits: List[Tuple[ast.Call, Dict[str, str]]]) -> str:
+    """Set keyword arguments (name -> Python source) on several calls at once, merging dicts into an existing graph_attr"""
+    # ast offsets are UTF-8 byte offsets, so edit the encoded lines
+    lines = [line.encode('utf-8') for line in diagram_code.split('\n')]
+    splices = []
+    for call, kwargs in edits:
+        existing = {keyword.arg: keyword for keyword in call.keywords if keyword.arg}
+        inserts = []
+        for name, source in kwargs.items():
+            keyword = existing.get(name)
+            if keyword is None:
+                inserts.append(f"{name}={source}")
+                continue
+            value = keyword.value
+            if name == "graph_attr":
+                source = f"{{**({ast.get_source_segment(diagram_code, value)}), **{source}}}"
+            splices.append((value.lineno, value.col_offset, value.end_lineno, value.end_col_offset, source))
+        if inserts:
+            # Just before the closing parenthesis
+            prefix = ", " if call.args or call.keywords else ""
+            end_line, end_col = call.end_lineno, call.end_col_offset - 1
+            splices.append((end_line, end_col, end_line, end_col, prefix + ", ".join(inserts)))
+    # Back to front, so earlier offsets stay valid
+    for start_line, start_col, end_line, end_col, text in sorted(splices, reverse=True):
+        head = lines[start_line - 1][:start_col]
+        tail = lines[end_line - 1][end_col:]
+        lines[start_line - 1:end_line] = [head + text.encode('utf-8') + tail]
+    return '\n'.join(line.decode('utf-8') for line in lines)
+
+def with_layout(diagram_code: str, graph_attrs: Dict[str, str], cached: Dict[str, Any] = None) -> str:
+    """Code to render: layout options applied, nodes given stable ids and, with a cached layout, pinned so Graphviz skips layout"""
+    try:
+        tree = ast.parse(diagram_code)
+    except SyntaxError:
+        return diagram_code
+    sites = _call_sites(tree)
+    attrs = dict(graph_attrs)
+    if sites.nodes and not sites.repeated:
+        # Stable ids tie each node in the laid-out DOT back to its call site
+        edits = [(call, {"nodeid": repr(f"n{index}")}) for index, call in enumerate(sites.nodes)]
+        if cached and len(cached["nodes"]) == len(sites.nodes) and len(cached["clusters"]) == len(sites.clusters):
+            for (call, kwargs), (x, y) in zip(edits, cached["nodes"]):
+                kwargs["pos"] = repr(f"{x:g},{y:g}!")
+            edits += [(call, {"graph_attr": repr({"bb": bb})}) for call, bb in zip(sites.clusters, cached["clusters"])]
+            # nop is neato -n: take every position as given and only route the edges
+            attrs = {key: value for key, value in attrs.items() if key not in ("layout", "overlap")}
+            attrs.update({"layout": "nop", "bb": cached["bb"]})
+        diagram_code = _set_call_kwargs(diagram_code, edits)
+    if not attrs:
+        return diagram_code
+    tree = ast.parse(diagram_code)
+    diagram = next((node for node in ast.walk(tree) if isinstance(node, ast.Call) and _call_name(node) == "Diagram"), None)
+    existing = next((keyword for keyword in diagram.keywords if keyword.arg == "graph_attr"), None) if diagram else None
+    source = repr(attrs)
+    if existing is not None:
+        source = f"{{**({ast.get_source_segment(diagram_code, existing.value)}), **{source}}}"
+    return set_diagram_kwarg(diagram_code, "graph_attr", source)
+
+def layout_entry(diagram_code: str, layout: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Positions from a render of with_layout() code, by call site; None unless every node and cluster was found"""
+    if not layout or not layout.get('bb'):
+        return None
+    try:
+        sites = _call_sites(ast.parse(diagram_code))
+    except SyntaxError:
+        return None
+    if not sites.nodes or sites.repeated:
+        return None
+    nodes = []
+    for index in range(len(sites.nodes)):
+        node = layout.get('nodes', {}).get(f"n{index}")
+        if node is None:
+            return None  # an older diagrams release that ignores nodeid
+        nodes.append([round(node['x'], 2), round(node['y'], 2)])
+    clusters = []
+    for call in sites.clusters:
+        label = call.args[0] if call.args else next((keyword.value for keyword in call.keywords if keyword.arg == "label"),
+                                                     ast.Constant("cluster"))
+        if not (isinstance(label, ast.Constant) and isinstance(label.value, str)):
+            return None
+        bb = layout.get('clusters', {}).get(f"cluster_{label.value}")
+        if bb is None:
+            return None
+        clusters.append(bb)
+    return {"nodes": nodes, "clusters": clusters, "bb": layout['bb']}
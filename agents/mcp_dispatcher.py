@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import posixpath
+import shlex
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
+from agents.mcp_session_pool import MCPSessionPool
+
+DEFAULT_SERVER_COMMAND = "awslabs.aws-diagram-mcp-server"
+
+class MCPBackend:
+    """One MCP diagram server endpoint: a Docker container or a local process"""
+
+    def __init__(self, name: str, command_line: List[str], workspace: str, host_workspace: str,
+                 container: str = None, pool_size: int = 0):
+        self.name = name
+        self.command_line = command_line
+        # workspace is the path the server writes to; host_workspace is where that is visible to this process
+        self.workspace = workspace
+        self.host_workspace = os.path.abspath(host_workspace)
+        self.container = container
+        self.pool = MCPSessionPool(container or name, size=pool_size, command_line=command_line) if pool_size else None
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_at: Optional[float] = None
+        self.stats = {"calls": 0, "failures": 0, "ejections": 0}
+
+    @classmethod
+    def from_spec(cls, spec: str, host_workspace: str = "outputs/diagrams", container_workspace: str = "/workspace",
+                  pool_size: int = 0) -> "MCPBackend":
+        """Parse 'container', 'container=host/dir' or 'local:command args' into a backend"""
+        spec = spec.strip()
+        if spec.startswith("local:"):
+            # A server process on this host writes straight into the host workspace
+            command_line = shlex.split(spec[len("local:"):]) or [DEFAULT_SERVER_COMMAND]
+            workspace = os.path.abspath(host_workspace)
+            return cls(spec, command_line, workspace, workspace, pool_size=pool_size)
+        container, _, container_host_workspace = spec.partition('=')
+        command_line = ["docker", "exec", "-i", container, DEFAULT_SERVER_COMMAND]
+        return cls(container, command_line, container_workspace, container_host_workspace or host_workspace,
+                   container=container, pool_size=pool_size)
+
+    @property
+    def healthy(self) -> bool:
+        """False while the backend is ejected from rotation"""
+        return self.ejected_at is None
+
+    def to_host_path(self, server_path: str) -> Optional[str]:
+        """Map a path written by the server to the shared volume on this host"""
+        if self.container is None:
+            return os.path.normpath(server_path)
+        relative = posixpath.relpath(server_path, self.workspace)
+        if relative.startswith('..'):
+            return None
+        return os.path.normpath(os.path.join(self.host_workspace, *relative.split('/')))
+
+    async def docker_exec(self, *args: str) -> Tuple[int, bytes]:
+        """Run a command in the backend's container and capture stdout; local backends have no container"""
+        if self.container is None:
+            return 1, b""
+        process = await asyncio.create_subprocess_exec(
+            "docker", "exec", self.container, *args,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        return process.returncode, stdout
+
+    async def _with_session(self, work):
+        """Open a one-off session, run work(session) and close it"""
+        # The MCP SDK pulls in pydantic/anyio; import it on the first render, not at app start
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
+        server_params = StdioServerParameters(command=self.command_line[0], args=self.command_line[1:])
+        async with stdio_client(server_params) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                return await work(session)
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """Call a tool on a pooled session, or on a fresh one when pooling is off"""
+        if self.pool is not None:
+            return await self.pool.call_tool(name, arguments)
+        return await self._with_session(lambda session: session.call_tool(name, arguments))
+
+    async def probe(self, timeout: float) -> bool:
+        """Health check: can we open a session and list tools?"""
+        try:
+            await asyncio.wait_for(self._with_session(lambda session: session.list_tools()), timeout)
+            return True
+        except Exception:
+            return False
+
+    def metrics(self) -> Dict[str, Any]:
+        """Load, health and call counters for this backend"""
+        metrics = {**self.stats, "outstanding": self.outstanding, "healthy": self.healthy,
+                   "consecutive_failures": self.consecutive_failures}
+        if self.pool is not None:
+            metrics["pool"] = self.pool.metrics()
+        return metrics
+
+class MCPDispatcher:
+    """Route MCP tool calls across several diagram servers by least outstanding work, ejecting unhealthy ones"""
+
+    def __init__(self, backends: List[MCPBackend], max_failures: int = 3, health_interval: float = 10.0,
+                 probe_timeout: float = 15.0):
+        if not backends:
+            raise ValueError("MCPDispatcher needs at least one backend")
+        self.backends = backends
+        self.max_failures = max_failures
+        self.health_interval = health_interval
+        self.probe_timeout = probe_timeout
+        self._health_task: Optional[asyncio.Task] = None
+        self._next = 0
+
+    @classmethod
+    def from_env(cls, pool_size: int = 0, host_workspace: str = "outputs/diagrams") -> "MCPDispatcher":
+        """Backends from MCP_DIAGRAM_SERVERS (comma separated specs), defaulting to the single compose container"""
+        specs = [spec for spec in os.environ.get("MCP_DIAGRAM_SERVERS", "mcp-diagram-server").split(',') if spec.strip()]
+        return cls([MCPBackend.from_spec(spec, host_workspace, pool_size=pool_size) for spec in specs])
+
+    def pick(self, exclude: Tuple[MCPBackend, ...] = ()) -> Optional[MCPBackend]:
+        """Healthy backend with the fewest outstanding calls; rotates between ties"""
+        candidates = [backend for backend in self.backends if backend.healthy and backend not in exclude]
+        if not candidates:
+            # Everything is ejected: keep trying rather than refuse all work
+            candidates = [backend for backend in self.backends if backend not in exclude]
+        if not candidates:
+            return None
+        self._next += 1
+        fewest = min(backend.outstanding for backend in candidates)
+        tied = [backend for backend in candidates if backend.outstanding == fewest]
+        return tied[self._next % len(tied)]
+
+    def record_success(self, backend: MCPBackend):
+        """Reset the failure streak and re-admit an ejected backend"""
+        backend.consecutive_failures = 0
+        if not backend.healthy:
+            print(f"MCP backend {backend.name} recovered")
+            backend.ejected_at = None
+
+    def record_failure(self, backend: MCPBackend, error: Exception):
+        """Count a transport failure, ejecting the backend after max_failures in a row"""
+        backend.stats["failures"] += 1
+        backend.consecutive_failures += 1
+        if backend.healthy and backend.consecutive_failures >= self.max_failures:
+            print(f"Ejecting MCP backend {backend.name} after {backend.consecutive_failures} failures: {error}")
+            backend.ejected_at = time.monotonic()
+            backend.stats["ejections"] += 1
+
+    async def call_tool(self, name: str, arguments: Union[Dict[str, Any], Callable[[MCPBackend], Dict[str, Any]]],
+                        attempts: int = 2) -> Tuple[Any, MCPBackend]:
+        """Call a tool on the least-loaded backend, failing over once; returns the result and the backend that served it.
+        arguments may be a function of the chosen backend, e.g. for backend-specific paths."""
+        self._ensure_health_checks()
+        tried = ()
+        last_error = None
+        for _ in range(attempts):
+            backend = self.pick(exclude=tried)
+            if backend is None:
+                break
+            tried += (backend,)
+            backend.outstanding += 1
+            backend.stats["calls"] += 1
+            try:
+                result = await backend.call_tool(name, arguments(backend) if callable(arguments) else arguments)
+                # A tool-level error still means the server is up
+                self.record_success(backend)
+                return result, backend
+            except asyncio.CancelledError:
+                # A hung server never raises; the caller's timeout cancels the call, which must still count against it
+                self.record_failure(backend, TimeoutError(f"{name} call cancelled before {backend.name} answered"))
+                raise
+            except Exception as e:
+                self.record_failure(backend, e)
+                last_error = e
+            finally:
+                backend.outstanding -= 1
+        raise last_error or RuntimeError("No MCP diagram server available")
+
+    def _ensure_health_checks(self):
+        """Start the background re-admission loop on the current event loop"""
+        if len(self.backends) > 1 and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop(), name="mcp-health")
+
+    async def _health_loop(self):
+        """Probe ejected backends and re-add the ones that answer"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            ejected = [backend for backend in self.backends if not backend.healthy]
+            if not ejected:
+                continue
+            results = await asyncio.gather(*(backend.probe(self.probe_timeout) for backend in ejected))
+            for backend, ok in zip(ejected, results):
+                if ok:
+                    self.record_success(backend)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-backend load and health"""
+        return {backend.name: backend.metrics() for backend in self.backends}
+
+    async def close(self):
+        """Stop health checks and close pooled sessions"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for backend in self.backends:
+            if backend.pool is not None:
+                await backend.pool.close()
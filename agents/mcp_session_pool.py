@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+from typing import Dict, Any, List, Optional
+
+class MCPSessionPool:
+    """Pool of long-lived MCP stdio sessions to the diagram server, reused across requests"""
+
+    def __init__(self, container_name: str = "mcp-diagram-server", size: int = 4,
+                 server_command: str = "awslabs.aws-diagram-mcp-server", reconnect_delay: float = 1.0,
+                 command_line: List[str] = None):
+        self.container_name = container_name
+        self.size = size
+        self.server_command = server_command
+        # Full server command; defaults to running the server inside the container via docker exec
+        self.command_line = command_line or ["docker", "exec", "-i", container_name, server_command]
+        self.reconnect_delay = reconnect_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop = None
+        self.stats = {"calls": 0, "errors": 0, "reconnects": 0, "open_sessions": 0, "busy": 0}
+
+    def _start(self):
+        """Start one worker task per session on the running loop (sessions must live in the task that opened them)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._workers:
+            return
+        if self._loop is not None and self._loop is not loop:
+            raise RuntimeError("MCPSessionPool is bound to another event loop")
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._workers = [loop.create_task(self._worker(i), name=f"mcp-session-{i}") for i in range(self.size)]
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """Run a tool call on the next free session; cancelling the caller cancels the call"""
+        self._start()
+        future = self._loop.create_future()
+        await self._queue.put((name, arguments, future))
+        return await future
+
+    async def _worker(self, index: int):
+        """Own one MCP session: open it, serve queued calls, reopen it after failures"""
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
+        server_params = StdioServerParameters(command=self.command_line[0], args=self.command_line[1:])
+        while True:
+            try:
+                async with stdio_client(server_params) as (read, write):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        self.stats["open_sessions"] += 1
+                        try:
+                            await self._serve(session)
+                        finally:
+                            self.stats["open_sessions"] -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"MCP session {index} failed, reconnecting: {e}")
+                self.stats["reconnects"] += 1
+                if self.stats["open_sessions"] == 0:
+                    # No session can serve the queue (e.g. the container is down): fail fast rather than hang
+                    self._fail_pending(ConnectionError(f"MCP diagram server unavailable: {e}"))
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _serve(self, session):
+        """Serve calls until one fails in a way that may have broken the session"""
+        while True:
+            name, arguments, future = await self._queue.get()
+            if future.done():
+                continue  # the caller gave up while the call was queued
+            self.stats["busy"] += 1
+            started = time.perf_counter()
+            call = asyncio.ensure_future(session.call_tool(name, arguments))
+            # A caller timeout/cancel cancels the in-flight call instead of letting it hold the session
+            future.add_done_callback(lambda f, call=call: call.cancel() if f.cancelled() else None)
+            try:
+                result = await call
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    future.cancel()
+                    raise  # the pool is shutting down, not just this caller
+            except Exception as e:
+                self.stats["errors"] += 1
+                if not future.done():
+                    future.set_exception(e)
+                raise
+            finally:
+                self.stats["busy"] -= 1
+                self.stats["calls"] += 1
+                self.stats["last_call_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _fail_pending(self, error: Exception):
+        """Fail every queued call with the given error"""
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(error)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Session and call counters"""
+        return {**self.stats, "size": self.size, "queued": self._queue.qsize() if self._queue else 0}
+
+    async def close(self):
+        """Cancel the workers, closing every session"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
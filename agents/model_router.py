@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import re
+from typing import Dict, Any, List, Optional
+from config.model_tiers import load_model_tiers
+
+# Phrases that name a distinct service box in the diagram
+SERVICE_TERMS = [
+    'lambda', 's3', 'kinesis', 'firehose', 'glue', 'athena', 'api gateway', 'apigateway', 'ecs', 'eks', 'ec2', 'fargate',
+    'rds', 'aurora', 'dynamodb', 'redshift', 'sqs', 'sns', 'eventbridge', 'step functions', 'sagemaker', 'bedrock',
+    'vpc', 'iam', 'kms', 'cloudfront', 'route 53', 'route53', 'elb', 'alb', 'load balancer', 'elasticache', 'opensearch',
+    'emr', 'msk', 'kafka', 'cognito', 'waf', 'cloudwatch', 'cloudtrail', 'quicksight', 'lake formation', 'aws batch',
+    'aws config', 'guardduty', 'security hub', 'secrets manager', 'appsync', 'amplify', 'iot core', 'direct connect'
+]
+
+# Phrases that usually mean many boxes, nested clusters or several environments
+COMPLEXITY_CUES = [
+    'multi-region', 'multi region', 'multi-account', 'microservices', 'high availability', 'disaster recovery',
+    'subnet', 'availability zone', 'cross-account', 'hybrid', 'on-premises', 'end to end', 'end-to-end', 'cluster',
+    'landing zone', 'environments'
+]
+
+_COUNTED_SERVICE = re.compile(r'\b(\d+|two|three|four|five|six)\s+([a-z0-9]+)')
+_NUMBER_WORDS = {'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6}
+
+class ModelRouter:
+    """Pick the cheapest Bedrock model tier likely to produce a valid diagram for a prompt"""
+
+    def __init__(self, tiers: List[Dict[str, Any]] = None):
+        self.tiers = tiers or load_model_tiers()
+
+    def estimate_complexity(self, user_prompt: str) -> int:
+        """Rough number of diagram elements the prompt asks for"""
+        text = ' '.join(user_prompt.lower().split())
+        services = {term for term in SERVICE_TERMS if re.search(rf'\b{re.escape(term)}\b', text)}
+        score = len(services)
+
+        # "three lambda functions" is three boxes, not one
+        for count, noun in _COUNTED_SERVICE.findall(text):
+            if any(noun.startswith(term.split()[0]) for term in services):
+                score += min(int(_NUMBER_WORDS.get(count, count)), 10) - 1
+
+        score += 2 * sum(1 for cue in COMPLEXITY_CUES if cue in text)
+        # Long prompts describe more than they name
+        score += len(text.split()) // 40
+        return score
+
+    def select(self, user_prompt: str) -> Dict[str, Any]:
+        """Smallest tier whose complexity ceiling covers the prompt"""
+        complexity = self.estimate_complexity(user_prompt)
+        for tier in self.tiers:
+            if tier.get("max_complexity") is None or complexity <= tier["max_complexity"]:
+                return tier
+        return self.tiers[-1]
+
+    def fastest(self) -> Dict[str, Any]:
+        """Cheapest tier, for short classification-style calls"""
+        return self.tiers[0]
+
+    def escalate(self, tier: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Next larger tier, or None when already at the top"""
+        index = next((i for i, candidate in enumerate(self.tiers) if candidate["name"] == tier["name"]), len(self.tiers) - 1)
+        return self.tiers[index + 1] if index + 1 < len(self.tiers) else None
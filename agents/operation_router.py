@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+REKOGNITION_OPERATIONS = ["detect_labels", "detect_text", "detect_moderation_labels", "recognize_celebrities"]
+
+class OperationRouter:
+    """Local intent classifier that picks a Rekognition operation without calling Bedrock"""
+
+    def __init__(self, confidence_threshold: float = 0.6, max_cache_size: int = 1024):
+        self.confidence_threshold = confidence_threshold
+        self.max_cache_size = max_cache_size
+        self._decisions = {}  # normalized prompt -> (operation, confidence, method)
+
+        # Strong keyword rules, checked before the TF-IDF model
+        self.keyword_rules = {
+            'detect_text': ['ocr', 'read the text', 'extract text', 'text in', 'words', 'written', 'license plate', 'sign says', 'transcribe'],
+            'detect_moderation_labels': ['moderation', 'unsafe', 'explicit', 'nsfw', 'nudity', 'violence', 'violent', 'inappropriate', 'offensive', 'gore'],
+            'recognize_celebrities': ['celebrity', 'celebrities', 'famous', 'who is this', 'who is in', 'actor', 'actress', 'public figure'],
+            'detect_labels': ['objects', 'what is in', "what's in", 'describe the scene', 'identify items', 'tag the image']
+        }
+        # Whole words or phrases only (an optional plural 's'), so 'actor' does not fire on "refactor"
+        self._keyword_patterns = {
+            operation: [re.compile(r'\b' + r'\s+'.join(re.escape(word) for word in keyword.split()) + r's?\b') for keyword in keywords]
+            for operation, keywords in self.keyword_rules.items()
+        }
+
+        # Small labelled corpus for the TF-IDF nearest-centroid model
+        self.training_examples = {
+            'detect_labels': [
+                "what objects are in this picture",
+                "identify the things shown in the image",
+                "describe the scene and the items in this photo",
+                "tag this image with labels",
+                "detect animals cars and buildings"
+            ],
+            'detect_text': [
+                "read the text in this image",
+                "extract words from the screenshot",
+                "what does the sign say",
+                "get the printed characters from this document photo",
+                "recognize the license plate number"
+            ],
+            'detect_moderation_labels': [
+                "is this image safe for work",
+                "check the photo for explicit or violent content",
+                "flag inappropriate content in this picture",
+                "moderate this upload for offensive material",
+                "does the image contain nudity or gore"
+            ],
+            'recognize_celebrities': [
+                "who is the famous person in this photo",
+                "recognize the celebrity in the picture",
+                "identify the actor shown here",
+                "which public figure appears in this image",
+                "name the well known people in this photo"
+            ]
+        }
+        self._idf, self._centroids = self._build_model()
+
+    def normalize(self, text: str) -> str:
+        """Normalize prompt text for matching and memoization"""
+        return re.sub(r'\s+', ' ', text.lower()).strip()
+
+    def tokenize(self, text: str) -> List[str]:
+        """Split text into lowercase word tokens"""
+        return re.findall(r"[a-z0-9']+", text.lower())
+
+    def _build_model(self) -> Tuple[Dict[str, float], Dict[str, Dict[str, float]]]:
+        """Build IDF weights and one TF-IDF centroid per operation"""
+        documents = [(operation, self.tokenize(example))
+                     for operation, examples in self.training_examples.items()
+                     for example in examples]
+        doc_freq = Counter()
+        for _, tokens in documents:
+            doc_freq.update(set(tokens))
+        idf = {term: math.log((1 + len(documents)) / (1 + df)) + 1 for term, df in doc_freq.items()}
+
+        centroids = {}
+        for operation in self.training_examples:
+            centroid = Counter()
+            for doc_operation, tokens in documents:
+                if doc_operation == operation:
+                    centroid.update(self._vectorize(tokens, idf))
+            centroids[operation] = self._unit(centroid)
+        return idf, centroids
+
+    def _vectorize(self, tokens: List[str], idf: Dict[str, float]) -> Dict[str, float]:
+        """Create a unit-length TF-IDF vector, ignoring unknown terms"""
+        counts = Counter(token for token in tokens if token in idf)
+        return self._unit({term: count * idf[term] for term, count in counts.items()})
+
+    def _unit(self, vector: Dict[str, float]) -> Dict[str, float]:
+        """Scale a sparse vector to unit length"""
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {term: value / norm for term, value in vector.items()} if norm else {}
+
+    def classify(self, user_prompt: str) -> Tuple[str, float, str]:
+        """Return (operation, confidence, method) using keyword rules then TF-IDF similarity"""
+        text = ' '.join(self.tokenize(user_prompt))
+
+        rule_hits = {operation: sum(1 for pattern in patterns if pattern.search(text))
+                     for operation, patterns in self._keyword_patterns.items()}
+        best_rule = max(rule_hits, key=rule_hits.get)
+        if rule_hits[best_rule] and list(rule_hits.values()).count(rule_hits[best_rule]) == 1:
+            return best_rule, min(1.0, 0.75 + 0.1 * rule_hits[best_rule]), "keyword"
+
+        vector = self._vectorize(self.tokenize(text), self._idf)
+        scores = {operation: sum(weight * centroid.get(term, 0.0) for term, weight in vector.items())
+                  for operation, centroid in self._centroids.items()}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_operation, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        # Confidence is the similarity margin over the runner-up, scaled to 0..1
+        confidence = min(1.0, 2 * (best_score - runner_up))
+        return best_operation, round(confidence, 3), "tfidf"
+
+    def lookup(self, user_prompt: str) -> Optional[Tuple[str, float, str]]:
+        """Return a memoized routing decision if one exists"""
+        return self._decisions.get(self.normalize(user_prompt))
+
+    def remember(self, user_prompt: str, operation: str, confidence: float, method: str):
+        """Memoize a routing decision, evicting the oldest entry when full"""
+        if len(self._decisions) >= self.max_cache_size:
+            self._decisions.pop(next(iter(self._decisions)))
+        self._decisions[self.normalize(user_prompt)] = (operation, confidence, method)
+
+    def route(self, user_prompt: str) -> Dict[str, object]:
+        """Route a prompt locally; needs_llm is True when confidence is below the threshold"""
+        cached = self.lookup(user_prompt)
+        if cached:
+            operation, confidence, method = cached
+            return {"operation": operation, "confidence": confidence, "method": method, "cached": True, "needs_llm": False}
+
+        operation, confidence, method = self.classify(user_prompt)
+        needs_llm = confidence < self.confidence_threshold
+        if not needs_llm:
+            self.remember(user_prompt, operation, confidence, method)
+        return {"operation": operation, "confidence": confidence, "method": method, "cached": False, "needs_llm": needs_llm}
+
+    def parse_llm_operation(self, text: str) -> Optional[str]:
+        """Extract a valid operation name from a free-form LLM reply"""
+        reply = text.strip().lower()
+        for operation in REKOGNITION_OPERATIONS:
+            if operation in reply:
+                return operation
+        return None
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import asyncio
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+from agents.artifact_writer import atomic_write
+
+# The session of the request being profiled; asyncio.to_thread copies it into worker threads
+_current_session = contextvars.ContextVar("profile_session", default=None)
+
+def sample_percent_from_env(value: Optional[float] = None) -> float:
+    """Explicit percentage, else PROFILE_SAMPLE_PERCENT (0 = only requests that ask for it)"""
+    if value is not None:
+        return value
+    try:
+        return float(os.environ.get("PROFILE_SAMPLE_PERCENT", "0"))
+    except ValueError:
+        return 0.0
+
+class ProfileSession:
+    """cProfile and tracemalloc data collected for one request"""
+
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.profile = cProfile.Profile()
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.memory_before = None
+        self.memory_after = None
+        self.peak_bytes = 0
+        self.wall_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add_thread_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            self.thread_profiles.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        """Event-loop and worker-thread profiles merged"""
+        stats = pstats.Stats(self.profile)
+        for profile in self.thread_profiles:
+            stats.add(profile)
+        return stats
+
+def _profiled_call(session: ProfileSession, func: Callable, args: tuple, kwargs: dict) -> Any:
+    """Run func under its own profiler (one per thread) and merge it into the session"""
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        session.add_thread_profile(profile)
+
+async def to_thread(func: Callable, *args, **kwargs) -> Any:
+    """asyncio.to_thread that also profiles the call when the current request is being profiled"""
+    session = _current_session.get()
+    if session is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(_profiled_call, session, func, args, kwargs)
+
+async def run_in_executor(executor, func: Callable, *args, **kwargs) -> Any:
+    """to_thread on a given executor (None = the default one), keeping the caller's context and profiling"""
+    session = _current_session.get()
+    call = functools.partial(_profiled_call, session, func, args, kwargs) if session else functools.partial(func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, call)
+
+def _function_name(key: tuple) -> str:
+    filename, line, name = key
+    if filename == '~':
+        return name  # built-in
+    return f"{os.path.relpath(filename) if filename.startswith(os.getcwd()) else filename}:{line}({name})"
+
+def hotspots(stats: pstats.Stats, sort: str = "cumulative", top_n: int = 25) -> List[Dict[str, Any]]:
+    """Top functions by cumulative or own time"""
+    column = 3 if sort == "cumulative" else 2
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:top_n]
+    return [{
+        "function": _function_name(key),
+        "calls": calls,
+        "own_ms": round(own * 1000, 2),
+        "cumulative_ms": round(cumulative * 1000, 2)
+    } for key, (_primitive, calls, own, cumulative, _callers) in rows]
+
+def allocations(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, top_n: int = 25) -> List[Dict[str, Any]]:
+    """Source lines whose live allocations grew most during the request"""
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+              tracemalloc.Filter(False, __file__))
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    return [{
+        "line": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        "size_kb": round(stat.size_diff / 1024, 1),
+        "count": stat.count_diff
+    } for stat in diff[:top_n] if stat.size_diff > 0]
+
+class Profiler:
+    """Per-request cProfile and tracemalloc, on demand or for a sampled percentage of requests"""
+
+    def __init__(self, directory: str = "outputs/profiles", sample_percent: float = None, top_n: int = 25, result_store=None):
+        self.directory = directory
+        self.sample_percent = sample_percent_from_env(sample_percent)
+        self.top_n = top_n
+        self.result_store = result_store
+        # cProfile hooks a whole thread, so only one request at a time is profiled on the event loop
+        self._active = threading.Lock()
+        self.stats = {"profiled": 0, "skipped_busy": 0}
+
+    def should_profile(self, requested: Optional[bool] = None) -> bool:
+        """An explicit per-request choice wins; otherwise sample PROFILE_SAMPLE_PERCENT of requests"""
+        if requested is not None:
+            return requested
+        return self.sample_percent > 0 and random.random() * 100 < self.sample_percent
+
+    @contextmanager
+    def session(self, label: str):
+        """Profile the enclosed request; yields None when another request already holds the profiler"""
+        if not self._active.acquire(blocking=False):
+            self.stats["skipped_busy"] += 1
+            yield None
+            return
+        session = ProfileSession(label)
+        started_tracing = not tracemalloc.is_tracing()
+        try:
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            session.memory_before = tracemalloc.take_snapshot()
+            token = _current_session.set(session)
+            started = time.perf_counter()
+            session.profile.enable()
+            try:
+                yield session
+            finally:
+                # Other coroutines on the loop run while the request awaits; their frames show up in the loop profile
+                session.profile.disable()
+                session.wall_ms = round((time.perf_counter() - started) * 1000, 1)
+                _current_session.reset(token)
+                session.memory_after = tracemalloc.take_snapshot()
+                session.peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            self.stats["profiled"] += 1
+            self._active.release()
+
+    def save(self, session: ProfileSession, run_id: str = None) -> Dict[str, Any]:
+        """Write the .prof file and JSON report under the profiles directory and record it beside the run"""
+        stats = session.stats()
+        os.makedirs(self.directory, exist_ok=True)
+        profile_path = os.path.join(self.directory, f"{session.id}.prof")
+        report_path = os.path.join(self.directory, f"{session.id}.json")
+        stats.dump_stats(profile_path)
+        report = {
+            "id": session.id,
+            "label": session.label,
+            "run_id": run_id,
+            "wall_ms": session.wall_ms,
+            "peak_memory_kb": round(session.peak_bytes / 1024, 1),
+            "threads": 1 + len(session.thread_profiles),
+            "by_cumulative": hotspots(stats, "cumulative", self.top_n),
+            "by_own_time": hotspots(stats, "own", self.top_n),
+            "allocations": allocations(session.memory_before, session.memory_after, self.top_n),
+            "profile_path": profile_path,
+            "report_path": report_path
+        }
+        atomic_write(report_path, json.dumps(report, indent=1))
+        if self.result_store is not None:
+            self.result_store.record("profile", name=session.label, timings={"wall_ms": session.wall_ms},
+                                     artifacts={"profile_path": profile_path, "report_path": report_path},
+                                     payload={"profile_id": session.id, "run_id": run_id})
+        return report
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """A saved report by id"""
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"sample_percent": self.sample_percent, **self.stats}
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+import numpy as np
+from agents.search_index import STOP_WORDS
+
+DIM = 512
+# Brute force stays under ~25 ms up to here; beyond it queries go through LSH tables and only candidates are scored
+ANN_THRESHOLD = 100000
+LSH_TABLES = 16
+LSH_BITS = 8
+MAX_EXAMPLE_CHARS = 2500
+
+WORD = re.compile(r'[a-z0-9]+')
+
+FEW_SHOT_SYSTEM_PROMPT = """Generate ONLY Python diagrams code, in the style of these validated examples for similar requests.
+Import every class you use from its diagrams module as the examples do. For services without a dedicated icon use Lambda() or IAM() with a descriptive label.
+
+{examples}
+
+Return ONLY the Python code, no explanations."""
+
+# Search stop words that carry direction or structure ("S3 to Lambda", "ECS in a VPC") are kept for reuse checks
+FILLER_WORDS = STOP_WORDS - {'to', 'in', 'on', 'with', 'of', 'for', 'using', 'uses', 'use'}
+
+def content_sequence(prompt: str) -> tuple:
+    """Lower-cased words in order, minus filler and plural endings; equal sequences mean the same request in other words"""
+    return tuple(word[:-1] if len(word) > 3 and word.endswith('s') else word
+                 for word in WORD.findall(prompt.lower()) if word not in FILLER_WORDS)
+
+def _bucket(feature: str) -> tuple:
+    """Stable (index, sign) for a feature; crc32 rather than hash() so vectors on disk stay valid across processes"""
+    value = zlib.crc32(feature.encode('utf-8'))
+    return value % DIM, 1.0 if value & 0x80000000 else -1.0
+
+def embed(prompt: str) -> np.ndarray:
+    """Hashed bag of words, word bigrams and character trigrams, L2-normalised"""
+    words = WORD.findall(prompt.lower())
+    features = [(word, 1.0) for word in words]
+    features += [(f"{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+    # Trigrams make "lambdas"/"lambda" and "dynamo"/"dynamodb" land close together
+    features += [(f"#{word[i:i + 3]}", 0.5) for word in words for i in range(max(1, len(word) - 2))]
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature, weight in features:
+        index, sign = _bucket(feature)
+        vector[index] += sign * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class PromptIndex:
+    """Vector index of prompts whose diagrams rendered, for near-duplicate reuse and few-shot examples"""
+
+    def __init__(self, directory: str = "outputs/similarity"):
+        self.directory = directory
+        # One JSON line per prompt with its embedding inline, appended in a single write so processes cannot interleave
+        self.entries_path = os.path.join(directory, "prompts.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((64, DIM), dtype=np.float32)
+        self._has_graph = np.zeros(64, dtype=bool)
+        self._entries: List[Dict[str, Any]] = []
+        self._by_prompt: Dict[str, int] = {}
+        self._run_ids = set()
+        self._lsh_planes = None
+        self._lsh_tables = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._by_prompt)
+
+    def _load(self):
+        """Replay the append-only file; a torn last line from a crash is skipped"""
+        if not os.path.exists(self.entries_path):
+            return
+        with open(self.entries_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    vector = np.frombuffer(base64.b64decode(entry.pop("vector")), dtype=np.float32)
+                except (ValueError, KeyError):
+                    continue
+                if vector.shape == (DIM,):
+                    self._append(entry, vector)
+
+    def _append(self, entry: Dict[str, Any], vector: np.ndarray) -> int:
+        """Add a row in memory; an earlier row for the same prompt is zeroed so it never matches again"""
+        row = len(self._entries)
+        if row == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._has_graph = np.concatenate([self._has_graph, np.zeros_like(self._has_graph)])
+        key = ' '.join(entry["prompt"].lower().split())
+        previous = self._by_prompt.get(key)
+        if previous is not None:
+            self._vectors[previous] = 0
+        self._vectors[row] = vector
+        self._has_graph[row] = entry.get("graph_ir") is not None
+        self._entries.append(entry)
+        self._by_prompt[key] = row
+        self._run_ids.add(entry.get("run_id"))
+        if self._lsh_tables is not None:
+            self._lsh_insert(row)
+        return row
+
+    def add(self, prompt: str, diagram_code: str, graph_ir: Dict[str, Any] = None, run_id: str = None, created_at: str = None):
+        """Index a prompt whose code rendered successfully; the latest code for a prompt wins"""
+        entry = {"prompt": prompt, "diagram_code": diagram_code, "graph_ir": graph_ir, "run_id": run_id,
+                 "created_at": created_at or datetime.now(timezone.utc).isoformat()}
+        vector = embed(prompt)
+        line = json.dumps({**entry, "vector": base64.b64encode(vector.tobytes()).decode('ascii')}, default=str) + '\n'
+        with self._lock:
+            with open(self.entries_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._append(entry, vector)
+
+    def _lsh_keys(self, vectors: np.ndarray) -> np.ndarray:
+        """Random-hyperplane signatures, one LSH_BITS-bit integer per table"""
+        bits = (np.einsum('tbd,nd->ntb', self._lsh_planes, vectors) > 0).astype(np.int64)
+        return (bits << np.arange(LSH_BITS)).sum(axis=2)
+
+    def _build_lsh(self):
+        """Hash every row into the LSH tables; done once the index passes ANN_THRESHOLD"""
+        self._lsh_planes = np.random.default_rng(0).standard_normal((LSH_TABLES, LSH_BITS, DIM)).astype(np.float32)
+        self._lsh_tables = [dict() for _ in range(LSH_TABLES)]
+        keys = self._lsh_keys(self._vectors[:len(self._entries)])
+        for row, row_keys in enumerate(keys.tolist()):
+            for table, key in zip(self._lsh_tables, row_keys):
+                table.setdefault(key, []).append(row)
+
+    def _lsh_insert(self, row: int):
+        for table, key in zip(self._lsh_tables, self._lsh_keys(self._vectors[row:row + 1])[0].tolist()):
+            table.setdefault(key, []).append(row)
+
+    def query(self, prompt: str, k: int = 3, with_graph: bool = False) -> List[Dict[str, Any]]:
+        """Top-k most similar indexed prompts with their code and cosine score"""
+        vector = embed(prompt)
+        with self._lock:
+            count = len(self._entries)
+            if not count:
+                return []
+            rows = None
+            if count > ANN_THRESHOLD:
+                if self._lsh_tables is None:
+                    self._build_lsh()
+                buckets = [table.get(key, []) for table, key in zip(self._lsh_tables, self._lsh_keys(vector[None, :])[0].tolist())]
+                candidates = np.unique(np.fromiter((row for bucket in buckets for row in bucket), dtype=np.int64))
+                # Too few candidates to fill k means the buckets missed; fall back to the exact scan
+                if len(candidates) >= k:
+                    rows = candidates
+            if rows is None:
+                scores = self._vectors[:count] @ vector
+                rows = np.arange(count)
+            else:
+                scores = self._vectors[rows] @ vector
+            if with_graph:
+                scores = np.where(self._has_graph[rows], scores, 0)
+            top = np.argsort(-scores)[:k]
+            return [{**self._entries[int(rows[i])], "score": round(float(scores[i]), 4)} for i in top if scores[i] > 0]
+
+    def sync(self, store) -> int:
+        """Index successful generations recorded since the last sync (all of them the first time)"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                synced_until = json.load(f).get("synced_until", '')
+        except (FileNotFoundError, ValueError):
+            synced_until = ''
+        runs = []
+        for run in store.iter_runs(kind="diagram", success_only=True):
+            if run["created_at"] <= synced_until:
+                break
+            runs.append(run)
+        added = 0
+        # Oldest first so the newest code for a repeated prompt is the one kept
+        for run in reversed(runs):
+            payload = run["payload"] or {}
+            # Only prompts that asked for a whole diagram; edits, imports and reuses carry other text
+            if not run["prompt"] or not payload.get("diagram_code") or "model" not in payload or "edit_of_code_hash" in payload:
+                continue
+            if run["id"] in self._run_ids:
+                continue  # added live by this or another process
+            self.add(run["prompt"], payload["diagram_code"], payload.get("graph_ir"), run["id"], run["created_at"])
+            added += 1
+        if runs:
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"synced_until": runs[0]["created_at"]}, f)
+        return added
+
+def few_shot_prompt(examples: List[Dict[str, Any]]) -> str:
+    """Compact system prompt built from validated examples instead of the full import list"""
+    blocks = []
+    for example in examples:
+        code = '\n'.join(line for line in example["diagram_code"].splitlines() if line.strip())
+        blocks.append(f"Request: {example['prompt']}\nCode:\n```python\n{code[:MAX_EXAMPLE_CHARS]}\n```")
+    return FEW_SHOT_SYSTEM_PROMPT.format(examples='\n\n'.join(blocks))
+
+def few_shot_graph_prompt(system_prompt: str, examples: List[Dict[str, Any]]) -> str:
+    """Graph IR system prompt followed by validated example graphs"""
+    blocks = [f"Request: {example['prompt']}\nGraph: {json.dumps(example['graph_ir'], separators=(',', ':'))[:MAX_EXAMPLE_CHARS]}"
+              for example in examples]
+    return system_prompt + "\n\nValidated examples for similar requests:\n\n" + '\n\n'.join(blocks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the prompt similarity index")
+    parser.add_argument("query", nargs="?", help="prompt to find similar past requests for (omit to only sync)")
+    parser.add_argument("--db", default="outputs/results.db", help="result store to index")
+    parser.add_argument("--dir", default="outputs/similarity", help="index directory")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from agents.result_store import ResultStore
+    index = PromptIndex(args.dir)
+    started = time.perf_counter()
+    added = index.sync(ResultStore(args.db))
+    print(f"Indexed {added} new prompts in {time.perf_counter() - started:.2f}s; {len(index)} distinct prompts")
+    if args.query:
+        started = time.perf_counter()
+        matches = index.query(args.query, args.k)
+        print(f"Top {len(matches)} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for match in matches:
+            print(f"  {match['score']:.3f}  {match['prompt']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import ast
+import shutil
+import subprocess
+from typing import List, Optional
+
+SUPPORTED_OUTPUT_FORMATS = ("png", "svg", "jpg", "pdf", "dot")
+
+def render_formats_for(output_format: str, with_layout: bool = True) -> List[str]:
+    """Formats to ask the diagrams library for; 'dot' carries the Graphviz layout for DrawIO"""
+    if output_format not in SUPPORTED_OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    formats = [output_format]
+    if with_layout and output_format != "dot":
+        formats.append("dot")
+    return formats
+
+def _find_diagram_call(tree: ast.AST) -> Optional[ast.Call]:
+    """Locate the first Diagram(...) call in the generated code"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else getattr(func, 'attr', None)
+            if name == 'Diagram':
+                return node
+    return None
+
+def has_diagram_call(diagram_code: str) -> bool:
+    """True when the code parses and builds a Diagram(...)"""
+    try:
+        return _find_diagram_call(ast.parse(diagram_code)) is not None
+    except SyntaxError:
+        return False
+
+def set_diagram_kwarg(diagram_code: str, keyword: str, value_source: str) -> str:
+    """Set or replace a keyword argument on the Diagram(...) call, leaving the rest of the code untouched"""
+    try:
+        tree = ast.parse(diagram_code)
+    except SyntaxError:
+        return diagram_code
+    call = _find_diagram_call(tree)
+    if call is None:
+        return diagram_code
+
+    # ast offsets are UTF-8 byte offsets, so edit the encoded lines
+    lines = [line.encode('utf-8') for line in diagram_code.split('\n')]
+
+    def splice(start_line: int, start_col: int, end_line: int, end_col: int, text: str):
+        head = lines[start_line - 1][:start_col]
+        tail = lines[end_line - 1][end_col:]
+        lines[start_line - 1:end_line] = [head + text.encode('utf-8') + tail]
+
+    existing = next((kw for kw in call.keywords if kw.arg == keyword), None)
+    if existing is not None:
+        value = existing.value
+        splice(value.lineno, value.col_offset, value.end_lineno, value.end_col_offset, value_source)
+    else:
+        # Insert just before the call's closing parenthesis
+        end_line, end_col = call.end_lineno, call.end_col_offset - 1
+        prefix = ", " if call.args or call.keywords else ""
+        splice(end_line, end_col, end_line, end_col, f"{prefix}{keyword}={value_source}")
+    return '\n'.join(line.decode('utf-8') for line in lines)
+
+def with_output_formats(diagram_code: str, formats: List[str]) -> str:
+    """Ask the diagrams library to write the given formats (e.g. svg plus the laid-out dot)"""
+    if formats == ["png"]:
+        return diagram_code
+    return set_diagram_kwarg(diagram_code, "outformat", repr(list(formats)))
+
+def rasterize_svg(svg_bytes: bytes, scale: float = 1.0) -> bytes:
+    """Rasterise an SVG to PNG on demand using cairosvg or the rsvg-convert CLI"""
+    try:
+        import cairosvg
+        return cairosvg.svg2png(bytestring=svg_bytes, scale=scale)
+    except ImportError:
+        pass
+
+    rsvg = shutil.which("rsvg-convert")
+    if rsvg:
+        result = subprocess.run([rsvg, "--format=png", f"--zoom={scale}"], input=svg_bytes, capture_output=True, timeout=60)
+        if result.returncode == 0:
+            return result.stdout
+        raise RuntimeError(f"rsvg-convert failed: {result.stderr.decode('utf-8', errors='replace')}")
+
+    raise RuntimeError("PNG rasterisation needs cairosvg (pip install cairosvg) or rsvg-convert on PATH")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Optional
+from agents import profiling
+from agents.artifact_writer import write_artifact, read_artifact
+from agents.drawio_converter import DrawIOConverter
+from agents.graphviz_layout import parse_dot_layout
+from agents.render_formats import render_formats_for, set_diagram_kwarg, with_output_formats
+from agents.request_control import AdmissionQueue, OverloadedError
+
+IMAGE_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml", "jpg": "image/jpeg", "pdf": "application/pdf"}
+
+# Runs in the job process: cap it (and the Graphviz processes it starts, which inherit the limits), then run the script
+BOOTSTRAP = """import resource, runpy, sys
+cpu, memory, output = (int(value) for value in sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_FSIZE, (output, output))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+sys.argv = sys.argv[4:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+MEMORY_ERRORS = ("MemoryError", "bad_alloc", "out of memory", "Cannot allocate memory")
+CPU_ERRORS = ("SIGXCPU", "CPU time limit")
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+class RenderLimits:
+    """Per-job caps: CPU seconds and address space apply to every process of the job, wall clock to the job as a whole"""
+
+    def __init__(self, cpu_seconds: int = 30, memory_mb: int = 1024, wall_seconds: float = 60, output_mb: int = 64):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_seconds = wall_seconds
+        self.output_mb = output_mb
+
+    @classmethod
+    def from_env(cls) -> "RenderLimits":
+        """RENDER_CPU_SECONDS, RENDER_MEMORY_MB (0 = no cap), RENDER_WALL_SECONDS and RENDER_OUTPUT_MB"""
+        return cls(int(_env_number("RENDER_CPU_SECONDS", 30)), int(_env_number("RENDER_MEMORY_MB", 1024)),
+                   _env_number("RENDER_WALL_SECONDS", 60), int(_env_number("RENDER_OUTPUT_MB", 64)))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"cpu_seconds": self.cpu_seconds, "memory_mb": self.memory_mb, "wall_seconds": self.wall_seconds, "output_mb": self.output_mb}
+
+class RenderJob:
+    """One sandboxed process: started and waited for on a worker thread, killable from any thread"""
+
+    def __init__(self, argv: list, cwd: str, env: Dict[str, str]):
+        self.argv = argv
+        self.cwd = cwd
+        self.env = env
+        self.pid: Optional[int] = None
+        self.killed_reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._reaped = False
+
+    def kill(self, reason: str):
+        """SIGKILL the job's whole process group, Graphviz children included; no-op once it has been reaped"""
+        with self._lock:
+            if self._reaped:
+                return
+            self.killed_reason = self.killed_reason or reason
+            if self.pid is None:
+                return  # run() kills it as soon as it starts
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def run(self, wall_seconds: float) -> Dict[str, Any]:
+        """Run to completion or until the wall clock kills it; returns exit status, stderr and rusage"""
+        with tempfile.TemporaryFile() as stderr:
+            # A session of its own makes the job a process group that can be killed as one
+            process = subprocess.Popen(self.argv, cwd=self.cwd, env=self.env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=stderr, start_new_session=True)
+            with self._lock:
+                self.pid = process.pid
+            if self.killed_reason:
+                self.kill(self.killed_reason)  # cancelled before the process existed
+            timer = threading.Timer(wall_seconds, self.kill, ("wall_clock",))
+            timer.daemon = True
+            started = time.perf_counter()
+            timer.start()
+            try:
+                # wait4 rather than Popen.wait: it also returns the job's rusage, children it waited for included
+                _, status, usage = os.wait4(process.pid, 0)
+            finally:
+                timer.cancel()
+            wall_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                # Anything the job left behind (a Graphviz process orphaned by a CPU kill) goes with it
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+                self._reaped = True
+            process.returncode = os.waitstatus_to_exitcode(status)
+            stderr.seek(0)
+            return {"returncode": process.returncode, "stderr": stderr.read().decode('utf-8', errors='replace'),
+                    "usage": usage, "wall_ms": wall_ms}
+
+class SandboxedRenderClient:
+    """Renders diagram code in local worker processes with per-job CPU, memory and wall-clock limits"""
+
+    def __init__(self, limits: RenderLimits = None, max_workers: int = None, max_pending: int = 64, python: str = None):
+        self.drawio_converter = DrawIOConverter()
+        self.limits = limits or RenderLimits.from_env()
+        # One job per core keeps a runaway from slowing its neighbours; the rest wait their turn
+        max_workers = max_workers or int(_env_number("RENDER_MAX_WORKERS", os.cpu_count() or 2))
+        self.slots = AdmissionQueue(max_workers, max_pending)
+        self.python = python or os.environ.get("RENDER_PYTHON") or sys.executable
+        self.stats = {"jobs": 0, "failures": 0, "killed": {"cpu": 0, "memory": 0, "wall_clock": 0, "output": 0, "cancelled": 0},
+                      "cpu_seconds": 0.0, "max_rss_mb": 0.0}
+
+    def _job_env(self) -> Dict[str, str]:
+        """The caller's environment minus cloud credentials, which generated code has no business reading"""
+        return {key: value for key, value in os.environ.items() if not key.startswith(("AWS_", "S3_"))}
+
+    @staticmethod
+    def _killed_reason(job: RenderJob, outcome: Dict[str, Any], limits: RenderLimits, cpu_seconds: float) -> Optional[str]:
+        """Which limit ended the job, if any"""
+        if job.killed_reason:
+            return job.killed_reason
+        returncode, stderr = outcome["returncode"], outcome["stderr"]
+        if returncode == 0:
+            return None
+        if returncode == -signal.SIGXCPU or any(marker in stderr for marker in CPU_ERRORS):
+            return "cpu"
+        if returncode == -signal.SIGKILL:
+            # The hard CPU limit sends SIGKILL; otherwise it was the kernel's OOM killer
+            return "cpu" if cpu_seconds >= limits.cpu_seconds else "memory"
+        if returncode == -signal.SIGXFSZ or "SIGXFSZ" in stderr or "File too large" in stderr:
+            return "output"
+        if limits.memory_mb and any(marker in stderr for marker in MEMORY_ERRORS):
+            return "memory"
+        return None
+
+    def _resources(self, job: RenderJob, outcome: Dict[str, Any], limits: RenderLimits) -> Dict[str, Any]:
+        """Per-job usage report, also folded into the client's counters"""
+        usage = outcome["usage"]
+        cpu_seconds = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in KiB on Linux; the largest process of the job, Python or Graphviz
+        max_rss_mb = usage.ru_maxrss / 1024
+        killed = self._killed_reason(job, outcome, limits, cpu_seconds)
+        self.stats["jobs"] += 1
+        self.stats["cpu_seconds"] = round(self.stats["cpu_seconds"] + cpu_seconds, 3)
+        self.stats["max_rss_mb"] = round(max(self.stats["max_rss_mb"], max_rss_mb), 1)
+        if killed:
+            self.stats["killed"][killed] += 1
+        return {
+            "cpu_seconds": round(cpu_seconds, 3),
+            "max_rss_mb": round(max_rss_mb, 1),
+            "wall_ms": round(outcome["wall_ms"], 1),
+            "returncode": outcome["returncode"],
+            "killed_reason": killed,
+            "limits": limits.as_dict()
+        }
+
+    async def run_script(self, script_path: str, cwd: str, timeout: float = None) -> Dict[str, Any]:
+        """Run one script under the limits; the wall clock is the smaller of the limit and the caller's remaining budget"""
+        limits = self.limits
+        wall_seconds = min(limits.wall_seconds, timeout) if timeout else limits.wall_seconds
+        argv = [self.python, "-c", BOOTSTRAP, str(limits.cpu_seconds), str(limits.memory_mb * 1024 * 1024),
+                str(limits.output_mb * 1024 * 1024), script_path]
+        job = RenderJob(argv, cwd, self._job_env())
+        task = asyncio.ensure_future(profiling.to_thread(job.run, wall_seconds))
+        try:
+            # Shielded so a cancelled request kills the process and still waits for it to be reaped
+            outcome = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            job.kill("cancelled")
+            self.stats["killed"]["cancelled"] += 1
+            await asyncio.wait([task])
+            raise
+        return {"outcome": outcome, "resources": self._resources(job, outcome, limits)}
+
+    async def call_diagram_server(self, diagram_code: str, filename: str = "architecture_diagram", workspace_dir: str = None, persist: bool = True, output_format: str = "png",
+                                  previous_positions: Dict[str, Any] = None, timeout: float = None, with_drawio: bool = True,
+                                  render_code: str = None) -> Dict[str, Any]:
+        """Render render_code (default diagram_code) in a capped local process; the result carries the job's resource usage under "resources" """
+        if not workspace_dir:
+            workspace_dir = os.path.abspath("outputs/diagrams/generated-diagrams")
+        os.makedirs(workspace_dir, exist_ok=True)
+
+        formats = render_formats_for(output_format)
+        render_code = with_output_formats(render_code or diagram_code, formats)
+        render_code = set_diagram_kwarg(set_diagram_kwarg(render_code, "filename", repr(filename)), "show", "False")
+
+        started = time.perf_counter()
+        try:
+            async with self.slots.slot(timeout):
+                queued_ms = round((time.perf_counter() - started) * 1000, 1)
+                remaining = timeout - (time.perf_counter() - started) if timeout else None
+                # Each job gets a scratch directory, so concurrent renders of the same name cannot collide
+                job_dir = tempfile.mkdtemp(prefix=f".{filename}-", dir=workspace_dir)
+                try:
+                    script_path = os.path.join(job_dir, f"{filename}_temp.py")
+                    await write_artifact(script_path, render_code)
+                    run = await self.run_script(script_path, job_dir, remaining)
+                    return await self._collect(run, job_dir, workspace_dir, filename, formats, output_format, diagram_code,
+                                               persist, previous_positions, with_drawio, queued_ms)
+                finally:
+                    await profiling.to_thread(shutil.rmtree, job_dir, True)
+        except OverloadedError as e:
+            return {"success": False, "error": f"Render sandbox busy: {e}"}
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"No render slot within {timeout:g}s", "timed_out": True}
+        except Exception as e:
+            self.stats["failures"] += 1
+            return {"success": False, "error": str(e)}
+
+    async def _collect(self, run: Dict[str, Any], job_dir: str, workspace_dir: str, filename: str, formats: list, output_format: str,
+                       diagram_code: str, persist: bool, previous_positions: Optional[Dict[str, Any]], with_drawio: bool,
+                       queued_ms: float) -> Dict[str, Any]:
+        """Turn a finished job into the same result shape the MCP clients return"""
+        outcome, resources = run["outcome"], {**run["resources"], "queued_ms": queued_ms}
+        if outcome["returncode"] != 0:
+            self.stats["failures"] += 1
+            killed = resources["killed_reason"]
+            if killed:
+                return {"success": False, "error": f"Render killed: {killed} limit exceeded ({self.limits.as_dict()})",
+                        "timed_out": killed == "wall_clock", "resources": resources}
+            return {"success": False, "error": f"Render failed: {outcome['stderr'][-4000:]}", "resources": resources}
+
+        image_source = os.path.join(job_dir, f"{filename}.{output_format}")
+        if not os.path.exists(image_source):
+            self.stats["failures"] += 1
+            return {"success": False, "error": f"{output_format.upper()} file not created", "resources": resources}
+        image_bytes = await read_artifact(image_source)
+        svg_bytes = image_bytes if output_format == "svg" else None
+
+        layout = None
+        dot_path = os.path.join(job_dir, f"{filename}.dot")
+        if 'dot' in formats and os.path.exists(dot_path):
+            layout = parse_dot_layout((await read_artifact(dot_path)).decode('utf-8', errors='replace'))
+
+        # Only persisted renders take the shared name; in-memory ones are converted from the job directory's copy
+        image_path = os.path.join(workspace_dir, f"{filename}.{output_format}") if persist else image_source
+        if persist:
+            await write_artifact(image_path, image_bytes)
+        drawio_result = await self.drawio_converter.convert_to_drawio_async(image_path, filename, diagram_code, persist=persist, layout=layout,
+                                                                          previous_positions=previous_positions) if with_drawio else None
+
+        return {
+            "success": True,
+            "result": {"status": "success", "message": "Diagram generated in render sandbox"},
+            "image_path": image_path if persist else None,
+            "image_bytes": image_bytes,
+            "image_format": output_format,
+            "image_mime": IMAGE_MIME_TYPES.get(output_format),
+            "svg_bytes": svg_bytes,
+            "layout": layout,
+            "persisted": persist,
+            "drawio_result": drawio_result,
+            "resources": resources
+        }
+
+    async def call_rekognition_server(self, image_path: str, operation: str) -> Dict[str, Any]:
+        return {"success": False, "error": "Rekognition not implemented"}
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"limits": self.limits.as_dict(), "slots": self.slots.stats(), **self.stats}
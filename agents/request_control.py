@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional, Tuple
+from agents import profiling
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs past its end-to-end deadline"""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Request deadline of {timeout:g}s exceeded during {stage}")
+        self.stage = stage
+        self.timeout = timeout
+
+class OverloadedError(RuntimeError):
+    """Raised when the admission queue is full and new work is shed"""
+
+class Deadline:
+    """End-to-end request deadline shared by every stage of a request"""
+
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when the request has no deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage: str):
+        """Fail fast before starting a stage that can no longer finish in time"""
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded(stage, self.timeout)
+
+    async def run(self, awaitable: Awaitable, stage: str) -> Any:
+        """Await a coroutine, cancelling it if the deadline passes"""
+        self.check(stage)
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage, self.timeout)
+
+    async def run_blocking(self, func: Callable, *args, stage: str, executor=None, **kwargs) -> Any:
+        """Run a blocking call (e.g. boto3) on a worker thread within the deadline; executor keeps it off the shared default pool"""
+        return await self.run(profiling.run_in_executor(executor, func, *args, **kwargs), stage)
+
+class AdmissionQueue:
+    """Bounded admission: a fixed number of requests run, a bounded number wait, the rest are shed (thread and loop safe)"""
+
+    def __init__(self, max_concurrent: int = 4, max_pending: int = 16):
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()  # (loop, future) in arrival order
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        """Current queue occupancy and shed count"""
+        with self._lock:
+            return {"in_flight": self._in_flight, "pending": len(self._waiters), "rejected": self.rejected,
+                    "max_concurrent": self.max_concurrent, "max_pending": self.max_pending}
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """Take a slot, waiting in line if needed; raises OverloadedError when the line is full"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._in_flight += 1
+                return
+            if len(self._waiters) >= self.max_pending:
+                self.rejected += 1
+                raise OverloadedError(f"Server busy: {self._in_flight} requests running and {len(self._waiters)} waiting")
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BaseException:
+            with self._lock:
+                granted = future.done() and not future.cancelled()
+                if not granted:
+                    future.cancel()
+                    try:
+                        self._waiters.remove((loop, future))
+                    except ValueError:
+                        pass
+            if granted:
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        """Free a slot, handing it directly to the oldest live waiter"""
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if future.done() or loop.is_closed():
+                    continue
+                # in_flight stays the same: the slot moves to the waiter
+                loop.call_soon_threadsafe(self._grant, future)
+                return
+            self._in_flight -= 1
+
+    def _grant(self, future: asyncio.Future):
+        """Resolve a waiter on its own loop, releasing the slot again if it already left"""
+        if future.done():
+            self.release()
+        else:
+            future.set_result(True)
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """async with admission.slot(): ... holds one slot for the duration of a request"""
+        await self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+class SingleFlight:
+    """Coalesce identical concurrent calls: the first caller runs the work, later callers await the same task"""
+
+    def __init__(self):
+        self._flights = {}  # (loop id, key) -> [task, waiter count]
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        return len(self._flights)
+
+    async def run(self, key: Any, work: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """Return (result, shared); the work is cancelled only when every waiter has gone away"""
+        flight_key = (id(asyncio.get_running_loop()), key)
+        flight = self._flights.get(flight_key)
+        shared = flight is not None
+        if flight is None:
+            task = asyncio.ensure_future(work())
+            flight = self._flights[flight_key] = [task, 0]
+            task.add_done_callback(lambda done: self._flights.pop(flight_key, None) if self._flights.get(flight_key, [None])[0] is done else None)
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight[1] += 1
+        try:
+            # shield: one impatient caller must not cancel the work for everybody else
+            return await asyncio.shield(flight[0]), shared
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                flight[0].cancel()
+
+    def stats(self) -> dict:
+        """Flights started, callers that joined an existing flight, and flights running now"""
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": self.in_flight()}
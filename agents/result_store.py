@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from urllib.parse import quote
+
+class ResultStore:
+    """Append-only SQLite (WAL) store of generation and analysis runs, written off the request path"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            name TEXT,
+            prompt TEXT,
+            code_hash TEXT,
+            success INTEGER NOT NULL,
+            artifacts TEXT,
+            timings TEXT,
+            token_usage TEXT,
+            payload TEXT,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_runs_name ON runs (name, created_at);
+        CREATE INDEX IF NOT EXISTS idx_runs_code_hash ON runs (code_hash);
+        CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (created_at);
+    """
+    JSON_COLUMNS = ("artifacts", "timings", "token_usage", "payload")
+
+    def __init__(self, db_path: str = "outputs/results.db", readonly: bool = False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        if readonly:
+            # Tools that only read must not create an empty database at a mistyped path
+            if not os.path.exists(db_path):
+                raise FileNotFoundError(f"Result store not found: {db_path}")
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; WAL lets readers run while the writer thread commits"""
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.db_path))}?mode=ro", uri=True, timeout=30)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def code_hash(code: Optional[str]) -> Optional[str]:
+        """Stable content hash for generated diagram code"""
+        if not code:
+            return None
+        return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+    def record(self, kind: str, name: str = None, prompt: str = None, code: str = None, success: bool = True,
+               artifacts: Dict[str, Any] = None, timings: Dict[str, float] = None,
+               token_usage: Dict[str, int] = None, payload: Dict[str, Any] = None) -> str:
+        """Queue a run record for the background writer and return its id immediately"""
+        run_id = uuid.uuid4().hex
+        row = {
+            "id": run_id,
+            "kind": kind,
+            "name": name,
+            "prompt": prompt,
+            "code_hash": self.code_hash(code),
+            "success": 1 if success else 0,
+            "artifacts": json.dumps(artifacts or {}, default=str),
+            "timings": json.dumps(timings or {}),
+            "token_usage": json.dumps(token_usage or {}),
+            "payload": json.dumps(payload or {}, default=str),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        self._ensure_writer()
+        self._queue.put(row)
+        return run_id
+
+    def _ensure_writer(self):
+        """Start the writer thread on first use"""
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="result-store-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """Drain queued rows in batches, one transaction per batch"""
+        conn = self._connect()
+        columns = ("id", "kind", "name", "prompt", "code_hash", "success", "artifacts",
+                   "timings", "token_usage", "payload", "created_at")
+        insert_sql = f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        try:
+            while True:
+                row = self._queue.get()
+                if row is None:
+                    self._queue.task_done()
+                    break
+                batch = [row]
+                while True:
+                    try:
+                        extra = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if extra is None:
+                        # Put the sentinel back so the loop exits after this batch
+                        self._queue.task_done()
+                        self._queue.put(None)
+                        break
+                    batch.append(extra)
+                try:
+                    with conn:
+                        conn.executemany(insert_sql, [tuple(item[col] for col in columns) for item in batch])
+                except sqlite3.Error as e:
+                    print(f"Result store write failed: {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            conn.close()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until all queued records are committed"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        """Flush pending records and stop the writer thread"""
+        if self._writer and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Decode JSON columns of a result row"""
+        record = dict(row)
+        for column in self.JSON_COLUMNS:
+            record[column] = json.loads(record[column]) if record[column] else {}
+        record["success"] = bool(record["success"])
+        return record
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """Run a read query and decode rows"""
+        with closing(self._connect()) as conn:
+            return [self._row_to_dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a single run by id"""
+        rows = self._query("SELECT * FROM runs WHERE id = ?", (run_id,))
+        return rows[0] if rows else None
+
+    def find_by_name(self, name: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent runs for a diagram name"""
+        return self._query("SELECT * FROM runs WHERE name = ? ORDER BY created_at DESC LIMIT ?", (name, limit))
+
+    def find_by_code_hash(self, code_hash: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Runs that produced exactly this diagram code"""
+        return self._query("SELECT * FROM runs WHERE code_hash = ? ORDER BY created_at DESC LIMIT ?", (code_hash, limit))
+
+    def find_between(self, start: str, end: str, kind: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Runs created within [start, end), given as ISO-8601 timestamps"""
+        if kind:
+            return self._query("SELECT * FROM runs WHERE created_at >= ? AND created_at < ? AND kind = ? ORDER BY created_at DESC LIMIT ?",
+                               (start, end, kind, limit))
+        return self._query("SELECT * FROM runs WHERE created_at >= ? AND created_at < ? ORDER BY created_at DESC LIMIT ?",
+                           (start, end, limit))
+
+    def iter_runs(self, kind: str = None, success_only: bool = False, batch_size: int = 500):
+        """Stream every run, newest first, without loading the whole table"""
+        clauses = [clause for clause, wanted in (("kind = ?", kind), ("success = 1", success_only)) if wanted]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"SELECT * FROM runs {where} ORDER BY created_at DESC", (kind,) if kind else ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_to_dict(row)
+        finally:
+            conn.close()
+
+    def recent(self, kind: str = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent runs, optionally filtered by kind"""
+        if kind:
+            return self._query("SELECT * FROM runs WHERE kind = ? ORDER BY created_at DESC LIMIT ?", (kind, limit))
+        return self._query("SELECT * FROM runs ORDER BY created_at DESC LIMIT ?", (limit,))
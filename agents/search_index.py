@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, List, Optional
+from agents.graph_ir import NODE_TYPES, graph_ir_to_parsed
+
+# Query words naming a service type; the keys, their class names and the usual spellings in prompts
+SERVICE_ALIASES: Dict[str, str] = {}
+for _key, (_module, _class_name) in NODE_TYPES.items():
+    SERVICE_ALIASES[_key.replace('_', '')] = _key
+    SERVICE_ALIASES[_class_name.lower()] = _key
+SERVICE_ALIASES.update({
+    'lambdas': 'lambda', 'apigw': 'api_gateway', 'dynamo': 'dynamodb', 'kinesisdatastreams': 'kinesis',
+    'loadbalancer': 'elb', 'alb': 'elb', 'nlb': 'elb', 'eventbus': 'eventbridge', 'stepfunction': 'stepfunctions',
+    'sfn': 'stepfunctions', 'queue': 'sqs', 'topic': 'sns', 'aurora': 'rds'
+})
+
+ARROW = re.compile(r'\s*(?:→|->|=>|>>)\s*')
+WORD = re.compile(r'\w+')
+# Filler words in queries such as "diagrams using Kinesis -> ECS"
+STOP_WORDS = {'a', 'an', 'and', 'the', 'of', 'to', 'in', 'on', 'with', 'using', 'uses', 'use', 'that', 'which', 'for',
+              'diagram', 'diagrams', 'architecture', 'architectures', 'show', 'find', 'me', 'all', 'any'}
+
+def service_for_words(words: List[str]) -> Optional[str]:
+    """Service type named by a run of query words ("api gateway", "ECS"), if any"""
+    joined = ''.join(word.lower() for word in words)
+    return SERVICE_ALIASES.get(joined) or SERVICE_ALIASES.get(joined.rstrip('s'))
+
+def parse_query(query: str) -> Dict[str, Any]:
+    """Split a query into service-to-service edges, required services and free-text terms"""
+    segments = ARROW.split(query.strip())
+    words = [WORD.findall(segment) for segment in segments]
+    edges, services, consumed = [], [], [set() for _ in segments]
+    for i in range(len(segments) - 1):
+        source = target = None
+        # Two-word names such as "step functions" take precedence over their last word
+        for size in (2, 1):
+            if source is None and len(words[i]) >= size and service_for_words(words[i][-size:]):
+                source = service_for_words(words[i][-size:])
+                consumed[i].update(range(len(words[i]) - size, len(words[i])))
+            if target is None and len(words[i + 1]) >= size and service_for_words(words[i + 1][:size]):
+                target = service_for_words(words[i + 1][:size])
+                consumed[i + 1].update(range(size))
+        if source and target:
+            edges.append((source, target))
+    terms = []
+    for segment_words, used in zip(words, consumed):
+        for index, word in enumerate(segment_words):
+            if index in used or word.lower() in STOP_WORDS:
+                continue
+            service = service_for_words([word])
+            if service:
+                services.append(service)
+            else:
+                terms.append(word.lower())
+    return {"edges": edges, "services": sorted(set(services)), "terms": terms}
+
+def index_fields(parsed: Dict[str, Any], title: str = None) -> Dict[str, Any]:
+    """Searchable labels, service types and type-level edges of a parsed diagram"""
+    services = parsed.get('services') or {}
+    labels = [title] if title else []
+    labels += [cluster.get('label') or name for name, cluster in (parsed.get('clusters') or {}).items()]
+    labels += [service.get('label') for service in services.values()]
+    edges = set()
+    for source, target in parsed.get('connections') or []:
+        if source in services and target in services:
+            edges.add((services[source]['type'], services[target]['type']))
+    return {
+        "labels": ' '.join(label for label in labels if label),
+        "services": sorted({service['type'] for service in services.values()}),
+        "edges": sorted(edges)
+    }
+
+class DiagramIndex:
+    """SQLite FTS5 index of generated diagrams: prompt, labels, service types and edges, one row per distinct code"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS diagrams (
+            id INTEGER PRIMARY KEY,
+            code_hash TEXT NOT NULL UNIQUE,
+            run_id TEXT,
+            name TEXT,
+            prompt TEXT,
+            diagram_code TEXT NOT NULL,
+            graph_ir TEXT,
+            services TEXT,
+            artifacts TEXT,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS edges (
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            diagram_id INTEGER NOT NULL,
+            PRIMARY KEY (source, target, diagram_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_edges_diagram ON edges (diagram_id);
+        CREATE INDEX IF NOT EXISTS idx_diagrams_created_at ON diagrams (created_at);
+        CREATE VIRTUAL TABLE IF NOT EXISTS diagrams_fts USING fts5(
+            name, prompt, labels, services, tokenize = "unicode61 tokenchars '_'"
+        );
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, db_path: str = "outputs/search.db", parse: Callable[[str], Dict[str, Any]] = None):
+        self.db_path = db_path
+        # Turns diagram code into the parse_clusters_and_services structure when no graph is supplied
+        self.parse = parse
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; WAL lets searches run while a background add commits"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def add(self, code_hash: str, diagram_code: str, name: str = None, prompt: str = None, run_id: str = None,
+            parsed: Dict[str, Any] = None, graph_ir: Dict[str, Any] = None, artifacts: Dict[str, Any] = None,
+            created_at: str = None) -> bool:
+        """Index one successful diagram; a newer run of the same code replaces the older entry"""
+        with closing(self._connect()) as conn, conn:
+            # Take the write lock before the existence check so concurrent adds of the same code cannot both insert
+            conn.execute("BEGIN IMMEDIATE")
+            return self._write(conn, code_hash, diagram_code, name, prompt, run_id, parsed, graph_ir, artifacts, created_at)
+
+    def _write(self, conn: sqlite3.Connection, code_hash: str, diagram_code: str, name: str, prompt: str, run_id: str,
+               parsed: Optional[Dict[str, Any]], graph_ir: Optional[Dict[str, Any]], artifacts: Optional[Dict[str, Any]],
+               created_at: Optional[str]) -> bool:
+        """Upsert the diagram row, its edges and its FTS entry inside the caller's transaction"""
+        if parsed is None:
+            if graph_ir:
+                parsed = graph_ir_to_parsed(graph_ir)
+            elif self.parse:
+                parsed = self.parse(diagram_code)
+            else:
+                parsed = {}
+        fields = index_fields(parsed, (graph_ir or {}).get('title'))
+        created_at = created_at or datetime.now(timezone.utc).isoformat()
+        row = (run_id, name, prompt, diagram_code, json.dumps(graph_ir) if graph_ir else None, ' '.join(fields["services"]),
+               json.dumps(artifacts or {}, default=str), created_at)
+        existing = conn.execute("SELECT id, created_at FROM diagrams WHERE code_hash = ?", (code_hash,)).fetchone()
+        if existing and existing["created_at"] > created_at:
+            return False  # backfill reached an older run of code already indexed from a newer one
+        if existing:
+            diagram_id = existing["id"]
+            conn.execute("UPDATE diagrams SET run_id = ?, name = ?, prompt = ?, diagram_code = ?, graph_ir = ?, services = ?, "
+                         "artifacts = ?, created_at = ? WHERE id = ?", row + (diagram_id,))
+            conn.execute("DELETE FROM edges WHERE diagram_id = ?", (diagram_id,))
+            conn.execute("DELETE FROM diagrams_fts WHERE rowid = ?", (diagram_id,))
+        else:
+            diagram_id = conn.execute("INSERT INTO diagrams (run_id, name, prompt, diagram_code, graph_ir, services, artifacts, "
+                                      "created_at, code_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row + (code_hash,)).lastrowid
+        conn.executemany("INSERT INTO edges (source, target, diagram_id) VALUES (?, ?, ?)",
+                         [(source, target, diagram_id) for source, target in fields["edges"]])
+        conn.execute("INSERT INTO diagrams_fts (rowid, name, prompt, labels, services) VALUES (?, ?, ?, ?, ?)",
+                     (diagram_id, name or '', prompt or '', fields["labels"], ' '.join(fields["services"])))
+        return True
+
+    def sync(self, store, batch_size: int = 500) -> int:
+        """Index result-store runs recorded since the last sync (all of them the first time); returns how many"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'synced_until'").fetchone()
+            synced_until = row["value"] if row else ''
+            newest = None
+            added = pending = 0
+            for run in store.iter_runs(kind="diagram", success_only=True, batch_size=batch_size):
+                if run["created_at"] <= synced_until:
+                    break  # runs come newest first
+                newest = newest or run["created_at"]
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                payload = run["payload"] or {}
+                if not payload.get("diagram_code") or not run["code_hash"]:
+                    continue
+                # A run that fails half-way is rolled back on its own, so no entry is left without its edges or FTS row
+                conn.execute("SAVEPOINT index_run")
+                try:
+                    added += self._write(conn, run["code_hash"], payload["diagram_code"], run["name"], run["prompt"], run["id"],
+                                         None, payload.get("graph_ir"), run["artifacts"], run["created_at"])
+                except Exception as e:
+                    conn.execute("ROLLBACK TO SAVEPOINT index_run")
+                    print(f"Could not index run {run['id']}: {e}")
+                conn.execute("RELEASE SAVEPOINT index_run")
+                pending += 1
+                # One transaction per batch; the watermark only moves once everything is committed
+                if pending >= batch_size:
+                    conn.commit()
+                    pending = 0
+            if newest:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_until', ?)", (newest,))
+            conn.commit()
+            return added
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _match_expression(parsed_query: Dict[str, Any]) -> Optional[str]:
+        """FTS5 expression: every service must be present, every other word must prefix-match some column"""
+        clauses = [f'services : "{service}"' for service in parsed_query["services"]]
+        clauses += [f'"{term}"*' for term in parsed_query["terms"]]
+        return ' AND '.join(clauses) or None
+
+    def search(self, query: str, limit: int = 20) -> Dict[str, Any]:
+        """Diagrams matching a query such as "diagrams using Kinesis -> ECS", best matches first"""
+        started = time.perf_counter()
+        parsed_query = parse_query(query)
+        match = self._match_expression(parsed_query)
+        sql = "SELECT diagrams.* FROM diagrams"
+        clauses, params = [], []
+        if match:
+            sql += " JOIN diagrams_fts ON diagrams_fts.rowid = diagrams.id"
+            clauses.append("diagrams_fts MATCH ?")
+            params.append(match)
+        for source, target in parsed_query["edges"]:
+            clauses.append("diagrams.id IN (SELECT diagram_id FROM edges WHERE source = ? AND target = ?)")
+            params += [source, target]
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        sql += f" ORDER BY {'diagrams_fts.rank, ' if match else ''}diagrams.created_at DESC LIMIT ?"
+        params.append(limit)
+        try:
+            with closing(self._connect()) as conn:
+                rows = conn.execute(sql, params).fetchall()
+                results = [self._row_to_dict(conn, row) for row in rows]
+        except sqlite3.Error as e:
+            return {"success": False, "error": str(e), "query": parsed_query, "results": []}
+        return {
+            "success": True,
+            "query": parsed_query,
+            "results": results,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    @staticmethod
+    def _row_to_dict(conn: sqlite3.Connection, row: sqlite3.Row) -> Dict[str, Any]:
+        """Result entry with decoded JSON columns and the diagram's edges"""
+        record = dict(row)
+        record["graph_ir"] = json.loads(record["graph_ir"]) if record["graph_ir"] else None
+        record["artifacts"] = json.loads(record["artifacts"]) if record["artifacts"] else {}
+        record["services"] = record["services"].split() if record["services"] else []
+        record["edges"] = [tuple(edge) for edge in conn.execute("SELECT source, target FROM edges WHERE diagram_id = ?", (record["id"],))]
+        return record
+
+    def get(self, code_hash: str) -> Optional[Dict[str, Any]]:
+        """Indexed entry for a code hash"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM diagrams WHERE code_hash = ?", (code_hash,)).fetchone()
+            return self._row_to_dict(conn, row) if row else None
+
+    def stats(self) -> Dict[str, int]:
+        """Indexed diagram and edge counts"""
+        with closing(self._connect()) as conn:
+            return {
+                "diagrams": conn.execute("SELECT COUNT(*) FROM diagrams").fetchone()[0],
+                "edges": conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+            }
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the full-text and structural diagram search index")
+    parser.add_argument("query", nargs="?", help='search text, e.g. "Kinesis -> ECS" (omit to only sync)')
+    parser.add_argument("--db", default="outputs/results.db", help="result store to index")
+    parser.add_argument("--index", default="outputs/search.db", help="search index database")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    from agents.drawio_converter import DrawIOConverter
+    from agents.result_store import ResultStore
+    index = DiagramIndex(args.index, parse=DrawIOConverter().parse_clusters_and_services)
+    started = time.perf_counter()
+    added = index.sync(ResultStore(args.db))
+    print(f"Indexed {added} new runs in {time.perf_counter() - started:.2f}s; {index.stats()}")
+    if args.query:
+        found = index.search(args.query, args.limit)
+        print(f"{len(found['results'])} matches in {found.get('elapsed_ms')} ms for {found['query']}")
+        for entry in found["results"]:
+            edges = ', '.join(f"{source}->{target}" for source, target in entry["edges"])
+            print(f"  {entry['name']} [{entry['code_hash'][:12]}] {entry['prompt']!r} ({edges})")
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,104 @@
 #!/usr/bin/env python3
-import subprocess
+import asyncio
 import os
 import json
+import uuid
 from typing import Dict, Any
+from agents.artifact_writer import write_artifact, read_artifact, remove_artifact
+from agents.render_formats import render_formats_for, set_diagram_kwarg, with_output_formats
+from agents.graphviz_layout import parse_dot_layout
+from agents.render_sandbox import RenderLimits
 
 class SimpleDockerClient:
     """Simple Docker client that avoids MCP SDK issues"""
     
-    async def call_diagram_server(self, diagram_code: str, filename: str = "architecture_diagram", workspace_dir: str = None) -> Dict[str, Any]:
-        """Call Docker MCP server directly without SDK"""
+    def __init__(self, limits: RenderLimits = None, cpus: str = None):
+        # Each render container is capped by cgroups (memory, CPU share, process count) and a CPU-time ulimit on the render itself
+        self.limits = limits or RenderLimits.from_env()
+        self.cpus = cpus or os.environ.get("RENDER_DOCKER_CPUS", "1")
+    
+    async def call_diagram_server(self, diagram_code: str, filename: str = "architecture_diagram", workspace_dir: str = None, persist: bool = True, output_format: str = "png",
+                                  previous_positions: Dict[str, Any] = None, timeout: float = 120, render_code: str = None) -> Dict[str, Any]:
+        """Call Docker MCP server directly without SDK; with persist=False only in-memory bytes are kept, render_code overrides the code executed"""
         
         if not workspace_dir:
             workspace_dir = os.path.abspath("outputs/diagrams/generated-diagrams")
         os.makedirs(workspace_dir, exist_ok=True)
         
         # Create a temporary Python file with the diagram code
-        temp_file = os.path.join(workspace_dir, f"{filename}_temp.py")
-        with open(temp_file, "w", encoding="utf-8") as f:
-            f.write(diagram_code)
+        formats = render_formats_for(output_format)
+        # Every render gets a private file name, so concurrent requests with the same name never read or delete each other's files
+        render_name = f"{filename}-{uuid.uuid4().hex[:12]}"
+        render_code = set_diagram_kwarg(with_output_formats(render_code or diagram_code, formats), "filename", repr(render_name))
+        # Unique per run, so concurrent requests with the same name do not run each other's code
+        temp_file = os.path.join(workspace_dir, f"{filename}_{uuid.uuid4().hex[:12]}_temp.py")
+        await write_artifact(temp_file, render_code)
         
         try:
-            # Run Docker container to execute the diagram code
+            # Run Docker container to execute the diagram code; it is named so a timed-out run can be removed
+            container = f"diagram-{uuid.uuid4().hex[:12]}"
+            limits = ["--cpus", self.cpus, "--pids-limit", "256"]
+            if self.limits.memory_mb:
+                limits += ["--memory", f"{self.limits.memory_mb}m", "--memory-swap", f"{self.limits.memory_mb}m"]
             cmd = [
-                "docker", "run", "--rm",
+                "docker", "run", "--rm", "--name", container, *limits,
                 "-v", f"{workspace_dir}:/workspace",
                 "-w", "/workspace",
                 "python:3.11-slim",
                 "sh", "-c", 
-                f"pip install diagrams && python {filename}_temp.py"
+                f"pip install diagrams && ulimit -t {self.limits.cpu_seconds} && python {os.path.basename(temp_file)}"
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120, encoding="utf-8", errors="replace")
+            process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                # Killing the docker CLI does not stop the container, so remove it explicitly
+                process.kill()
+                cleanup = await asyncio.create_subprocess_exec("docker", "rm", "-f", container,
+                                                               stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+                await asyncio.shield(cleanup.wait())
+                await remove_artifact(temp_file)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return {"success": False, "error": f"Diagram render exceeded {timeout:g}s", "timed_out": True}
             
             # Clean up temp file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+            await remove_artifact(temp_file)
             
-            if result.returncode == 0:
-                # Check if PNG was created
-                png_path = os.path.join(workspace_dir, f"{filename}.png")
-                if os.path.exists(png_path):
+            if process.returncode == 0:
+                # Check if the requested output was created
+                image_path = os.path.join(workspace_dir, f"{render_name}.{output_format}")
+                if os.path.exists(image_path):
+                    image_bytes = await read_artifact(image_path)
+                    
+                    # The dot file is only an intermediate carrying layout coordinates
+                    layout = None
+                    dot_path = os.path.join(workspace_dir, f"{render_name}.dot")
+                    if 'dot' in formats and os.path.exists(dot_path):
+                        layout = parse_dot_layout((await read_artifact(dot_path)).decode('utf-8', errors='replace'))
+                        await remove_artifact(dot_path)
+                    
+                    await remove_artifact(image_path)
+                    if persist:
+                        # Persisted renders are published under the shared name in one atomic write, like the render sandbox does
+                        image_path = os.path.join(workspace_dir, f"{filename}.{output_format}")
+                        await write_artifact(image_path, image_bytes)
                     return {
                         "success": True,
                         "result": {"status": "success", "message": "Diagram generated"},
-                        "image_path": png_path
+                        "image_path": image_path if persist else None,
+                        "image_bytes": image_bytes,
+                        "image_format": output_format,
+                        "image_mime": "image/svg+xml" if output_format == "svg" else f"image/{output_format}",
+                        "svg_bytes": image_bytes if output_format == "svg" else None,
+                        "layout": layout,
+                        "persisted": persist
                     }
                 else:
-                    return {"success": False, "error": "PNG file not created"}
+                    return {"success": False, "error": f"{output_format.upper()} file not created"}
             else:
-                return {"success": False, "error": f"Docker error: {result.stderr}"}
+                return {"success": False, "error": f"Docker error: {stderr.decode('utf-8', errors='replace')}"}
                 
         except Exception as e:
             return {"success": False, "error": str(e)}
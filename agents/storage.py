@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import os
+from typing import Optional
+from agents.artifact_writer import atomic_write
+
+class LocalStorage:
+    """Key/value blob storage on the local filesystem (single host)"""
+
+    shared = False
+
+    def __init__(self, root: str = "outputs/store"):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        """Map a key to a path under root, rejecting keys that escape it"""
+        path = os.path.normpath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str = None):
+        """Store bytes under key, atomically replacing any previous value"""
+        atomic_write(self._path(key), data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Bytes stored under key, or None"""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        """True when key has a value"""
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str):
+        """Remove key if present"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def location(self, key: str) -> str:
+        """Human-readable location of a key"""
+        return self._path(key)
+
+class S3Storage:
+    """Key/value blob storage in an S3 bucket (or any S3-compatible endpoint such as MinIO), shared by all replicas"""
+
+    shared = True
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, endpoint_url: str = None, aws_config=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        if client is None:
+            from config.aws_config import AWSConfig
+            client = (aws_config or AWSConfig()).get_s3_client(endpoint_url=endpoint_url)
+        self.client = client
+
+    def _key(self, key: str) -> str:
+        """Object key including the configured prefix"""
+        return self.prefix + key
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        """True for the not-found errors S3 and S3-compatible servers return"""
+        code = (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+        return code in ('NoSuchKey', '404', 'NotFound')
+
+    def put(self, key: str, data: bytes, content_type: str = None):
+        """Store bytes under key; S3 PUTs are atomic per object"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, **extra)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Bytes stored under key, or None"""
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return response['Body'].read()
+
+    def exists(self, key: str) -> bool:
+        """True when key has a value"""
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def delete(self, key: str):
+        """Remove key if present"""
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def location(self, key: str) -> str:
+        """Human-readable location of a key"""
+        return f"s3://{self.bucket}/{self._key(key)}"
+
+def get_storage(backend: str = None):
+    """Storage backend from the environment: STORAGE_BACKEND=local (default) or s3"""
+    backend = (backend or os.environ.get("STORAGE_BACKEND", "local")).lower()
+    if backend == "local":
+        return LocalStorage(os.environ.get("STORAGE_ROOT", "outputs/store"))
+    if backend == "s3":
+        bucket = os.environ.get("STORAGE_BUCKET")
+        if not bucket:
+            raise ValueError("STORAGE_BACKEND=s3 needs STORAGE_BUCKET")
+        return S3Storage(bucket, prefix=os.environ.get("STORAGE_PREFIX", "mcp-diagrams"),
+                         endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None)
+    raise ValueError(f"Unknown storage backend: {backend}")
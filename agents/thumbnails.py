@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import hashlib
+import io
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+from agents.artifact_writer import atomic_write
+
+class ThumbnailCache:
+    """Downscaled WebP (or PNG) previews, generated once per artifact hash and evicted least recently used first"""
+
+    def __init__(self, directory: str = "outputs/thumbnails", size: Tuple[int, int] = (360, 240), max_bytes: int = 64 * 1024 * 1024,
+                 image_format: str = "webp"):
+        self.directory = directory
+        self.size = size
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # name -> [bytes on disk, last use]; file mtimes carry the recency across restarts
+        self._entries: Dict[str, list] = {}
+        self._total = 0
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                self._entries[entry.name] = [stat.st_size, stat.st_mtime]
+                self._total += stat.st_size
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+    @staticmethod
+    def key_for(image_path: str, render_hash: str = None) -> str:
+        """Artifact hash: the render hash when known (same code and Graphviz options render the same image), else the file's content hash"""
+        extension = os.path.splitext(image_path)[1].lstrip('.').lower() or 'png'
+        if render_hash:
+            return f"{render_hash[:32]}-{extension}"
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return f"{digest.hexdigest()[:32]}-{extension}"
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached preview for a key, marking it recently used"""
+        with self._lock:
+            name = next((name for name in (f"{key}.webp", f"{key}.png") if name in self._entries), None)
+            if name is None:
+                return None
+            self._entries[name][1] = time.time()
+        try:
+            with open(self._path(name), 'rb') as f:
+                data = f.read()
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            with self._lock:
+                # Evicted by another process sharing the directory
+                size = self._entries.pop(name, [0])[0]
+                self._total -= size
+            return None
+        self.stats["hits"] += 1
+        return {"bytes": data, "mime": f"image/{name.rsplit('.', 1)[1]}"}
+
+    def get_or_create(self, key: str, source) -> Optional[Dict[str, Any]]:
+        """Preview for key, rendering it from source (a path or image bytes) on a miss; None if it cannot be decoded"""
+        cached = self.get(key)
+        if cached:
+            return cached
+        self.stats["misses"] += 1
+        try:
+            data, extension = self._render(source)
+        except Exception as e:
+            print(f"Thumbnail generation failed for {key}: {e}")
+            self.stats["errors"] += 1
+            return None
+        name = f"{key}.{extension}"
+        atomic_write(self._path(name), data)
+        with self._lock:
+            previous = self._entries.get(name)
+            self._total += len(data) - (previous[0] if previous else 0)
+            self._entries[name] = [len(data), time.time()]
+            self._evict()
+        return {"bytes": data, "mime": f"image/{extension}"}
+
+    def _render(self, source) -> Tuple[bytes, str]:
+        """Decode, downscale and encode one preview"""
+        from PIL import Image, features
+        if isinstance(source, (bytes, bytearray)):
+            data = bytes(source)
+        else:
+            with open(source, 'rb') as f:
+                data = f.read()
+        if data.lstrip()[:1] == b'<':
+            # Pillow cannot read SVG; rasterise at a reduced scale first
+            from agents.render_formats import rasterize_svg
+            data = rasterize_svg(data, scale=0.5)
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG can decode straight to a reduced size, which avoids materialising the full image
+            image.draft('RGB', (self.size[0] * 2, self.size[1] * 2))
+            image.thumbnail(self.size, Image.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            out = io.BytesIO()
+            if self.image_format == "webp" and features.check('webp'):
+                image.save(out, format='WEBP', quality=80, method=4)
+                return out.getvalue(), 'webp'
+            image.save(out, format='PNG', optimize=True)
+            return out.getvalue(), 'png'
+
+    def _evict(self):
+        """Drop least recently used previews until the cache fits in max_bytes (caller holds the lock)"""
+        if self._total <= self.max_bytes:
+            return
+        for name, (size, _last_used) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            del self._entries[name]
+            self._total -= size
+            self.stats["evictions"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self._total, **self.stats}
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""Headless HTTP/JSON API for diagram generation (ASGI, run with uvicorn)"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import time
+from typing import Dict, Any, Optional, Tuple
+from agents.bedrock_strands_agent import BedrockStrandsAgent
+from agents.render_formats import SUPPORTED_OUTPUT_FORMATS
+from agents.drawio_format import DrawioBundleWriter
+from agents.layout_tuning import validate_layout_options
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH_SIZE = int(os.environ.get("API_MAX_BATCH_SIZE", "20"))
+BUNDLE_DIR = os.environ.get("API_BUNDLE_DIR", "outputs/diagrams/bundles")
+DIAGRAM_NAME = re.compile(r'^[A-Za-z0-9_.-]{1,100}$')
+
+class ApiError(Exception):
+    """Error reported to the client as a JSON body with an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before sending its request body"""
+
+def encode_bytes(value: Any, include_images: bool) -> Any:
+    """Make a result JSON-safe: image buffers become base64 strings, or are dropped"""
+    if isinstance(value, dict):
+        encoded = {}
+        for key, item in value.items():
+            if isinstance(item, bytes):
+                if include_images:
+                    encoded[f"{key}_base64"] = base64.b64encode(item).decode('ascii')
+            else:
+                encoded[key] = encode_bytes(item, include_images)
+        return encoded
+    if isinstance(value, (list, tuple)):
+        return [encode_bytes(item, include_images) for item in value]
+    return value
+
+def status_for(result: Dict[str, Any]) -> int:
+    """HTTP status for an agent result"""
+    if result.get("success"):
+        return 200
+    if result.get("overloaded") or result.get("throttled"):
+        return 503
+    if result.get("timed_out"):
+        return 504
+    return 502
+
+def parse_generate_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate one generate request body"""
+    prompt = body.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ApiError(400, "'prompt' is required")
+    name = body.get("name", "architecture_diagram")
+    if not isinstance(name, str) or not DIAGRAM_NAME.match(name):
+        raise ApiError(400, "'name' must be 1-100 characters of letters, digits, '_', '-' or '.'")
+    output_format = body.get("output_format", "png")
+    if output_format not in SUPPORTED_OUTPUT_FORMATS or output_format == "dot":
+        raise ApiError(400, "'output_format' must be one of png, svg, jpg, pdf")
+    timeout = body.get("timeout")
+    if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise ApiError(400, "'timeout' must be a positive number of seconds")
+    layout = body.get("layout")
+    if layout is not None and not isinstance(layout, dict):
+        raise ApiError(400, "'layout' must be an object with engine, splines, ranksep and/or nodesep")
+    try:
+        layout = validate_layout_options(layout)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return {
+        "prompt": prompt,
+        "name": name,
+        "output_format": output_format,
+        "persist": bool(body.get("persist", False)),
+        "timeout": timeout,
+        "include_images": bool(body.get("include_images", True)),
+        "fresh": bool(body.get("fresh", False)),
+        "graph_ir": bool(body.get("graph_ir", False)),
+        # Absent means "sample at PROFILE_SAMPLE_PERCENT"; true/false forces profiling on or off
+        "profile": None if body.get("profile") is None else bool(body.get("profile")),
+        "layout": layout
+    }
+
+class DiagramAPI:
+    """ASGI app exposing /generate, /batch and /status on top of a shared BedrockStrandsAgent"""
+
+    def __init__(self):
+        self.agent: Optional[BedrockStrandsAgent] = None
+        self.started_at = time.time()
+        self.requests = {"generate": 0, "batch": 0, "errors": 0}
+
+    def build_agent(self) -> BedrockStrandsAgent:
+        """One agent per worker process; its MCP session pool lives on this worker's event loop"""
+        return BedrockStrandsAgent(
+            request_timeout=float(os.environ.get("API_REQUEST_TIMEOUT", "180")),
+            max_concurrent_requests=int(os.environ.get("API_MAX_CONCURRENT", "8")),
+            max_pending_requests=int(os.environ.get("API_MAX_PENDING", "64")),
+            mcp_pool_size=int(os.environ.get("MCP_POOL_SIZE", "4"))
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Build the agent on startup and close pooled sessions on shutdown"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.agent = self.build_agent()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.agent is not None:
+                    await self.agent.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_json(self, receive) -> Dict[str, Any]:
+        """Read and decode a JSON request body"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnected()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise ApiError(413, "Request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        try:
+            body = json.loads(b"".join(chunks) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    async def send_json(self, send, status: int, payload: Dict[str, Any], headers: Tuple = ()):
+        """Send a complete JSON response"""
+        body = json.dumps(payload, default=str).encode('utf-8')
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def handle_http(self, scope, receive, send):
+        if self.agent is None:
+            # Servers without lifespan support
+            self.agent = self.build_agent()
+        method, path = scope["method"], scope["path"].rstrip('/') or '/'
+        try:
+            if path == "/health" and method == "GET":
+                status, payload = 200, {"status": "ok"}
+            elif path == "/status" and method == "GET":
+                status, payload = 200, self.status()
+            elif path == "/generate" and method == "POST":
+                status, payload = await self.generate(parse_generate_request(await self.read_json(receive)))
+            elif path == "/batch" and method == "POST":
+                status, payload = await self.batch(await self.read_json(receive))
+            elif path in ("/health", "/status", "/generate", "/batch"):
+                raise ApiError(405, f"{method} not allowed on {path}")
+            else:
+                raise ApiError(404, f"Unknown endpoint {path}")
+        except ApiError as e:
+            self.requests["errors"] += 1
+            status, payload = e.status, {"success": False, "error": str(e)}
+        except ClientDisconnected:
+            return
+        except Exception as e:
+            self.requests["errors"] += 1
+            status, payload = 500, {"success": False, "error": str(e)}
+
+        headers = ((b"retry-after", b"5"),) if status == 503 else ()
+        await self.send_json(send, status, payload, headers)
+
+    async def generate(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """POST /generate: one diagram"""
+        self.requests["generate"] += 1
+        result = await self.agent.generate_architecture_diagram(
+            request["prompt"], request["name"], persist=request["persist"],
+            output_format=request["output_format"], timeout=request["timeout"], fresh=request["fresh"],
+            graph_ir=request["graph_ir"], profile=request["profile"], layout=request["layout"]
+        )
+        return status_for(result), {"name": request["name"], **encode_bytes(result, request["include_images"])}
+
+    async def batch(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """POST /batch: several diagrams concurrently; "bundle": true also combines their Draw.io pages into one file"""
+        items = body.get("requests")
+        if not isinstance(items, list) or not items:
+            raise ApiError(400, "'requests' must be a non-empty list")
+        if len(items) > MAX_BATCH_SIZE:
+            raise ApiError(400, f"At most {MAX_BATCH_SIZE} requests per batch")
+        defaults = body.get("defaults", {})
+        if not isinstance(defaults, dict):
+            raise ApiError(400, "'defaults' must be an object")
+        if not all(isinstance(item, dict) for item in items):
+            raise ApiError(400, "Every entry in 'requests' must be an object")
+        requests = []
+        for index, item in enumerate(items):
+            request = {**defaults, **item}
+            # Unnamed entries are numbered so their results and bundle pages can be told apart
+            request.setdefault("name", f"architecture_diagram_{index + 1}")
+            requests.append(parse_generate_request(request))
+        names = [request["name"] for request in requests]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ApiError(400, f"Duplicate names in batch: {', '.join(duplicates)}")
+
+        self.requests["batch"] += 1
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.generate(request) for request in requests))
+        succeeded = sum(1 for status, _ in results if status == 200)
+        response = {
+            "success": succeeded == len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "results": [{"status": status, **payload} for status, payload in results]
+        }
+        if body.get("bundle") and succeeded:
+            drawio_results = [(request["name"], (payload.get("result") or {}).get("drawio_result") or {})
+                              for request, (status, payload) in zip(requests, results) if status == 200]
+            response["bundle"] = await asyncio.to_thread(self.write_bundle, drawio_results, body.get("bundle_compressed", True))
+        return 200, response
+
+    def write_bundle(self, drawio_results, compressed: bool) -> Dict[str, Any]:
+        """Stream each result's Draw.io page into one file under BUNDLE_DIR"""
+        path = os.path.join(BUNDLE_DIR, f"batch-{int(time.time() * 1000)}-{os.getpid()}.drawio")
+        with DrawioBundleWriter(path, compressed=bool(compressed)) as writer:
+            for name, drawio_result in drawio_results:
+                if drawio_result.get("drawio_path"):
+                    writer.add_file(drawio_result["drawio_path"], name)
+                elif drawio_result.get("drawio_xml"):
+                    writer.add_page(drawio_result["drawio_xml"], name)
+        return {"path": os.path.abspath(path), "pages": writer.pages, "bytes": os.path.getsize(path)}
+
+    def status(self) -> Dict[str, Any]:
+        """GET /status: this worker's load and counters"""
+        return {
+            "worker_pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "requests": dict(self.requests),
+            **self.agent.service_metrics()
+        }
+
+app = DiagramAPI()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the diagram generation HTTP API")
+    parser.add_argument("--host", default=os.environ.get("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("API_WORKERS", "2")),
+                        help="worker processes; each has its own agent, admission queue and MCP session pool")
+    args = parser.parse_args()
+
+    import uvicorn
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers, lifespan="on")
+
+if __name__ == "__main__":
+    main()
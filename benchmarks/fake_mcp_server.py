@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import re
+
+# 1x1 PNG: the load test measures the service around the render, not image sizes
+PNG_BYTES = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==")
+SVG_TEMPLATE = '<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="300"><rect width="100%" height="100%" fill="white"/></svg>'
+
+OUTFORMAT = re.compile(r'outformat\s*=\s*\[([^\]]*)\]')
+NODE_CALL = re.compile(r'\b([A-Z]\w*)\(\s*["\']([^"\']*)["\']')
+
+def output_formats(code: str) -> list:
+    """Formats the code asks the diagrams library for (png when it does not say)"""
+    match = OUTFORMAT.search(code)
+    if not match:
+        return ["png"]
+    return [value.strip().strip('\'"') for value in match.group(1).split(',') if value.strip()] or ["png"]
+
+def node_labels(code: str) -> list:
+    return [label for name, label in NODE_CALL.findall(code) if name not in ("Diagram", "Cluster", "Edge")]
+
+def laid_out_dot(code: str) -> str:
+    """Graphviz-style -Tdot output with every labelled node on a row, so Draw.io conversion has a layout to use"""
+    labels = node_labels(code)
+    lines = ['digraph fake {', f'\tgraph [bb="0,0,{180 * max(1, len(labels))},300"];']
+    for index, label in enumerate(labels):
+        lines.append(f'\tn{index}\t[height=1.9, label="{label}", pos="{90 + 180 * index},150", width=1.4];')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def build_server(latency_ms: float, jitter_ms: float, failure_rate: float, hang_rate: float, crash_rate: float):
+    """FastMCP server with the awslabs diagram server's generate_diagram signature and injected latency and faults"""
+    try:
+        from mcp.server.fastmcp import FastMCP
+    except ImportError:
+        # mcp 2.x renamed FastMCP
+        from mcp.server.mcpserver import MCPServer as FastMCP
+    server = FastMCP("fake-diagram-server")
+
+    @server.tool()
+    async def generate_diagram(code: str, filename: str = None, timeout: int = 90, workspace_dir: str = None) -> str:
+        """Pretend to render diagrams code: sleep, maybe fail, then write placeholder artifacts"""
+        # A fixed floor plus an exponential tail, like real renders
+        delay = latency_ms + (random.expovariate(1 / jitter_ms) if jitter_ms > 0 else 0)
+        await asyncio.sleep(delay / 1000)
+        roll = random.random()
+        if roll < crash_rate:
+            os._exit(1)  # the process dies mid-call, as an OOM-killed server would
+        if roll < crash_rate + hang_rate:
+            await asyncio.sleep(3600)
+        if roll < crash_rate + hang_rate + failure_rate:
+            return json.dumps({"status": "error", "path": None, "message": "Injected failure: Graphviz exited with status 1"})
+
+        directory = os.path.join(workspace_dir or os.getcwd(), "generated-diagrams")
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, filename or "diagram")
+        formats = output_formats(code)
+        for fmt in formats:
+            if fmt == "dot":
+                data = laid_out_dot(code).encode('utf-8')
+            elif fmt == "svg":
+                data = SVG_TEMPLATE.format(width=180 * max(1, len(node_labels(code)))).encode('utf-8')
+            else:
+                data = PNG_BYTES
+            with open(f"{base}.{fmt}", 'wb') as f:
+                f.write(data)
+        return json.dumps({"status": "success", "path": f"{base}.{formats[0]}", "message": f"Fake diagram rendered in {delay:.0f} ms"})
+
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Stdio MCP server implementing generate_diagram with configurable latency and failures")
+    parser.add_argument("--latency-ms", type=float, default=200, help="minimum render time")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="mean of the exponential tail added to each render")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of calls answered with a render error")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of calls that never answer")
+    parser.add_argument("--crash-rate", type=float, default=0.0, help="share of calls that kill the server process")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    server = build_server(args.latency_ms, args.jitter_ms, args.failure_rate, args.hang_rate, args.crash_rate)
+    # One INFO line per call would flood the load test's terminal through the inherited stderr
+    logging.getLogger("mcp").setLevel(logging.WARNING)
+    server.run()
+
+if __name__ == "__main__":
+    main()
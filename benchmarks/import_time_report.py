@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, Any, List
+
+# Modules the app imports before the first page render
+DEFAULT_TARGETS = ["agents.bedrock_strands_agent", "config.aws_config", "agents.drawio_converter"]
+
+# Heavy packages that must stay out of the startup path; they are imported on first use
+DEFAULT_FORBIDDEN = ["boto3", "botocore", "mcp", "numpy"]
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module: str) -> Dict[str, Any]:
+    """Import a module in a fresh interpreter with -X importtime and parse the timings (microseconds)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        last_line = (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+        return {"module": module, "error": last_line}
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {"self_us": int(self_us), "cumulative_us": int(cumulative_us), "depth": len(indent) // 2}
+    target = modules.get(module, {})
+    return {"module": module, "cumulative_us": target.get("cumulative_us", 0), "modules": modules}
+
+def report(module: str, runs: int, top: int, forbidden: List[str]) -> Dict[str, Any]:
+    """Median cumulative import time over several cold runs, plus the slowest modules of the last run"""
+    samples = [measure_import(module) for _ in range(runs)]
+    failed = next((sample for sample in samples if "error" in sample), None)
+    if failed:
+        return failed
+    last = samples[-1]["modules"]
+    slowest = sorted(last.items(), key=lambda item: item[1]["self_us"], reverse=True)[:top]
+    leaked = sorted({name.split('.')[0] for name in last} & set(forbidden))
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(sample["cumulative_us"] for sample in samples) / 1000, 1),
+        "modules_imported": len(last),
+        "slowest": [{"module": name, "self_ms": round(times["self_us"] / 1000, 2)} for name, times in slowest],
+        "forbidden_imported": leaked
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app's startup modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_TARGETS, help="modules to import (default: app startup modules)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to list")
+    parser.add_argument("--forbid", action="append", default=None, help="package that must not be imported at startup (repeatable)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail when a module's median import time exceeds this")
+    parser.add_argument("--baseline", help="JSON report from a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--json", dest="json_out", help="write the report to this file")
+    args = parser.parse_args()
+
+    forbidden = args.forbid if args.forbid is not None else DEFAULT_FORBIDDEN
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = {entry["module"]: entry for entry in json.load(f)}
+
+    results = []
+    failures = []
+    for module in args.modules:
+        entry = report(module, args.runs, args.top, forbidden)
+        results.append(entry)
+        if "error" in entry:
+            print(f"❌ {module}: import failed ({entry['error']})")
+            failures.append(module)
+            continue
+
+        print(f"\n📦 {module}: {entry['median_ms']} ms median over {args.runs} runs, {entry['modules_imported']} modules")
+        for slow in entry["slowest"]:
+            print(f"   {slow['self_ms']:>8.2f} ms  {slow['module']}")
+
+        if entry["forbidden_imported"]:
+            print(f"   ❌ imports heavy packages at startup: {', '.join(entry['forbidden_imported'])}")
+            failures.append(module)
+        if args.budget_ms is not None and entry["median_ms"] > args.budget_ms:
+            print(f"   ❌ over budget: {entry['median_ms']} ms > {args.budget_ms} ms")
+            failures.append(module)
+        previous = baseline.get(module)
+        if previous and entry["median_ms"] > previous["median_ms"] * (1 + args.tolerance):
+            print(f"   ❌ regression: {previous['median_ms']} ms -> {entry['median_ms']} ms")
+            failures.append(module)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📝 Report written to {args.json_out}")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import shlex
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+FAKE_SERVER = os.path.join(REPO_ROOT, "benchmarks", "fake_mcp_server.py")
+
+# (name used in prompts, diagrams module, class)
+SERVICES = [
+    ("API Gateway", "diagrams.aws.network", "APIGateway"), ("Lambda", "diagrams.aws.compute", "Lambda"),
+    ("DynamoDB", "diagrams.aws.database", "Dynamodb"), ("S3", "diagrams.aws.storage", "S3"),
+    ("SQS", "diagrams.aws.integration", "SQS"), ("SNS", "diagrams.aws.integration", "SNS"),
+    ("ECS", "diagrams.aws.compute", "ECS"), ("EC2", "diagrams.aws.compute", "EC2"),
+    ("RDS", "diagrams.aws.database", "RDS"), ("CloudFront", "diagrams.aws.network", "CloudFront"),
+    ("Kinesis", "diagrams.aws.analytics", "Kinesis"), ("ElastiCache", "diagrams.aws.database", "ElastiCache")
+]
+SERVICE_PATTERN = re.compile('|'.join(re.escape(name) for name, _, _ in SERVICES))
+
+def make_prompt(rng: random.Random, repeat_pool: List[str], repeat_ratio: float) -> str:
+    """A prompt naming 2-6 services; repeat_ratio of them come from a small fixed pool so caches get hits"""
+    if repeat_pool and rng.random() < repeat_ratio:
+        return rng.choice(repeat_pool)
+    names = [name for name, _, _ in rng.sample(SERVICES, rng.randint(2, 6))]
+    return f"Requests flow from {' to '.join(names)}, request {rng.getrandbits(32):08x}"
+
+class ThrottlingException(Exception):
+    """Shaped like the botocore ClientError Bedrock raises when throttled, so is_throttling_error recognises it"""
+
+    def __init__(self, message: str = "Too many requests, please wait before trying again."):
+        super().__init__(f"An error occurred (ThrottlingException) when calling the Converse operation: {message}")
+        self.response = {"Error": {"Code": "ThrottlingException", "Message": message}}
+
+class StubBedrock:
+    """Bedrock Runtime stand-in: converse() sleeps, may throttle or fail, and returns diagrams code for the services in the prompt"""
+
+    def __init__(self, latency_ms: float = 800, jitter_ms: float = 400, throttle_rate: float = 0.0, failure_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "throttled": 0, "failed": 0}
+
+    def converse(self, modelId: str, messages: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self.stats["calls"] += 1
+            roll = random.random()
+        # Called on a worker thread by the agent, like the real blocking client
+        time.sleep((self.latency_ms + (random.expovariate(1 / self.jitter_ms) if self.jitter_ms > 0 else 0)) / 1000)
+        if roll < self.throttle_rate:
+            with self._lock:
+                self.stats["throttled"] += 1
+            raise ThrottlingException()
+        if roll < self.throttle_rate + self.failure_rate:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise RuntimeError("Injected Bedrock failure")
+        text = messages[0]["content"][0]["text"]
+        request = text.rsplit("User request:", 1)[-1]
+        return {
+            "output": {"message": {"content": [{"text": self.diagram_code(request)}]}},
+            "usage": {"inputTokens": len(text) // 4, "outputTokens": 150}
+        }
+
+    @staticmethod
+    def diagram_code(request: str) -> str:
+        """A chain of the services the request names, in order"""
+        by_name = {name: (module, cls) for name, module, cls in SERVICES}
+        used = list(dict.fromkeys(SERVICE_PATTERN.findall(request))) or ["Lambda", "S3"]
+        imports = {}
+        for name in used:
+            module, cls = by_name[name]
+            imports.setdefault(module, []).append(cls)
+        lines = ["from diagrams import Diagram"] + [f"from {module} import {', '.join(sorted(set(classes)))}" for module, classes in imports.items()]
+        lines += ["", 'with Diagram("Load Test", show=False):']
+        lines += [f"    n{index} = {by_name[name][1]}({name!r})" for index, name in enumerate(used)]
+        lines.append("    " + " >> ".join(f"n{index}" for index in range(len(used))))
+        return '\n'.join(lines) + '\n'
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+def classify(result: Dict[str, Any], status: int = None) -> str:
+    """ok, or the kind of failure a result (or API response) reports"""
+    if result.get("success") and status in (None, 200):
+        render = result.get("result") or {}
+        if not render.get("success"):
+            return "render_error"
+        return "ok" if render.get("image_bytes") or render.get("image_bytes_base64") else "no_image"
+    for kind in ("overloaded", "timed_out", "throttled"):
+        if result.get(kind):
+            return kind
+    return "error"
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))]
+
+def process_stats() -> Dict[str, Any]:
+    """Resident memory, open file descriptors and threads of this process"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            rss_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        open_fds = len(os.listdir("/proc/self/fd"))
+    except (FileNotFoundError, OSError):
+        # No procfs (macOS): peak RSS is the best available, and it is in bytes there
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        open_fds = None
+    return {"rss_mb": round(rss_mb, 1), "open_fds": open_fds, "threads": threading.active_count()}
+
+def slope_per_minute(points: List[Tuple[float, float]]) -> Optional[float]:
+    """Least-squares slope of (seconds, value) points, per minute"""
+    if len(points) < 3:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    denominator = sum((t - mean_t) ** 2 for t, _ in points)
+    if not denominator:
+        return None
+    return round(sum((t - mean_t) * (v - mean_v) for t, v in points) / denominator * 60, 3)
+
+class Recorder:
+    """Completed requests bucketed into reporting windows, plus the memory samples taken at each window"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.window: List[Tuple[float, str]] = []
+        self.latencies: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.windows: List[Dict[str, Any]] = []
+        self.in_flight = 0
+
+    def record(self, latency_ms: float, outcome: str):
+        self.window.append((latency_ms, outcome))
+        self.latencies.append(latency_ms)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def close_window(self, interval: float) -> Dict[str, Any]:
+        """Summarise and reset the current window"""
+        window, self.window = self.window, []
+        latencies = sorted(latency for latency, outcome in window if outcome == "ok")
+        errors = {}
+        for _, outcome in window:
+            if outcome != "ok":
+                errors[outcome] = errors.get(outcome, 0) + 1
+        summary = {
+            "t": round(time.perf_counter() - self.started, 1),
+            "completed": len(window),
+            "throughput_rps": round(len(window) / interval, 2),
+            "error_rate": round(sum(errors.values()) / len(window), 4) if window else 0.0,
+            "errors": errors,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": latencies[-1] if latencies else None,
+            "in_flight": self.in_flight,
+            **process_stats()
+        }
+        self.windows.append(summary)
+        return summary
+
+def format_window(window: Dict[str, Any]) -> str:
+    ms = lambda value: f"{value:>7.0f}" if value is not None else "      -"
+    errors = ' '.join(f"{kind}={count}" for kind, count in sorted(window["errors"].items()))
+    return (f"t={window['t']:>6.0f}s  rps={window['throughput_rps']:>6.2f}  err={window['error_rate']:>6.1%}  "
+            f"p50={ms(window['p50_ms'])} p95={ms(window['p95_ms'])} p99={ms(window['p99_ms'])} ms  "
+            f"inflight={window['in_flight']:>4}  rss={window['rss_mb']:>7.1f} MB  fds={window['open_fds']}  {errors}")
+
+def parse_stages(spec: str) -> List[Tuple[float, float]]:
+    """'5:60,20:300' -> [(5 req/s, 60 s), (20 req/s, 300 s)]"""
+    stages = []
+    for part in spec.split(','):
+        rate, _, duration = part.partition(':')
+        stages.append((float(rate), float(duration)))
+    return stages
+
+def fake_server_spec(args, index: int) -> str:
+    """MCP_DIAGRAM_SERVERS entry starting one fake server on this host"""
+    command = [sys.executable, FAKE_SERVER, "--latency-ms", str(args.mcp_latency_ms), "--jitter-ms", str(args.mcp_jitter_ms),
+               "--failure-rate", str(args.mcp_failure_rate), "--hang-rate", str(args.mcp_hang_rate),
+               "--crash-rate", str(args.mcp_crash_rate)]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed + index)]
+    return "local:" + shlex.join(command)
+
+def build_agent(args):
+    """An agent wired to the fake MCP servers and the Bedrock stub"""
+    if not args.real_mcp:
+        os.environ["MCP_DIAGRAM_SERVERS"] = ','.join(fake_server_spec(args, index) for index in range(args.mcp_servers))
+    from agents.bedrock_strands_agent import BedrockStrandsAgent
+    agent = BedrockStrandsAgent(request_timeout=args.request_timeout, max_concurrent_requests=args.max_concurrent,
+                                max_pending_requests=args.max_pending, mcp_pool_size=args.mcp_pool_size,
+                                use_cache=not args.no_cache, similar_examples=args.similar_examples)
+    from config.bedrock_throttling import ThrottledBedrockClient
+    # Wrapped like the real client, so pacing, the adaptive limit and retries see the stub's throttling
+    agent.bedrock = ThrottledBedrockClient(StubBedrock(args.bedrock_latency_ms, args.bedrock_jitter_ms, args.bedrock_throttle_rate,
+                                                       args.bedrock_failure_rate))
+    return agent
+
+async def http_post_json(host: str, port: int, path: str, payload: Dict[str, Any], timeout: float) -> Tuple[int, Dict[str, Any]]:
+    """Minimal HTTP/1.1 POST on a fresh connection, so the harness needs no HTTP client package"""
+    body = json.dumps(payload).encode('utf-8')
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('ascii') + body)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    try:
+        return status, json.loads(content or b"{}")
+    except ValueError:
+        return status, {"success": False, "error": content[:200].decode('utf-8', errors='replace')}
+
+class LoadTest:
+    """Drives the agent in-process, or the HTTP API, at an open-loop arrival rate or with a fixed number of users"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.repeat_pool = [make_prompt(self.rng, [], 0) for _ in range(args.repeat_pool)]
+        self.agent = None
+        self.server = None
+        self.url: Optional[Tuple[str, int]] = None
+        self.recorder: Optional[Recorder] = None
+        self.tasks = set()
+        self.sequence = 0
+
+    async def start(self):
+        args = self.args
+        if args.target == "api" and args.url:
+            match = re.match(r'^http://([^:/]+)(?::(\d+))?', args.url)
+            if not match:
+                raise SystemExit("--url must look like http://host:port")
+            self.url = (match.group(1), int(match.group(2) or 80))
+            return
+        self.agent = build_agent(args)
+        if args.target == "api":
+            # The real ASGI app served by uvicorn on this loop, with the stubbed agent behind it
+            import uvicorn
+            from api_server import DiagramAPI
+            api = DiagramAPI()
+            api.build_agent = lambda: self.agent
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+            self.server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=port, lifespan="on", log_level="warning"))
+            self.server_task = asyncio.ensure_future(self.server.serve())
+            while not self.server.started:
+                await asyncio.sleep(0.05)
+            self.url = ("127.0.0.1", port)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.should_exit = True
+            await self.server_task  # lifespan shutdown closes the agent
+        elif self.agent is not None:
+            await self.agent.aclose()
+
+    async def one_request(self):
+        """Send one request and record its latency and outcome"""
+        args = self.args
+        self.sequence += 1
+        prompt = make_prompt(self.rng, self.repeat_pool, args.repeat_ratio)
+        name = f"load_{self.sequence}"
+        self.recorder.in_flight += 1
+        started = time.perf_counter()
+        try:
+            if self.url:
+                payload = {"prompt": prompt, "name": name, "output_format": args.output_format, "include_images": True,
+                           "timeout": args.request_timeout}
+                status, result = await http_post_json(*self.url, "/generate", payload, args.request_timeout + 30)
+                outcome = classify(result, status)
+            else:
+                result = await self.agent.generate_architecture_diagram(prompt, name, persist=False, output_format=args.output_format,
+                                                                        timeout=args.request_timeout)
+                outcome = classify(result)
+        except Exception as e:
+            outcome = f"exception:{type(e).__name__}"
+        finally:
+            self.recorder.in_flight -= 1
+        self.recorder.record(round((time.perf_counter() - started) * 1000, 1), outcome)
+
+    def spawn(self):
+        task = asyncio.ensure_future(self.one_request())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def open_loop(self, stages: List[Tuple[float, float]]):
+        """Poisson arrivals at each stage's rate, regardless of how fast responses come back"""
+        for rate, duration in stages:
+            stage_end = time.perf_counter() + duration
+            while rate > 0:
+                await asyncio.sleep(self.rng.expovariate(rate))
+                if time.perf_counter() >= stage_end:
+                    break
+                self.spawn()
+            if rate <= 0:
+                await asyncio.sleep(duration)
+
+    async def closed_loop(self, users: int, duration: float):
+        """users concurrent clients, each sending its next request after a think time"""
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            while time.perf_counter() < deadline:
+                await self.one_request()
+                if self.args.think_ms:
+                    await asyncio.sleep(self.rng.expovariate(1000 / self.args.think_ms))
+
+        await asyncio.gather(*(user() for _ in range(users)))
+
+    async def report(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            print(format_window(self.recorder.close_window(interval)), flush=True)
+
+    async def run(self) -> Dict[str, Any]:
+        args = self.args
+        await self.start()
+        baseline = process_stats()
+        self.recorder = Recorder(time.perf_counter())
+        reporter = asyncio.ensure_future(self.report(args.interval))
+        try:
+            if args.users:
+                print(f"{args.users} users for {args.duration:g}s against {args.target}", flush=True)
+                await self.closed_loop(args.users, args.duration)
+            else:
+                stages = parse_stages(args.stages) if args.stages else [(args.rate, args.duration)]
+                print(f"Open loop {', '.join(f'{rate:g} req/s for {duration:g}s' for rate, duration in stages)} against {args.target}", flush=True)
+                await self.open_loop(stages)
+            if self.tasks:
+                print(f"Draining {len(self.tasks)} in-flight requests", flush=True)
+                await asyncio.wait(list(self.tasks), timeout=args.drain_timeout)
+        finally:
+            reporter.cancel()
+            for task in list(self.tasks):
+                task.cancel()
+            service_metrics = None
+            if self.agent is not None:
+                service_metrics = self.agent.service_metrics()
+                if isinstance(getattr(self.agent.bedrock, "client", None), StubBedrock):
+                    service_metrics["bedrock_stub"] = self.agent.bedrock.client.metrics()
+            await self.stop()
+        if self.recorder.window:
+            self.recorder.close_window(args.interval)
+        return self.summary(baseline, service_metrics)
+
+    def summary(self, baseline: Dict[str, Any], service_metrics: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        recorder = self.recorder
+        latencies = sorted(recorder.latencies)
+        total = len(latencies)
+        elapsed = time.perf_counter() - recorder.started
+        windows = recorder.windows
+        # The first windows include imports, session start-up and cache warm-up
+        steady = windows[max(1, len(windows) // 10):] or windows
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key != "json_out"},
+            "requests": total,
+            "elapsed_s": round(elapsed, 1),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "outcomes": recorder.outcomes,
+            "error_rate": round(1 - recorder.outcomes.get("ok", 0) / total, 4) if total else 0.0,
+            "latency_ms": {"p50": percentile(latencies, 50), "p90": percentile(latencies, 90), "p95": percentile(latencies, 95),
+                           "p99": percentile(latencies, 99), "max": latencies[-1] if latencies else None},
+            "memory": {
+                "rss_start_mb": baseline["rss_mb"],
+                "rss_end_mb": windows[-1]["rss_mb"] if windows else baseline["rss_mb"],
+                "rss_peak_mb": max((window["rss_mb"] for window in windows), default=baseline["rss_mb"]),
+                "rss_slope_mb_per_min": slope_per_minute([(window["t"], window["rss_mb"]) for window in steady]),
+                "open_fds_start": baseline["open_fds"],
+                "open_fds_end": windows[-1]["open_fds"] if windows else baseline["open_fds"],
+                "fd_slope_per_min": slope_per_minute([(window["t"], window["open_fds"]) for window in steady if window["open_fds"] is not None])
+            },
+            "windows": windows,
+            "service_metrics": service_metrics
+        }
+
+def print_summary(summary: Dict[str, Any]):
+    latency, memory = summary["latency_ms"], summary["memory"]
+    print(f"\n📈 {summary['requests']} requests in {summary['elapsed_s']}s: {summary['throughput_rps']} req/s, "
+          f"{summary['error_rate']:.1%} errors {summary['outcomes']}")
+    print(f"   latency p50 {latency['p50']} ms, p90 {latency['p90']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, max {latency['max']} ms")
+    print(f"   RSS {memory['rss_start_mb']} -> {memory['rss_end_mb']} MB (peak {memory['rss_peak_mb']} MB, "
+          f"steady-state slope {memory['rss_slope_mb_per_min']} MB/min), open fds {memory['open_fds_start']} -> {memory['open_fds_end']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sustained load test against a local fake MCP server and a Bedrock stub")
+    parser.add_argument("--target", choices=["agent", "api"], default="agent", help="call BedrockStrandsAgent directly or through the HTTP API")
+    parser.add_argument("--url", help="drive an already running API (its own Bedrock/MCP setup) instead of an in-process one")
+    load = parser.add_argument_group("load shape")
+    load.add_argument("--rate", type=float, default=5.0, help="open-loop arrivals per second (Poisson)")
+    load.add_argument("--stages", help="open-loop ramp as rate:seconds pairs, e.g. 5:60,20:300,5:60 (overrides --rate/--duration)")
+    load.add_argument("--users", type=int, default=0, help="closed loop: this many concurrent users instead of an arrival rate")
+    load.add_argument("--think-ms", type=float, default=1000, help="closed loop: mean pause between a user's requests")
+    load.add_argument("--duration", type=float, default=60, help="seconds of load")
+    load.add_argument("--repeat-ratio", type=float, default=0.2, help="share of prompts drawn from a small repeated pool (cache hits)")
+    load.add_argument("--repeat-pool", type=int, default=20)
+    load.add_argument("--output-format", default="png", choices=["png", "svg"])
+    load.add_argument("--interval", type=float, default=10, help="seconds per reported window")
+    load.add_argument("--drain-timeout", type=float, default=60, help="how long to wait for in-flight requests at the end")
+    load.add_argument("--seed", type=int, default=None)
+    service = parser.add_argument_group("service under test")
+    service.add_argument("--request-timeout", type=float, default=60)
+    service.add_argument("--max-concurrent", type=int, default=8)
+    service.add_argument("--max-pending", type=int, default=64)
+    service.add_argument("--mcp-pool-size", type=int, default=4, help="pooled MCP sessions per server (0 = one process per render)")
+    service.add_argument("--mcp-servers", type=int, default=1, help="fake MCP servers to spread renders over")
+    service.add_argument("--real-mcp", action="store_true", help="use MCP_DIAGRAM_SERVERS as configured instead of fake servers")
+    service.add_argument("--no-cache", action="store_true", help="disable the code/render caches")
+    service.add_argument("--similar-examples", type=int, default=0, help="prompt similarity reuse/few-shot (0 = off)")
+    faults = parser.add_argument_group("latency and fault injection")
+    faults.add_argument("--bedrock-latency-ms", type=float, default=800)
+    faults.add_argument("--bedrock-jitter-ms", type=float, default=400)
+    faults.add_argument("--bedrock-throttle-rate", type=float, default=0.0)
+    faults.add_argument("--bedrock-failure-rate", type=float, default=0.0)
+    faults.add_argument("--mcp-latency-ms", type=float, default=200)
+    faults.add_argument("--mcp-jitter-ms", type=float, default=100)
+    faults.add_argument("--mcp-failure-rate", type=float, default=0.0)
+    faults.add_argument("--mcp-hang-rate", type=float, default=0.0)
+    faults.add_argument("--mcp-crash-rate", type=float, default=0.0)
+    checks = parser.add_argument_group("pass/fail")
+    checks.add_argument("--max-error-rate", type=float, default=None, help="fail when the overall error rate exceeds this (0.01 = 1%%)")
+    checks.add_argument("--max-p99-ms", type=float, default=None, help="fail when overall p99 latency exceeds this")
+    checks.add_argument("--max-rss-slope", type=float, default=None, help="fail when steady-state RSS grows faster than this many MB/min")
+    parser.add_argument("--workdir", help="directory for outputs/ (default: a fresh temporary directory)")
+    parser.add_argument("--json", dest="json_out", help="write the summary and per-window time series to this file")
+    args = parser.parse_args()
+
+    json_out = os.path.abspath(args.json_out) if args.json_out else None
+    # Results, caches and rendered files go to a scratch directory, not the repo's outputs/
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="diagram-load-test-"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    print(f"Working directory: {workdir}")
+
+    summary = asyncio.run(LoadTest(args).run())
+    print_summary(summary)
+    if json_out:
+        with open(json_out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1, default=str)
+
+    failures = []
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {summary['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    p99 = summary["latency_ms"]["p99"]
+    if args.max_p99_ms is not None and p99 is not None and p99 > args.max_p99_ms:
+        failures.append(f"p99 {p99} ms > {args.max_p99_ms} ms")
+    slope = summary["memory"]["rss_slope_mb_per_min"]
+    if args.max_rss_slope is not None and slope is not None and slope > args.max_rss_slope:
+        failures.append(f"RSS growing {slope} MB/min > {args.max_rss_slope} MB/min")
+    for failure in failures:
+        print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import boto3
 import os
+from functools import cached_property
 from typing import Dict, Any
+from config.bedrock_throttling import ThrottledBedrockClient
 
 class AWSConfig:
     """AWS Configuration for us-east-1 region with profile support"""
@@ -9,18 +10,34 @@ class AWSConfig:
     def __init__(self, profile_name: str = "default", region: str = "us-east-1"):
         self.profile_name = profile_name
         self.region = region
-        self.session = boto3.Session(profile_name=profile_name, region_name=region)
     
-    def get_bedrock_client(self):
-        """Get Bedrock Runtime client"""
-        return self.session.client('bedrock-runtime', region_name=self.region)
+    @cached_property
+    def session(self):
+        """boto3 session, created on first use so importing and constructing stay cheap"""
+        # boto3 is the slowest import in the app; only pay for it when AWS is actually called
+        import boto3
+        return boto3.Session(profile_name=self.profile_name, region_name=self.region)
+    
+    def get_bedrock_client(self, connect_timeout: int = 10, read_timeout: int = 120, adaptive: bool = True):
+        """Get Bedrock Runtime client with bounded timeouts, wrapped in adaptive throttling control"""
+        from botocore.config import Config
+        # botocore's own retries are switched off when we retry ourselves, so attempts are not multiplied
+        retries = {'mode': 'standard', 'total_max_attempts': 1} if adaptive else {'mode': 'standard'}
+        config = Config(connect_timeout=connect_timeout, read_timeout=read_timeout, retries=retries)
+        client = self.session.client('bedrock-runtime', region_name=self.region, config=config)
+        return ThrottledBedrockClient(client) if adaptive else client
     
     def get_rekognition_client(self):
         """Get Rekognition client"""
         return self.session.client('rekognition', region_name=self.region)
     
-    def get_s3_client(self):
-        """Get S3 client for diagram storage"""
+    def get_s3_client(self, endpoint_url: str = None):
+        """Get S3 client for diagram storage; endpoint_url points at an S3-compatible server such as MinIO"""
+        if endpoint_url:
+            from botocore.config import Config
+            # Local stand-ins generally only support path-style addressing
+            config = Config(s3={'addressing_style': 'path'})
+            return self.session.client('s3', region_name=self.region, endpoint_url=endpoint_url, config=config)
         return self.session.client('s3', region_name=self.region)
     
     def validate_credentials(self) -> bool:
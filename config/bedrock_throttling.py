@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# Error codes that mean "slow down", not "this request is wrong"
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+def error_code(error: Exception) -> Optional[str]:
+    """AWS error code of a botocore ClientError, if any"""
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
+
+def is_throttling_error(error: Exception) -> bool:
+    """True when Bedrock rejected the call because of load"""
+    return error_code(error) in THROTTLING_ERROR_CODES
+
+class BedrockThrottledError(RuntimeError):
+    """Raised when Bedrock kept throttling after every retry"""
+
+    def __init__(self, attempts: int, cause: Exception):
+        super().__init__(f"Bedrock is throttling requests ({error_code(cause)}); gave up after {attempts} attempts")
+        self.attempts = attempts
+        self.cause = cause
+
+class TokenBucket:
+    """Paces calls to a steady rate with a small burst allowance"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, expires_at: Optional[float] = None):
+        """Block until a token is available; raises TimeoutError rather than wait past expires_at (time.monotonic)"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if expires_at is not None and now + wait >= expires_at:
+                raise TimeoutError("Request deadline passed while pacing Bedrock calls")
+            time.sleep(wait)
+
+class AIMDLimiter:
+    """Additive-increase / multiplicative-decrease cap on concurrent calls"""
+
+    def __init__(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 32, backoff_ratio: float = 0.5):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, expires_at: Optional[float] = None):
+        """Block until the current limit allows another call; raises TimeoutError rather than wait past expires_at"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = None if expires_at is None else expires_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Request deadline passed while waiting for a Bedrock concurrency slot")
+                self._condition.wait(remaining)
+            self.in_flight += 1
+
+    def release(self, throttled: bool):
+        """Finish a call and adapt the limit to how it went"""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            else:
+                # Roughly +1 per limit's worth of successful calls
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+class ThrottledBedrockClient:
+    """Bedrock Runtime client wrapper with adaptive concurrency, pacing and jittered retries on throttling"""
+
+    def __init__(self, client, rate: float = 5.0, burst: int = 10, initial_limit: float = 4, max_limit: float = 32,
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.client = client
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AIMDLimiter(initial_limit, max_limit=max_limit)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "throttles": 0, "retries": 0, "failures": 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def converse(self, expires_at: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """Call Bedrock converse, retrying throttled calls with backoff; nothing waits or retries past expires_at (time.monotonic)"""
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.bucket.take(expires_at)
+                self.limiter.acquire(expires_at)
+            except TimeoutError:
+                self._count("failures")
+                raise
+            throttled = False
+            try:
+                return self.client.converse(**kwargs)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                if not throttled:
+                    self._count("failures")
+                    raise
+                self._count("throttles")
+                delay = self.backoff_delay(attempt)
+                # The caller has stopped waiting once its deadline passes, so a retry after it would only burn quota
+                if attempt == self.max_retries or (expires_at is not None and time.monotonic() + delay >= expires_at):
+                    self._count("failures")
+                    raise BedrockThrottledError(attempt + 1, e) from e
+            finally:
+                self.limiter.release(throttled)
+            self._count("retries")
+            time.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of in-flight calls, the adaptive limit and throttle/retry counters"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({"in_flight": self.limiter.in_flight, "limit": round(self.limiter.limit, 2)})
+        return stats
+
+    def __getattr__(self, name: str):
+        # Everything other than converse goes straight to the underlying client
+        return getattr(self.client, name)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import json
+import os
+from typing import Dict, Any, List
+
+# Ordered cheapest/fastest first; a request starts at the smallest tier that fits and escalates upwards
+DEFAULT_MODEL_TIERS = [
+    {
+        "name": "fast",
+        "model_id": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+        "max_tokens": 4096,
+        "max_complexity": 8
+    },
+    {
+        "name": "large",
+        "model_id": "us.anthropic.claude-sonnet-4-20250514-v1:0",
+        "max_tokens": 8192,
+        "max_complexity": None
+    }
+]
+
+def load_model_tiers(path: str = None) -> List[Dict[str, Any]]:
+    """Load the tier table from a JSON file (MODEL_TIERS_FILE) or fall back to the defaults"""
+    path = path or os.environ.get("MODEL_TIERS_FILE")
+    if not path:
+        return [dict(tier) for tier in DEFAULT_MODEL_TIERS]
+    with open(path, 'r', encoding='utf-8') as f:
+        tiers = json.load(f)
+    for tier in tiers:
+        missing = {"name", "model_id", "max_tokens"} - set(tier)
+        if missing:
+            raise ValueError(f"Model tier {tier.get('name', '?')} is missing {', '.join(sorted(missing))}")
+        tier.setdefault("max_complexity", None)
+    return tiers
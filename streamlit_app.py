@@ -1,21 +1,113 @@
 #!/usr/bin/env python3
 import streamlit as st
 import asyncio
+import concurrent.futures
 import os
+import threading
 from agents.bedrock_strands_agent import BedrockStrandsAgent
+from agents.render_formats import rasterize_svg
 
-# Fix for asyncio in Streamlit
-def run_async(coro):
+@st.cache_resource
+def get_event_loop():
+    """One background event loop shared by all sessions, so requests can be awaited and cancelled"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_agent():
+    """One agent per server process so admission control sees every session's requests"""
+    return BedrockStrandsAgent()
+
+def run_async(coro, status=None):
+    """Run a coroutine on the shared loop; a rerun, stop or disconnect cancels it instead of leaving it running"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import nest_asyncio
-            nest_asyncio.apply()
-            return loop.run_until_complete(coro)
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                # Touching the page lets Streamlit raise its stop/rerun exception when the user moves on
+                if status is not None:
+                    stats = get_agent().admission.stats()
+                    status.caption(f"⏳ Working... {stats['in_flight']} running, {stats['pending']} queued")
+    except BaseException:
+        future.cancel()
+        raise
+
+def show_diagram_result(result, diagram_name):
+    """Render a successful generation result from in-memory bytes, falling back to files on disk"""
+    # Show generated code
+    with st.expander("Generated Python Code"):
+        st.code(result['diagram_code'], language='python')
+    
+    mcp_result = result.get('result', {})
+    drawio_result = mcp_result.get('drawio_result') or {}
+    image_bytes = mcp_result.get('image_bytes')
+    svg_bytes = mcp_result.get('svg_bytes')
+    
+    if image_bytes:
+        # Rendered bytes came back with the response - no disk probing needed
+        if mcp_result.get('image_format') == 'svg':
+            st.image(image_bytes.decode('utf-8'), caption=f"Architecture Diagram: {diagram_name}")
         else:
-            return asyncio.run(coro)
-    except RuntimeError:
-        return asyncio.run(coro)
+            st.image(image_bytes, caption=f"Architecture Diagram: {diagram_name}")
+        if mcp_result.get('image_path'):
+            st.success(f"📁 Diagram saved at: {mcp_result['image_path']}")
+        
+        col_image, col_png, col_drawio = st.columns(3)
+        with col_image:
+            image_format = mcp_result.get('image_format') or 'png'
+            st.download_button(f"⬇️ Download {image_format.upper()}", image_bytes, file_name=f"{diagram_name}.{image_format}", mime=mcp_result.get('image_mime') or "image/png")
+        if svg_bytes and image_format == 'svg':
+            with col_png:
+                # PNG is rasterised lazily, only when somebody asks for it
+                if st.session_state.get('last_png'):
+                    st.download_button("⬇️ Download PNG", st.session_state.last_png, file_name=f"{diagram_name}.png", mime="image/png")
+                elif st.button("🖼️ Rasterise PNG"):
+                    try:
+                        st.session_state.last_png = rasterize_svg(svg_bytes)
+                        st.rerun()
+                    except RuntimeError as e:
+                        st.warning(str(e))
+        if drawio_result.get('drawio_xml'):
+            with col_drawio:
+                st.download_button("⬇️ Download .drawio", drawio_result['drawio_xml'], file_name=f"{diagram_name}.drawio", mime="application/xml")
+    else:
+        # Show diagram - get image path from MCP result
+        diagram_path = mcp_result.get('image_path')
+        
+        # Try multiple possible paths
+        possible_paths = [
+            diagram_path,
+            os.path.join("outputs", "diagrams", "generated-diagrams", f"{diagram_name}.png"),
+            os.path.join("outputs", "diagrams", f"{diagram_name}.png")
+        ]
+        
+        image_found = False
+        for path in possible_paths:
+            if path and os.path.exists(path):
+                st.image(path, caption=f"Architecture Diagram: {diagram_name}")
+                st.success(f"📁 Diagram saved at: {path}")
+                image_found = True
+                break
+        
+        if not image_found:
+            st.warning("Diagram generated but image file not found. Check outputs/diagrams/generated-diagrams/ folder.")
+            with st.expander("Debug: Result Structure"):
+                st.json(BedrockStrandsAgent._without_bytes(result))
+
+def show_profile(report):
+    """Top-N CPU hotspots and allocation growth from a saved request profile"""
+    st.caption(f"{report['label']}: {report['wall_ms']} ms wall, peak traced memory {report['peak_memory_kb']:,} KB, "
+               f"{report['threads']} profiled threads · {report['profile_path']}")
+    by_cumulative, by_own, memory = st.tabs(["Cumulative time", "Own time", "Memory growth"])
+    with by_cumulative:
+        st.dataframe(report['by_cumulative'], use_container_width=True)
+    with by_own:
+        st.dataframe(report['by_own_time'], use_container_width=True)
+    with memory:
+        st.dataframe(report['allocations'], use_container_width=True)
 
 st.set_page_config(
     page_title="MCP Architecture Diagram Generator",
@@ -28,12 +120,27 @@ st.markdown("Generate AWS architecture diagrams using natural language with Bedr
 
 # Initialize session state
 if 'agent' not in st.session_state:
-    st.session_state.agent = BedrockStrandsAgent()
+    st.session_state.agent = get_agent()
 if 'selected_prompt' not in st.session_state:
     st.session_state.selected_prompt = ''
 if 'selected_name' not in st.session_state:
     st.session_state.selected_name = 'architecture_diagram_DE'
 
+# Live load indicators: request queue plus Bedrock's adaptive concurrency limit
+with st.sidebar.expander("📈 Service metrics"):
+    st.json(st.session_state.agent.service_metrics())
+
+# Saved request profiles; open one to see where its time and memory went
+with st.sidebar.expander("🔥 Request profiles"):
+    profile_runs = st.session_state.agent.recent_profiles(limit=20)
+    if profile_runs:
+        choice = st.selectbox("Profile:", profile_runs, format_func=lambda run: f"{run['created_at'][:19]} {run['name']} ({run['timings'].get('wall_ms')} ms)")
+        saved_report = st.session_state.agent.profiler.load(choice['payload']['profile_id'])
+        if saved_report:
+            show_profile(saved_report)
+    else:
+        st.caption("No profiles yet. Tick \"Profile this request\" or set PROFILE_SAMPLE_PERCENT.")
+
 # Sample prompts section
 st.subheader("📋 Sample Architecture Prompts")
 st.markdown("Click on any sample below to use it as a starting point:")
@@ -83,44 +190,56 @@ with col2:
         value=st.session_state.get('selected_name', 'architecture_diagram_DE'),
         placeholder="my_diagram"
     )
+    output_format = st.radio(
+        "Output format:",
+        ["png", "svg"],
+        horizontal=True,
+        help="SVG renders faster, is smaller and stays sharp when zoomed; PNG can still be produced on demand"
+    )
+    save_files = st.checkbox(
+        "Save files to outputs/",
+        value=False,
+        help="When unchecked, the diagram is returned in memory and nothing is written to disk"
+    )
+    reuse_cached = st.checkbox(
+        "Reuse cached results",
+        value=True,
+        help="Serve code already generated for the same prompt; uncheck to ask Bedrock again"
+    )
+    graph_ir = st.checkbox(
+        "Structured graph mode",
+        value=False,
+        help="Ask Bedrock for a JSON graph of nodes, clusters and edges; the code and Draw.io file are generated from it"
+    )
+    profile_request = st.checkbox(
+        "Profile this request",
+        value=False,
+        help="Record cProfile hotspots and tracemalloc allocation growth for this request"
+    )
+    layout_engine = st.selectbox(
+        "Graphviz layout:",
+        ["auto", "dot", "sfdp"],
+        help="auto uses dot, switching large diagrams without clusters to the faster sfdp engine"
+    )
 
 if st.button("Generate Diagram", type="primary"):
     if prompt:
         with st.spinner("Generating architecture diagram..."):
             try:
                 # Run async function with proper parameters
-                result = run_async(st.session_state.agent.generate_architecture_diagram(prompt, diagram_name))
+                result = run_async(st.session_state.agent.generate_architecture_diagram(prompt, diagram_name, persist=save_files, output_format=output_format,
+                                                                                 fresh=not reuse_cached, graph_ir=graph_ir,
+                                                                                 profile=True if profile_request else None,
+                                                                                 layout=None if layout_engine == "auto" else {"engine": layout_engine}),
+                                   status=st.empty())
                 
                 if result['success']:
+                    st.session_state.last_result = result
+                    st.session_state.last_name = diagram_name
+                    st.session_state.last_png = None
                     st.success("✅ Diagram generated successfully!")
-                    
-                    # Show generated code
-                    with st.expander("Generated Python Code"):
-                        st.code(result['diagram_code'], language='python')
-                    
-                    # Show diagram - get image path from MCP result
-                    diagram_path = result.get('result', {}).get('image_path')
-                    
-                    # Try multiple possible paths
-                    possible_paths = [
-                        diagram_path,
-                        os.path.join("outputs", "diagrams", "generated-diagrams", f"{diagram_name}.png"),
-                        os.path.join("outputs", "diagrams", f"{diagram_name}.png")
-                    ]
-                    
-                    image_found = False
-                    for path in possible_paths:
-                        if path and os.path.exists(path):
-                            st.image(path, caption=f"Architecture Diagram: {diagram_name}")
-                            st.success(f"📁 Diagram saved at: {path}")
-                            image_found = True
-                            break
-                    
-                    if not image_found:
-                        st.warning("Diagram generated but image file not found. Check outputs/diagrams/generated-diagrams/ folder.")
-                        with st.expander("Debug: Result Structure"):
-                            st.json(result)
-                        
+                elif result.get('overloaded') or result.get('timed_out') or result.get('throttled'):
+                    st.warning(f"⏱️ {result.get('message', result.get('error'))}")
                 else:
                     st.error(f"❌ Error: {result.get('message', 'Unknown error')}")
                     if 'error' in result:
@@ -142,6 +261,103 @@ if st.button("Generate Diagram", type="primary"):
     else:
         st.warning("Please enter a description for your architecture.")
 
+# Gallery of recent diagrams: previews come from the thumbnail cache, full-size images load only when opened
+if st.toggle("🖼️ Recent diagrams gallery"):
+    gallery = st.session_state.agent.recent_diagrams(limit=12)
+    if not gallery:
+        st.caption("No saved diagrams yet. Tick \"Save files to outputs/\" to keep them.")
+    gallery_columns = st.columns(4)
+    for i, diagram in enumerate(gallery):
+        with gallery_columns[i % 4]:
+            thumbnail = st.session_state.agent.diagram_thumbnail(diagram)
+            if thumbnail:
+                st.image(thumbnail['bytes'], caption=diagram['name'])
+            else:
+                st.caption(f"{diagram['name']} (no preview)")
+            if st.button("🔍 Open", key=f"gallery_{i}"):
+                st.session_state.gallery_open = diagram
+    opened = st.session_state.get('gallery_open')
+    if opened and os.path.exists(opened['image_path']):
+        st.markdown(f"**{opened['name']}** — {opened['prompt']}")
+        if opened['image_path'].endswith('.svg'):
+            with open(opened['image_path'], 'r', encoding='utf-8') as f:
+                st.image(f.read(), caption=opened['image_path'])
+        else:
+            st.image(opened['image_path'], caption=opened['image_path'])
+        if st.button("Close"):
+            st.session_state.gallery_open = None
+            st.rerun()
+
+# Earlier diagrams are searchable by text and structure; reusing one re-renders its stored code without Bedrock
+with st.expander("🔎 Search previous diagrams"):
+    search_query = st.text_input("Search:", placeholder="diagrams using Kinesis → ECS")
+    if search_query:
+        found = st.session_state.agent.search_diagrams(search_query)
+        if not found['success']:
+            st.error(f"❌ Search failed: {found['error']}")
+        else:
+            st.caption(f"{len(found['results'])} matches in {found['elapsed_ms']} ms")
+            for entry in found['results']:
+                col_match, col_reuse = st.columns([4, 1])
+                with col_match:
+                    edges = ', '.join(f"{source} → {target}" for source, target in entry['edges'])
+                    st.markdown(f"**{entry['name']}** — {entry['prompt']}")
+                    st.caption(f"Services: {', '.join(entry['services']) or 'none detected'}" + (f" · Edges: {edges}" if edges else ""))
+                with col_reuse:
+                    if st.button("♻️ Reuse", key=f"reuse_{entry['code_hash']}"):
+                        with st.spinner("Re-rendering stored diagram..."):
+                            reused = run_async(st.session_state.agent.reuse_indexed_diagram(entry['code_hash'], entry['name'], persist=save_files,
+                                                                                            output_format=output_format), status=st.empty())
+                        if reused['success']:
+                            st.session_state.last_result = reused
+                            st.session_state.last_name = entry['name']
+                            st.session_state.last_png = None
+                        else:
+                            st.error(f"❌ Error: {reused.get('message', reused.get('error', 'Unknown error'))}")
+
+# Hand edits made in draw.io come back as code, so the next regeneration or edit starts from them
+with st.expander("📥 Import an edited .drawio file"):
+    uploaded_drawio = st.file_uploader("Draw.io file", type=["drawio", "xml"])
+    if uploaded_drawio is not None and st.button("Import and re-render"):
+        import_name = os.path.splitext(uploaded_drawio.name)[0]
+        with st.spinner("Importing diagram..."):
+            imported = run_async(st.session_state.agent.import_drawio_diagram(uploaded_drawio, import_name, persist=save_files,
+                                                                              output_format=output_format), status=st.empty())
+        if imported['success']:
+            st.session_state.last_result = imported
+            st.session_state.last_name = import_name
+            st.session_state.last_png = None
+            st.success(f"✅ {imported['message']}")
+            if imported.get('unmapped_shapes'):
+                st.info(f"Shapes drawn as generic servers: {', '.join(imported['unmapped_shapes'])}")
+        else:
+            st.error(f"❌ Error: {imported.get('message', imported.get('error', 'Unknown error'))}")
+
+# Show the latest diagram; kept in session state so on-demand actions survive reruns
+if st.session_state.get('last_result'):
+    show_diagram_result(st.session_state.last_result, st.session_state.last_name)
+    if st.session_state.last_result.get('profile'):
+        with st.expander("🔥 Profile hotspots for this request"):
+            show_profile(st.session_state.last_result['profile'])
+    
+    # Incremental edits send only the change and reuse the existing layout
+    st.subheader("✏️ Edit this diagram")
+    change_request = st.text_input("Describe a change:", placeholder="Add an SQS queue between Lambda and DynamoDB")
+    if st.button("Apply Edit") and change_request:
+        last_result = st.session_state.last_result
+        previous_positions = (last_result.get('result', {}).get('drawio_result') or {}).get('positions')
+        with st.spinner("Applying edit..."):
+            edited = run_async(st.session_state.agent.edit_architecture_diagram(
+                last_result['diagram_code'], change_request, st.session_state.last_name,
+                previous_positions=previous_positions, persist=save_files, output_format=output_format
+            ), status=st.empty())
+        if edited['success']:
+            st.session_state.last_result = edited
+            st.session_state.last_png = None
+            st.rerun()
+        else:
+            st.error(f"❌ Error: {edited.get('message', edited.get('error', 'Unknown error'))}")
+
 # Footer
 st.markdown("---")
 st.markdown("**Architecture Flow:** Natural Language → AWS Bedrock → Python Code → Docker MCP Server → PNG Diagram")
\ No newline at end of file